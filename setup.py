@@ -19,6 +19,7 @@ setup(name='simpleais',
       package_data={'simpleais': ['aivdm.json']},
       entry_points={
           'console_scripts': [
+              'ais = simpleais.cli:ais',
               'aiscat = simpleais.tools:cat',
               'aisgrep = simpleais.tools:grep',
               'aist = simpleais.tools:as_text',
@@ -28,6 +29,9 @@ setup(name='simpleais',
               'aisstat = simpleais.tools:stat',
               'aisrefine = simpleais.tools:refine',
               'ais2json = simpleais.tools:to_json',
+              'ais2csv = simpleais.tools:to_csv',
+              'aisgen = simpleais.tools:generate',
+              'aisreplay = simpleais.tools:replay',
           ],
       },
       )
@@ -1,12 +1,11 @@
-import calendar
 import collections
-import gzip
-import json
-import logging
+import marshal
+import math
 import os
 import re
+import struct
+import sys
 import time
-from functools import reduce
 from io import TextIOBase
 
 aivdm_pattern = re.compile(r'([.0-9]+)?\s*(![A-Z]{5},\d,\d,.?,[AB12]?,[^,]+,[0-6]\*[0-9A-F]{2})')
@@ -15,6 +14,13 @@ aivdm_pattern = re.compile(r'([.0-9]+)?\s*(![A-Z]{5},\d,\d,.?,[AB12]?,[^,]+,[0-6
 # Allows users to stop a Python script with CTRL-C.
 source_timeout = 10
 
+
+def _logger():
+    # logging is slow to import and only needed once something goes wrong
+    import logging
+    return logging.getLogger()
+
+
 class Bits:
     """
     Integer implementation of bits.
@@ -133,7 +139,7 @@ class StreamParser:
                 self.sentence_buffer.append(sentence)
         else:
             if self.log_errors:
-                logging.getLogger().warning("skipped: \"{}\"".format(message_text.strip()))
+                _logger().warning("skipped: \"{}\"".format(message_text.strip()))
 
     def next_sentence(self):
         return self.sentence_buffer.popleft()
@@ -166,8 +172,9 @@ def parse_one(string, default_to_current_time=False):
     if not m:
         return None
 
-    if m.group(1):
-        sentence_time = float(m.group(1))
+    time_text = m.group(1)
+    if time_text:
+        sentence_time = float(time_text)
     else:
         if default_to_current_time:
             sentence_time = time.time()
@@ -184,12 +191,12 @@ def parse_one(string, default_to_current_time=False):
     radio_channel = fields[4]
     payload = NmeaPayload(fields[5], int(fields[6]))
     if fragment_count == 1:
-        return Sentence(talker, sentence_type, radio_channel, payload, [checksum], sentence_time, [message])
+        return Sentence(talker, sentence_type, radio_channel, payload, [checksum], sentence_time, [message], time_text)
     else:
         fragment_number = int(fields[2])
         message_id = fields[3]
         return SentenceFragment(talker, sentence_type, fragment_count, fragment_number,
-                                message_id, radio_channel, payload, checksum, sentence_time, message)
+                                message_id, radio_channel, payload, checksum, sentence_time, message, time_text)
 
 
 def parse(message):
@@ -432,6 +439,7 @@ class BitFieldDecoder(FieldDecoder):
         self.length = 1 + end - start
         self.bit_range = slice(start, end + 1)
         self.description = description
+        self.data_type = data_type
         self._nmea_decode = self._appropriate_nmea_decoder(data_type, name)
         self.short_bits_ok = data_type in ['s', 't', 'd']  # if we get partial text or data, that's better than nothing
 
@@ -527,7 +535,12 @@ class BitFieldDecoder(FieldDecoder):
             return result
 
     def _parse_text(self, payload):
-        return payload.text_for_bit_range(self.start, self.end + 1)
+        stop = self.end + 1
+        if self.start == self.end:
+            # the tables give variable-length text, as in safety messages, one
+            # bit; it runs to the last whole character of the payload
+            stop = self.start + (payload.bit_length() - self.start) // 6 * 6
+        return payload.text_for_bit_range(self.start, stop)
 
 
 class TimeFieldDecoder(FieldDecoder):
@@ -536,6 +549,7 @@ class TimeFieldDecoder(FieldDecoder):
 
     def decode(self, sentence):
         if self.we_have_the_fields(sentence) and self.the_fields_are_ok(sentence):
+            import calendar
             return calendar.timegm((sentence['year'], sentence['month'],
                                     sentence['day'], sentence['hour'],
                                     sentence['minute'], sentence['second']))
@@ -565,10 +579,28 @@ class TimeFieldDecoder(FieldDecoder):
         return sentence.field('year')
 
 
+_FIELD_BITS = {}
+
+
+def field_mask(names):
+    """
+    Returns a bitmask standing for the named fields, to ask a sentence or
+    message decoder which of them it has with present_fields().
+    """
+    mask = 0
+    for name in names:
+        bit = _FIELD_BITS.get(name)
+        if bit is None:
+            bit = _FIELD_BITS[name] = 1 << len(_FIELD_BITS)
+        mask |= bit
+    return mask
+
+
 class MessageDecoder:
     def __init__(self, message_info):
         self.field_decoders = []
         self.field_decoders_by_id = collections.OrderedDict()
+        self.presence = 0
         for field in message_info['fields']:
             decoder = BitFieldDecoder(field['member'], field['start'], field['end'], field['type'],
                                       field['description'])
@@ -577,13 +609,19 @@ class MessageDecoder:
     def add_field_decoder(self, name, decoder):
         self.field_decoders.append(decoder)
         self.field_decoders_by_id[name] = decoder
+        self.presence |= field_mask((name,))
+
+    def present_fields(self, mask):
+        """Returns the part of a field_mask() for the fields this message type has."""
+        return self.presence & mask
 
     def bit_range(self, name):
         return self.field_decoders_by_id[name].bit_range
 
     def decode(self, name, sentence):
-        if name in self.field_decoders_by_id:
-            return self.field_decoders_by_id[name].decode(sentence)
+        decoder = self.field_decoders_by_id.get(name)
+        if decoder is not None:
+            return decoder.decode(sentence)
 
     def __contains__(self, name):
         return name in self.field_decoders_by_id
@@ -629,22 +667,122 @@ def as_enums(json_dict):
     return result
 
 
-def _load_decoders(source_file):
-    loaded_json = json.loads(open(os.path.join(os.path.dirname(__file__), source_file)).read())
-    message_type_json = loaded_json['messages']
-    message_result = {}
-    for message_type_id in range(1, 28):
-        message_result[message_type_id] = MessageDecoder(message_type_json[str(message_type_id)])
+def _load_tables(path):
+    """
+    Returns the protocol tables in the JSON file at path. They're read from a
+    marshalled copy in __pycache__ beside it, which is much quicker to load,
+    and rewritten whenever the JSON changes; as with bytecode, the copy isn't
+    written when Python has been told not to.
+    """
+    stat = os.stat(path)
+    key = [stat.st_size, stat.st_mtime_ns]
+    cache_path = None
+    if sys.implementation.cache_tag:
+        cache_path = os.path.join(os.path.dirname(path), '__pycache__',
+                                  '{}.{}.marshal'.format(os.path.basename(path), sys.implementation.cache_tag))
+        try:
+            with open(cache_path, 'rb') as f:
+                cached_key, tables = marshal.load(f)
+            if cached_key == key:
+                return tables
+        except (OSError, EOFError, ValueError, TypeError):
+            pass
+
+    import json
+    with open(path) as f:
+        tables = json.load(f)
+    if cache_path and not sys.dont_write_bytecode:
+        temp_path = "{}.{}".format(cache_path, os.getpid())
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            with open(temp_path, 'wb') as f:
+                marshal.dump((key, tables), f)
+            os.replace(temp_path, cache_path)
+        except OSError:
+            pass
+    return tables
+
+
+_tables = None
+
+
+def _protocol_tables():
+    global _tables
+    if _tables is None:
+        _tables = _load_tables(os.path.join(os.path.dirname(__file__), 'aivdm.json'))
+    return _tables
+
+
+class _LazyTable(dict):
+    """
+    A dict with a fixed set of keys whose values are made by build(key) the
+    first time they're asked for, so that importing simpleais doesn't build
+    decoders for every message type when a tool only sees a few of them.
+    Asking for all of the values, or iterating, builds the rest.
+    """
+
+    def __init__(self, keys, build):
+        super().__init__()
+        self.known_keys = tuple(keys)
+        self.known = frozenset(self.known_keys)
+        self.build = build
+
+    def __missing__(self, key):
+        if key not in self.known:
+            raise KeyError(key)
+        value = self[key] = self.build(key)
+        return value
+
+    def __contains__(self, key):
+        return key in self.known
+
+    def get(self, key, default=None):
+        return self[key] if key in self.known else default
+
+    def _build_all(self):
+        for key in self.known_keys:
+            if not dict.__contains__(self, key):
+                self[key] = self.build(key)
+
+    def __iter__(self):
+        return iter(self.known_keys)
+
+    def __len__(self):
+        return len(self.known_keys)
 
-    # add derived fields
-    message_result[4].add_field_decoder('time', TimeFieldDecoder())
+    def keys(self):
+        self._build_all()
+        return super().keys()
 
-    enum_result = {'shiptype': as_enums(loaded_json['lookups']['ship_type']),
-                   'status': as_enums(loaded_json['lookups']['navigation_status'])}
-    return message_result, enum_result
+    def values(self):
+        self._build_all()
+        return super().values()
 
+    def items(self):
+        self._build_all()
+        return super().items()
 
-MESSAGE_DECODERS, ENUM_LOOKUPS = _load_decoders('aivdm.json')
+
+# fields worked out from others rather than read from the table, by type
+_DERIVED_FIELDS = {4: (('time', TimeFieldDecoder),)}
+
+
+def _build_message_decoder(type_id):
+    result = MessageDecoder(_protocol_tables()['messages'][str(type_id)])
+    for name, decoder_class in _DERIVED_FIELDS.get(type_id, ()):
+        result.add_field_decoder(name, decoder_class())
+    return result
+
+
+_ENUM_TABLES = {'shiptype': 'ship_type', 'status': 'navigation_status'}
+
+
+def _build_enum_lookup(name):
+    return as_enums(_protocol_tables()['lookups'][_ENUM_TABLES[name]])
+
+
+MESSAGE_DECODERS = _LazyTable(range(1, 28), _build_message_decoder)
+ENUM_LOOKUPS = _LazyTable(_ENUM_TABLES, _build_enum_lookup)
 
 BACKUP_DECODER = MessageDecoder({
     "name": "Unknown message",
@@ -683,15 +821,30 @@ BACKUP_DECODER = MessageDecoder({
 
 
 def _decoder_for_type(number):
-    if number in MESSAGE_DECODERS:
-        return MESSAGE_DECODERS[number]
-    else:
-        return BACKUP_DECODER
+    return MESSAGE_DECODERS.get(number, BACKUP_DECODER)
+
+
+_field_names = None
+
+
+def field_names():
+    """
+    Returns the names of every message type's fields, as a frozenset. They're
+    read from the protocol tables, without building the decoders.
+    """
+    global _field_names
+    if _field_names is None:
+        names = set(BACKUP_DECODER.field_decoders_by_id)
+        for type_id in MESSAGE_DECODERS:
+            names.update(field['member'] for field in _protocol_tables()['messages'][str(type_id)]['fields'])
+            names.update(name for name, _ in _DERIVED_FIELDS.get(type_id, ()))
+        _field_names = frozenset(names)
+    return _field_names
 
 
 class SentenceFragment:
     def __init__(self, talker, sentence_type, total_fragments, fragment_number, message_id, radio_channel, payload,
-                 checksum, received_time=None, text=None):
+                 checksum, received_time=None, text=None, time_text=None):
         self.talker = talker
         self.sentence_type = sentence_type
         self.total_fragments = total_fragments
@@ -702,6 +855,7 @@ class SentenceFragment:
         self.checksum = checksum
         self.time = received_time
         self.text = text
+        self.time_text = time_text
 
     def initial(self):
         return self.fragment_number == 1
@@ -738,7 +892,7 @@ class Field(object):
         return self.decoder.description
 
     def value(self):
-        return self.decoder.decode(self.sentence)
+        return self.sentence[self.decoder.name]
 
     def bits(self):
         return self.decoder.bits(self.sentence)
@@ -747,8 +901,12 @@ class Field(object):
         return self.decoder.valid(self.sentence)
 
 
+_UNDECODED = object()
+
+
 class Sentence:
-    def __init__(self, talker, sentence_type, radio_channel, payload, checksums, received_time=None, text=None):
+    def __init__(self, talker, sentence_type, radio_channel, payload, checksums, received_time=None, text=None,
+                 time_text=None):
         self.talker = talker
         self.sentence_type = sentence_type
         self.radio_channel = radio_channel
@@ -756,17 +914,20 @@ class Sentence:
         self.checksums = checksums
         self.time = received_time
         self.text = text
+        self.time_text = time_text  # the receive time as it was written, if it was read from text
         self.type_num = _int_lookup[payload.data[0].ascii[0]]
         self._decoder = _decoder_for_type(self.type_num)
+        self._values = {}  # field values by name, decoded as they're asked for
 
     def type_id(self):
         return self.type_num
 
     def check(self):
-        checks = self.fragment_checksum_validity()
-        return reduce(lambda a, b: a and b, checks)
+        return all(self.fragment_checksum_validity())
 
     def fragment_checksum_validity(self):
+        if not self.text:
+            raise ValueError("no text to check in {!r}; was it unpacked without keep_text?".format(self))
         return [nmea_checksum(t) == int(c, 16) for t, c in (zip(self.text, self.checksums))]
 
     def location(self):
@@ -779,10 +940,31 @@ class Sentence:
         return self.payload.bits
 
     def __getitem__(self, item):
-        return self._decoder.decode(item, self)
+        value = self._values.get(item, _UNDECODED)
+        if value is _UNDECODED:
+            value = self._values[item] = self._decoder.decode(item, self)
+        return value
 
     def __contains__(self, item):
-        return item in self._decoder and self.__getitem__(item) is not None
+        return self[item] is not None
+
+    def present_fields(self, mask):
+        """
+        Returns the part of a field_mask() for the fields this sentence's type
+        has: equal to mask if it has them all, 0 if it has none.
+        """
+        return self._decoder.presence & mask
+
+    def decode_all(self):
+        """Decodes every field now rather than as each is asked for, and returns them in order by name."""
+        values = self._values
+        result = collections.OrderedDict()
+        for name, decoder in self._decoder.field_decoders_by_id.items():
+            value = values.get(name, _UNDECODED)
+            if value is _UNDECODED:
+                value = values[name] = decoder.decode(self)
+            result[name] = value
+        return result
 
     def field(self, key):
         return Field(self._decoder.field(key), self)
@@ -797,7 +979,7 @@ class Sentence:
         checksums = [f.checksum for f in matching_fragments]
         return Sentence(first.talker, first.sentence_type, first.radio_channel,
                         NmeaPayload.join([f.payload for f in matching_fragments]),
-                        checksums, first.time, text)
+                        checksums, first.time, text, first.time_text)
 
     def __repr__(self):
         return "Sentence({}, {})".format(self.time, self.text)
@@ -813,20 +995,188 @@ class Sentence:
                 d[k] = {'enum_id': enum.key, 'enum_value': enum.value}
             elif isinstance(d[k], Bits):
                 d[k] = str(d[k])
+        import json
         return json.dumps(d)
 
     def as_dict(self):
         result = collections.OrderedDict()
         if self.time:
             result['received_at'] = self.time
-        for field in self.fields():
-            result[field.name()] = field.value()
+        result.update(self.decode_all())
         result['text'] = self.text
         return result
 
     def __iter__(self):
         return iter(self.as_dict())
 
+    def pack(self, keep_text=False):
+        """
+        Returns the sentence as compact bytes: receive time as a number and,
+        if it was read from text, as written, talker, channel, and the raw
+        payload with its fill bits, plus the original text and checksums if
+        keep_text is set. unpack_sentence() turns them back into a Sentence;
+        without the text, that sentence's check() raises ValueError.
+        """
+        text = self.text if keep_text else None
+        flags = 0
+        if self.time_text is not None:
+            flags |= _PACKED_WITH_TIME_TEXT
+        if text is not None:
+            flags |= _PACKED_WITH_TEXT
+            if isinstance(text, str):
+                flags |= _PACKED_TEXT_IS_STR
+                text = [text]
+        lumps = self.payload.data
+        parts = [_PACKED_HEADER.pack(math.nan if self.time is None else self.time, flags,
+                                     self.talker.encode('ascii'), self.sentence_type.encode('ascii'),
+                                     self.radio_channel.encode('ascii'), len(lumps))]
+        for lump in lumps:
+            parts.append(_PACKED_PART.pack(lump.fill, len(lump.ascii)))
+            parts.append(lump.ascii.encode('ascii'))
+        if text is not None:
+            for strings in text, self.checksums:
+                parts.append(_PACKED_COUNT.pack(len(strings)))
+                for string in strings:
+                    encoded = string.encode('ascii')
+                    parts.append(_PACKED_COUNT.pack(len(encoded)))
+                    parts.append(encoded)
+        if self.time_text is not None:
+            encoded = self.time_text.encode('ascii')
+            parts.append(_PACKED_COUNT.pack(len(encoded)))
+            parts.append(encoded)
+        return b''.join(parts)
+
+    def __reduce__(self):
+        return unpack_sentence, (self.pack(keep_text=True),)
+
+
+class FieldAccessor:
+    """
+    Gets one field from sentences, like sentence[name] but quicker. The first
+    time it sees a message type it looks up the type's decoder for the field
+    and keeps it in a slot indexed by type number, so for types without the
+    field it returns None without any dict lookups at all, and for the rest
+    goes straight to the sentence's decoded values.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.slots = [_UNDECODED] * 64  # the type comes from one payload character
+
+    def __call__(self, sentence):
+        decoder = self.slots[sentence.type_num]
+        if decoder is None:
+            return None
+        if decoder is _UNDECODED:
+            decoder = self.slots[sentence.type_num] = sentence._decoder.field_decoders_by_id.get(self.name)
+            if decoder is None:
+                return None
+        values = sentence._values
+        value = values.get(self.name, _UNDECODED)
+        if value is _UNDECODED:
+            value = values[self.name] = decoder.decode(sentence)
+        return value
+
+    def __repr__(self):
+        return "FieldAccessor({!r})".format(self.name)
+
+
+# time, flags, talker, sentence type, radio channel, payload part count
+_PACKED_HEADER = struct.Struct('<dB2s3s1sB')
+# fill bits, payload characters
+_PACKED_PART = struct.Struct('<BH')
+_PACKED_COUNT = struct.Struct('<H')
+_PACKED_LENGTH = struct.Struct('<I')
+_PACKED_WITH_TEXT = 1
+_PACKED_TEXT_IS_STR = 2
+_PACKED_WITH_TIME_TEXT = 4
+_packed_names = {}
+
+
+def unpack_sentence(data, offset=0):
+    """Rebuilds a Sentence from Sentence.pack() bytes, optionally starting at offset."""
+    received_time, flags, talker, sentence_type, radio_channel, part_count = \
+        _PACKED_HEADER.unpack_from(data, offset)
+    offset += _PACKED_HEADER.size
+    names = _packed_names.get((talker, sentence_type, radio_channel))
+    if names is None:
+        names = _packed_names[(talker, sentence_type, radio_channel)] = \
+            talker.decode('ascii'), sentence_type.decode('ascii'), radio_channel.rstrip(b'\0').decode('ascii')
+    lumps = []
+    for _ in range(part_count):
+        fill, length = _PACKED_PART.unpack_from(data, offset)
+        offset += _PACKED_PART.size
+        lumps.append(NmeaLump(data[offset:offset + length].decode('ascii'), fill))
+        offset += length
+    text = None
+    checksums = []
+    if flags & _PACKED_WITH_TEXT:
+        lists = []
+        for _ in range(2):
+            count, = _PACKED_COUNT.unpack_from(data, offset)
+            offset += _PACKED_COUNT.size
+            strings = []
+            for _ in range(count):
+                length, = _PACKED_COUNT.unpack_from(data, offset)
+                offset += _PACKED_COUNT.size
+                strings.append(data[offset:offset + length].decode('ascii'))
+                offset += length
+            lists.append(strings)
+        text, checksums = lists
+        if flags & _PACKED_TEXT_IS_STR:
+            text = text[0]
+    time_text = None
+    if flags & _PACKED_WITH_TIME_TEXT:
+        length, = _PACKED_COUNT.unpack_from(data, offset)
+        offset += _PACKED_COUNT.size
+        time_text = data[offset:offset + length].decode('ascii')
+    return Sentence(names[0], names[1], names[2], NmeaPayload(lumps), checksums,
+                    None if received_time != received_time else received_time, text, time_text)
+
+
+def pack_sentences(sentences, keep_text=False):
+    """Packs many sentences into one bytes object, for sending between processes in a single message."""
+    parts = []
+    for sentence in sentences:
+        packed = sentence.pack(keep_text)
+        parts.append(_PACKED_LENGTH.pack(len(packed)))
+        parts.append(packed)
+    return b''.join(parts)
+
+
+def unpack_sentences(data):
+    """Yields the sentences from pack_sentences() bytes, each rebuilt only when it's reached."""
+    offset = 0
+    end = len(data)
+    while offset < end:
+        length, = _PACKED_LENGTH.unpack_from(data, offset)
+        offset += _PACKED_LENGTH.size
+        yield unpack_sentence(data, offset)
+        offset += length
+
+
+def _time_prefix(sentence):
+    # the time as it was read is reused if formatting it would give the same
+    # text: three decimals, no leading zeros, and few enough digits that a
+    # float holds them exactly
+    text = sentence.time_text
+    if text and 4 <= len(text) <= 16 and text[-4] == '.' and text[0] != '.' and (text[0] != '0' or text[1] == '.'):
+        return text + ' '
+    return "{:.3f} ".format(sentence.time)
+
+
+def sentence_source_text(sentence):
+    """Returns the sentence's lines as aiscat prints them, after the receive time if known, with newlines."""
+    text = sentence.text
+    if isinstance(text, str):
+        text = [text]
+    if sentence.time:
+        prefix = _time_prefix(sentence)
+        if len(text) == 1:
+            return prefix + text[0] + "\n"
+        return "".join([prefix + line + "\n" for line in text])
+    return "".join([line + "\n" for line in text])
+
 
 class SentenceIterator:
     def __init__(self, sentence):
@@ -902,9 +1252,9 @@ def fragments_from_source(source, log_errors=False):
             if m:
                 yield m.group(0)
             elif log_errors:
-                logging.getLogger().warning("skipped: \"{}\"".format(line.strip()))
+                _logger().warning("skipped: \"{}\"".format(line.strip()))
         except Exception:
-            logging.getLogger().error("unexpected failure for line {} in source {}".format(line, source), exc_info=True)
+            _logger().error("unexpected failure for line {} in source {}".format(line, source), exc_info=True)
 
 
 def sentences_from_source(source, log_errors=False):
@@ -916,8 +1266,8 @@ def sentences_from_source(source, log_errors=False):
             if parser.has_sentence():
                 yield parser.next_sentence()
         except Exception:
-            logging.getLogger().error("unexpected failure for fragment {} in source {}".format(fragment, source),
-                                      exc_info=True)
+            _logger().error("unexpected failure for fragment {} in source {}".format(fragment, source),
+                            exc_info=True)
 
 
 # noinspection PyBroadException
@@ -933,9 +1283,9 @@ def _handle_serial_source(source):
                     try:
                         yield raw_line.decode('ascii')
                     except Exception:
-                        logging.getLogger().warn("Failure for input: \"{}\"".format(raw_line.strip()), exc_info=True)
+                        _logger().warn("Failure for input: \"{}\"".format(raw_line.strip()), exc_info=True)
         except Exception:
-            logging.getLogger().error("unexpected failure", exc_info=True)
+            _logger().error("unexpected failure", exc_info=True)
             time.sleep(1)
 
 
@@ -950,12 +1300,13 @@ def _handle_url_source(source):
                 for line in f:
                     yield line.decode('utf-8')
         except Exception:
-            logging.getLogger().error("unexpected failure in source {}".format(source), exc_info=True)
+            _logger().error("unexpected failure in source {}".format(source), exc_info=True)
             time.sleep(1)
 
 
 def _handle_file_source(source):
     if source.endswith('.gz'):
+        import gzip
         source_reader = gzip.open(source, mode='rt')
     else:
         source_reader = open(source)
@@ -995,7 +1346,7 @@ def _handle_udp_source(source):
                         # timeout gives the user a chance to CTRL-C even without AIS traffic
                         pass
         except Exception:
-            logging.getLogger().error("unexpected failure in source {}".format(source), exc_info=True)
+            _logger().error("unexpected failure in source {}".format(source), exc_info=True)
             time.sleep(1)
 
 
@@ -1028,5 +1379,5 @@ def _handle_tcp_client_source(source):
                         pass
         except Exception:
             print("error")
-            logging.getLogger().error("unexpected failure in source {}".format(source), exc_info=True)
+            _logger().error("unexpected failure in source {}".format(source), exc_info=True)
             time.sleep(1)
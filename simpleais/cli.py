@@ -0,0 +1,167 @@
+"""
+The ais command, which runs any of the tools as a subcommand:
+
+    ais grep -t 5 feed.ais
+    ais info --map feed.ais
+
+A subcommand's code is only imported when it runs, so `ais grep` starts as
+quickly as aisgrep does; the older aisgrep, aist, and so on remain as
+aliases.
+
+Subcommands that read and write sentences can also be chained, separated by
+a + (or a quoted |), so that sentences pass between them in one process
+rather than as text through a shell pipe:
+
+    ais read feed.ais + grep -t 1 -t 2 -t 3 + refine + json -f mmsi,lon,lat
+
+The first command reads the sources; read just passes its sentences along.
+Every command but the last must be a filter (read, grep, or refine); the
+last can also be one that prints (cat, text, json, or csv), and if it isn't,
+the sentences that reach the end are printed as cat would. To capture them
+to files, end with cat --capture; read refuses cat's capture options.
+"""
+
+import importlib
+
+import click
+from click.core import ParameterSource
+
+COMMANDS = {
+    'burst': 'simpleais.tools:burst',
+    'cat': 'simpleais.tools:cat',
+    'csv': 'simpleais.tools:to_csv',
+    'dump': 'simpleais.tools:dump',
+    'gen': 'simpleais.tools:generate',
+    'grep': 'simpleais.tools:grep',
+    'info': 'simpleais.tools:info',
+    'json': 'simpleais.tools:to_json',
+    'read': 'simpleais.tools:cat',
+    'refine': 'simpleais.tools:refine',
+    'replay': 'simpleais.tools:replay',
+    'stat': 'simpleais.tools:stat',
+    'text': 'simpleais.tools:as_text',
+}
+
+# for chains: what each command does to a stream of sentences, and whether it
+# passes them on (a filter) or prints them (a sink); read passes them as is
+FILTERS = {
+    'read': None,
+    'grep': 'simpleais.tools:grep_sentences',
+    'refine': 'simpleais.tools:refine_sentences',
+}
+# options of filters that only mean something when they print, as cat does
+# with read's; they're refused rather than silently dropped
+PRINTING_OPTIONS = {
+    'read': ('capture_directory', 'rotate', 'max_size', 'compress'),
+}
+SINKS = {
+    'cat': 'simpleais.tools:cat_sentences',
+    'text': 'simpleais.tools:print_texts',
+    'json': 'simpleais.tools:write_json',
+    'csv': 'simpleais.tools:write_delimited',
+}
+# sinks that print through an OutputSink, and so take a flush interval;
+# --flush-interval given to any command in a chain applies to them
+PRINTERS = ('cat', 'text')
+# filters that hold sentences back to work on them in batches; on a live feed
+# they pass on a batch once it has waited the flush interval
+BATCHERS = ('refine',)
+SEPARATORS = ('+', '|')
+CHAIN_COMMAND = 'chain'
+
+
+def _load(target):
+    module_name, name = target.split(':')
+    return getattr(importlib.import_module(module_name), name)
+
+
+class LazyGroup(click.Group):
+    """A click group whose commands are given as 'module:name' and imported only when needed."""
+
+    def __init__(self, *args, lazy_commands=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lazy_commands = dict(lazy_commands or {})
+
+    def list_commands(self, ctx):
+        return sorted(set(super().list_commands(ctx)) | set(self.lazy_commands))
+
+    def get_command(self, ctx, name):
+        if name in self.lazy_commands:
+            return _load(self.lazy_commands[name])
+        return super().get_command(ctx, name)
+
+    def parse_args(self, ctx, args):
+        if any(arg in SEPARATORS for arg in args) and args[0] != CHAIN_COMMAND:
+            args = [CHAIN_COMMAND] + list(args)
+        return super().parse_args(ctx, args)
+
+
+def split_chain(args):
+    """Splits a chain's arguments at the separators into one list per command, name first."""
+    result = [[]]
+    for arg in args:
+        if arg in SEPARATORS:
+            result.append([])
+        else:
+            result[-1].append(arg)
+    if not all(result):
+        raise click.UsageError("every command in a chain needs a name; check for a doubled or trailing separator")
+    return result
+
+
+@click.group(cls=LazyGroup, lazy_commands=COMMANDS)
+def ais():
+    """ Tools for AIS sentences; run `ais COMMAND --help` for each one. """
+
+
+@ais.command(CHAIN_COMMAND, context_settings=dict(ignore_unknown_options=True))
+@click.argument('args', nargs=-1, type=click.UNPROCESSED)
+@click.pass_context
+def chain(ctx, args):
+    """ Runs commands separated by + with sentences passed between them.
+
+    For example, `ais chain read feed.ais + grep -t 5 + csv -f mmsi,shipname`;
+    the word chain can be left out. Only the first command takes sources.
+    """
+    from simpleais.tools import choose_flush_interval, print_sentences, sentences_from_sources
+
+    stages = split_chain(args)
+    sentences = None
+    first_sources = ()
+    flush_interval = None
+    last = len(stages) - 1
+    for position, (name, *stage_args) in enumerate(stages):
+        if name not in FILTERS and name not in SINKS:
+            raise click.UsageError("{} can't be chained; try {}".format(
+                name, ", ".join(sorted(set(FILTERS) | set(SINKS)))))
+        if name in SINKS and position != last:
+            raise click.UsageError("{} prints sentences, so it can only come last".format(name))
+        command = ctx.parent.command.get_command(ctx.parent, name)
+        with command.make_context(name, stage_args, parent=ctx) as stage_ctx:
+            params = dict(stage_ctx.params)
+            given = {n for n in params if stage_ctx.get_parameter_source(n) != ParameterSource.DEFAULT}
+        if given.intersection(PRINTING_OPTIONS.get(name, ())):
+            raise click.UsageError("{} passes sentences on in a chain, so it can't capture them; "
+                                   "end the chain with cat --capture instead".format(name))
+        sources = params.pop('sources', ())
+        verbose = params.pop('verbose', False)
+        if params.pop('jobs', 1) > 1:
+            raise click.UsageError("--jobs can't be used in a chain")
+        given_interval = params.pop('flush_interval', None)
+        if given_interval is not None:
+            flush_interval = given_interval
+        if position == 0:
+            first_sources = sources
+            sentences = sentences_from_sources(sources, log_errors=verbose)
+        elif sources:
+            raise click.UsageError("only the first command in a chain reads sources, not {}".format(name))
+        if name in PRINTERS:
+            params['flush_interval'] = choose_flush_interval(flush_interval, first_sources)
+        elif name in BATCHERS:
+            params['max_wait'] = choose_flush_interval(flush_interval, first_sources)
+
+        target = FILTERS.get(name) or SINKS.get(name)
+        if target is not None:
+            sentences = _load(target)(sentences, **params)
+    if stages[-1][0] in FILTERS:
+        print_sentences(sentences, flush_interval=choose_flush_interval(flush_interval, first_sources))
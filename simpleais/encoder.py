@@ -0,0 +1,290 @@
+"""
+Builds NMEA sentences from field values; the inverse of MessageDecoder.
+
+Encoders are generated from the same aivdm.json layouts the decoders use, so
+any field you can read with sentence['name'] can be written with
+encode(type_id, {'name': value}). Values use the decoded representation:
+longitudes in degrees, speeds in knots, MMSIs as strings or ints, enums as
+AisEnums or ints. Fields that aren't given default to the protocol's "not
+available" value where there is one, and to zero otherwise.
+
+Decoded longitudes and latitudes are rounded to four places, so decoding and
+re-encoding a position can move it by up to 0.00005 degrees. To change some
+fields of an existing sentence without touching the rest, use rewrite(),
+which edits the payload bits in place.
+"""
+
+import base64
+
+from simpleais import MESSAGE_DECODERS, Bits, NmeaPayload, NmeaLump, Sentence, nmea_checksum
+
+MAX_FRAGMENT_CHARS = 60
+
+# raw values the protocol defines as "not available"
+NOT_AVAILABLE = {
+    'lon': 181 * 600000,
+    'lat': 91 * 600000,
+    'speed': 1023,
+    'course': 3600,
+    'heading': 511,
+    'second': 60,
+    'turn': -128,
+    'hour': 24,
+    'minute': 60,
+}
+NOT_AVAILABLE_COARSE = {
+    'lon': 181 * 600,
+    'lat': 91 * 600,
+}
+
+# Type 24 uses the same bits for different fields depending on the part number.
+PART_FIELDS = {
+    24: {
+        0: {'shipname', 'ignored-160'},
+        1: {'shiptype', 'vendorid', 'model', 'serial', 'callsign', 'to_bow', 'to_stern', 'to_port', 'to_starboard',
+            'mothership_mmsi', 'ignored-162'},
+    },
+}
+
+# Armoring maps each 6-bit value to one character. Base64 does the same with a
+# different alphabet, so translating to and from base64 lets the C
+# implementations in the standard library do the bit shuffling.
+_BASE64_ALPHABET = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/'
+_ARMOR_ALPHABET = "".join(chr(n + 48 if n < 40 else n + 56) for n in range(64))
+_TO_ARMOR = str.maketrans(_BASE64_ALPHABET, _ARMOR_ALPHABET)
+_FROM_ARMOR = str.maketrans(_ARMOR_ALPHABET, _BASE64_ALPHABET)
+
+
+def armor(value, bit_length):
+    """Turns the low bit_length bits of value into payload characters and fill bits."""
+    fill = -bit_length % 6
+    chars = (bit_length + fill) // 6
+    pad = -chars % 4
+    value = value << (fill + 6 * pad)
+    raw = value.to_bytes((chars + pad) * 3 // 4, 'big')
+    return base64.b64encode(raw).decode('ascii').translate(_TO_ARMOR)[:chars], fill
+
+
+def unarmor(payload, fill=0):
+    """Turns payload characters into an (int value, bit length) pair."""
+    pad = -len(payload) % 4
+    raw = base64.b64decode(payload.translate(_FROM_ARMOR) + 'A' * pad)
+    return int.from_bytes(raw, 'big') >> (6 * pad + fill), 6 * len(payload) - fill
+
+
+def _text_bits(text, width):
+    chars = width // 6
+    result = 0
+    for c in str(text).upper()[:chars].ljust(chars, '@'):
+        o = ord(c)
+        result = result << 6 | ((o - 64) if o >= 64 else o) & 0x3f
+    return result
+
+
+def _enum_int(value):
+    if isinstance(value, str):
+        return int(value.rsplit('-', 1)[-1])
+    return int(value)
+
+
+def _scaled(scale):
+    factor = 60 * 10 ** scale
+    return lambda v: int(round(v * factor))
+
+
+def _raw_converter(data_type, name):
+    if name == 'mmsi' or data_type in ('u', 'x'):
+        return int
+    elif data_type == 'I1':
+        return _scaled(1)
+    elif data_type == 'I3':
+        return _scaled(3)
+    elif data_type == 'I4':
+        return _scaled(4)
+    elif data_type == 'U1':
+        return lambda v: int(round(v * 10))
+    elif data_type == 'e':
+        return _enum_int
+    elif data_type == 'b':
+        return lambda v: 1 if v else 0
+    elif data_type == 'd':
+        return lambda v: int(Bits(v))
+    else:
+        raise ValueError("Sorry, don't know how to encode '{}' for field '{}' yet".format(data_type, name))
+
+
+class FieldEncoder:
+    def __init__(self, field_decoder, variable):
+        self.name = field_decoder.name
+        self.start = field_decoder.start
+        self.end = field_decoder.end
+        self.width = field_decoder.length
+        self.data_type = field_decoder.data_type
+        self.variable = variable
+        self.text = self.data_type in ('t', 's')
+        self.to_raw = None if self.text else _raw_converter(self.data_type, self.name)
+        if self.data_type == 'I1':
+            self.default = NOT_AVAILABLE_COARSE.get(self.name, 0)
+        elif self.name in NOT_AVAILABLE_COARSE and self.data_type != 'I4':
+            self.default = 0
+        else:
+            self.default = NOT_AVAILABLE.get(self.name, 0)
+
+    def width_for(self, value):
+        if not self.variable:
+            return self.width
+        elif self.text:
+            return 6 * len(value)
+        else:
+            return len(Bits(value))
+
+    def raw(self, value, width):
+        if value is None:
+            raw = self.default
+        elif self.text:
+            return _text_bits(value, width)
+        else:
+            raw = self.to_raw(value)
+        return raw & ((1 << width) - 1)
+
+
+class MessageEncoder:
+    """
+    Encodes one message type. The message length is the end of the layout's
+    last fixed-size field; a trailing variable-length text or data field adds
+    as many bits as its value needs.
+    """
+
+    def __init__(self, message_decoder, parts=None):
+        self.parts = parts
+        decoders = [d for d in message_decoder.fields() if hasattr(d, 'start')]
+        last = max(decoders, key=lambda d: d.start)
+        self.field_encoders = []
+        self.field_encoders_by_id = {}
+        for d in decoders:
+            variable = d is last and d.data_type in ('t', 's', 'd')
+            encoder = FieldEncoder(d, variable)
+            self.field_encoders.append(encoder)
+            self.field_encoders_by_id[d.name] = encoder
+        fixed = [e for e in self.field_encoders if not e.variable]
+        self.fixed_length = max(e.end for e in fixed) + 1
+        self.defaulted = [e for e in fixed if e.default and not e.name.startswith('ignored')]
+
+    def field(self, name):
+        return self.field_encoders_by_id[name]
+
+    def encode_int(self, values):
+        """Returns the message as an (int value, bit length) pair."""
+        if self.parts:
+            values = self._part_values(values)
+        length = self.fixed_length
+        variable = None
+        for name, value in values.items():
+            encoder = self.field_encoders_by_id[name]
+            if encoder.variable and value is not None:
+                variable = encoder, value, encoder.width_for(value)
+                length = encoder.start + variable[2]
+        result = 0
+        for encoder in self.defaulted:
+            if encoder.name not in values:
+                result |= encoder.raw(None, encoder.width) << (length - 1 - encoder.end)
+        for name, value in values.items():
+            encoder = self.field_encoders_by_id[name]
+            if encoder.variable:
+                continue
+            shift = length - 1 - encoder.end
+            # where layouts overlap, the field given last wins
+            result = result & ~(((1 << encoder.width) - 1) << shift) | encoder.raw(value, encoder.width) << shift
+        if variable:
+            encoder, value, width = variable
+            result |= encoder.raw(value, width) << (length - encoder.start - width)
+        return result, length
+
+    def _part_values(self, values):
+        part = self.parts.get(int(values.get('partno') or 0), set())
+        others = set().union(*self.parts.values()) - part
+        return {k: v for k, v in values.items() if k not in others}
+
+    def encode(self, values):
+        """Returns an armored (payload, fill bits) pair."""
+        return armor(*self.encode_int(values))
+
+
+_ENCODERS = {}
+
+
+def encoder_for(type_id):
+    if type_id not in _ENCODERS:
+        _ENCODERS[type_id] = MessageEncoder(MESSAGE_DECODERS[type_id], PART_FIELDS.get(type_id))
+    return _ENCODERS[type_id]
+
+
+def encode(type_id, values):
+    """
+    Encodes a message of the given type from a dict of field values and returns
+    an armored (payload, fill bits) pair. The type field is filled in for you.
+    """
+    if 'type' not in values:
+        values = dict(values, type=type_id)
+    return encoder_for(type_id).encode(values)
+
+
+def nmea_lines(payload, fill, channel='A', talker='AI', message_id=0, max_chars=MAX_FRAGMENT_CHARS):
+    """Splits an armored payload into checksummed !--VDM lines."""
+    pieces = [payload[i:i + max_chars] for i in range(0, len(payload), max_chars)] or ['']
+    count = len(pieces)
+    message_id = '' if count == 1 else str(message_id)
+    result = []
+    for number, piece in enumerate(pieces, start=1):
+        message = "!{}VDM,{},{},{},{},{},{}".format(talker, count, number, message_id, channel, piece,
+                                                    fill if number == count else 0)
+        result.append("{}*{:02X}".format(message, nmea_checksum(message)))
+    return result
+
+
+def encode_lines(type_id, values, channel='A', talker='AI', message_id=0):
+    """Encodes a message and returns it as a list of NMEA lines."""
+    payload, fill = encode(type_id, values)
+    return nmea_lines(payload, fill, channel, talker, message_id)
+
+
+def rewrite(sentence, values):
+    """
+    Returns a copy of a sentence with the given fields replaced. Only the bits
+    of those fields change; everything else, including fragment boundaries,
+    message ids, talker, channel and receive time, is kept. Checksums are
+    recomputed, so a sentence with a bad checksum comes back with a good one.
+    """
+    encoder = encoder_for(sentence.type_id())
+    lumps = sentence.payload.data
+    value = 0
+    length = 0
+    for lump in lumps:
+        lump_value, lump_length = unarmor(lump.ascii, lump.fill)
+        value = value << lump_length | lump_value
+        length += lump_length
+    for name, new_value in values.items():
+        field = encoder.field(name)
+        if field.variable or field.end >= length:
+            raise ValueError("can't rewrite field {} of {}".format(name, sentence))
+        shift = length - 1 - field.end
+        mask = ((1 << field.width) - 1) << shift
+        value = value & ~mask | field.raw(new_value, field.width) << shift
+
+    new_lumps = []
+    text = []
+    checksums = []
+    remaining = length
+    for lump, line in zip(lumps, sentence.text):
+        lump_length = lump.bit_length()
+        remaining -= lump_length
+        piece, fill = armor(value >> remaining & ((1 << lump_length) - 1), lump_length)
+        new_lumps.append(NmeaLump(piece, fill))
+        fields = line.split('*')[0].split(',')
+        fields[5] = piece
+        message = ",".join(fields)
+        checksum = "{:02X}".format(nmea_checksum(message))
+        checksums.append(checksum)
+        text.append("{}*{}".format(message, checksum))
+    return Sentence(sentence.talker, sentence.sentence_type, sentence.radio_channel, NmeaPayload(new_lumps),
+                    checksums, sentence.time, text)
@@ -0,0 +1,336 @@
+"""
+Fast writers for turning sentences into other formats.
+
+NdjsonWriter produces the same lines as Sentence.as_json(), one JSON object
+per line, and DelimitedWriter writes chosen fields as CSV or TSV. Neither
+builds a dict per sentence: a FieldPlan works out once per message type
+which fields to get and, for the numeric ones, a function that pulls the
+value out of the whole payload read as one big integer. A sentence then
+costs one conversion of its payload, a shift and mask per field, and a
+small string conversion per value; lines are written out in large chunks.
+Payloads too short to hold every field go through the ordinary field
+decoders.
+"""
+
+import json
+import re
+from json.encoder import encode_basestring_ascii
+
+from simpleais import AisEnum, BitFieldDecoder, Bits, ENUM_LOOKUPS, _decoder_for_type, _int_lookup
+
+BUFFER_LINES = 2000
+TIME_FIELD = 'received_at'
+TEXT_FIELD = 'text'
+# the decoded text of safety messages (types 12 and 14), whose own name,
+# text, means the sentence's NMEA lines here as in Sentence.as_dict()
+SAFETY_TEXT_FIELD = 'safety_text'
+
+
+def _float_json(value):
+    text = float.__repr__(value)
+    if text[-1] in 'fn':  # inf, -inf, nan
+        return json.dumps(value)
+    return text
+
+
+_FAST_ENCODERS = {
+    str: encode_basestring_ascii,
+    int: int.__repr__,
+    float: _float_json,
+    bool: lambda value: 'true' if value else 'false',
+    type(None): lambda value: 'null',
+}
+
+
+def json_value(value, compact_enums=False):
+    """The JSON text for a decoded field value, the way Sentence.as_json() writes it."""
+    encoder = _FAST_ENCODERS.get(type(value))
+    if encoder is not None:
+        return encoder(value)
+    if isinstance(value, AisEnum):
+        if compact_enums:
+            return int.__repr__(value.key)
+        return '{"enum_id": %d, "enum_value": %s}' % (value.key, encode_basestring_ascii(value.value))
+    if isinstance(value, Bits):
+        return encode_basestring_ascii(str(value))
+    return json.dumps(value)
+
+
+_BINARY = str.maketrans({c: format(n, '06b') for c, n in _int_lookup.items()})
+
+
+def _payload_int(payload):
+    """Returns the payload as (one int, its width in bits), or None if it has bad characters."""
+    lumps = payload.data
+    if len(lumps) == 1:
+        ascii = lumps[0].ascii
+    elif any(lump.fill for lump in lumps[:-1]):
+        return None
+    else:
+        ascii = ''.join([lump.ascii for lump in lumps])
+    try:
+        return int(ascii.translate(_BINARY), 2), 6 * len(ascii)
+    except ValueError:
+        return None
+
+
+def _bits_getter(decoder):
+    """
+    Returns a function of (payload int, width) that decodes the field the way
+    decoder would, and how many bits the payload needs for it to apply; or
+    (None, 0) for fields that are left to decoder itself.
+    """
+    if not isinstance(decoder, BitFieldDecoder):
+        return None, 0
+    name = decoder.name
+    data_type = decoder.data_type
+    stop = decoder.end + 1
+    length = stop - decoder.start
+    mask = (1 << length) - 1
+    sign = 1 << (length - 1)
+    full = 1 << length
+    method = getattr(decoder._nmea_decode, '__func__', None)
+
+    if method is BitFieldDecoder._parse_mmsi:
+        return (lambda v, w: "%09i" % ((v >> (w - stop)) & mask)), stop
+    if method is BitFieldDecoder.int:
+        return (lambda v, w: (v >> (w - stop)) & mask), stop
+    if data_type == 'b':
+        return (lambda v, w: (v >> (w - stop)) & mask == 1), stop
+    if data_type == 'U1':
+        return (lambda v, w: ((v >> (w - stop)) & mask) / 10.0), stop
+    if data_type in ('I1', 'I3', 'I4'):
+        divisor = 10 ** int(data_type[1])
+        # positions are None unless there's at least one bit after them
+        needed = stop + 1
+        if method in (BitFieldDecoder._parse_lon, BitFieldDecoder._parse_lon_coarse):
+            limit = 180.0
+        elif method in (BitFieldDecoder._parse_lat, BitFieldDecoder._parse_lat_coarse):
+            limit = 90.0
+        else:
+            limit = None
+            needed = stop
+
+        def scaled(v, w):
+            out = (v >> (w - stop)) & mask
+            if out & sign:
+                out -= full
+            result = round(out / 60 / divisor, 4)
+            if limit is None or (result != limit + 1 and -limit <= result <= limit):
+                return result
+
+        return scaled, needed
+    if data_type == 'e' and name in ENUM_LOOKUPS:
+        lookups = ENUM_LOOKUPS[name]
+
+        def enum(v, w):
+            i = (v >> (w - stop)) & mask
+            result = lookups.get(i)
+            if result is None:
+                result = lookups[i] = AisEnum(i, "enum-unknown-{}".format(i))
+            return result
+
+        return enum, stop
+    return None, 0
+
+
+def _time_of(sentence):
+    return sentence.time
+
+
+def _text_of(sentence):
+    return sentence.text
+
+
+def known_fields():
+    """Returns the names a FieldPlan can get: every message type's fields, plus received_at, text, and safety_text."""
+    from simpleais.expressions import SPECIAL_NAMES, known_fields as expression_fields
+
+    return (expression_fields() - set(SPECIAL_NAMES)) | {'type', TIME_FIELD, TEXT_FIELD, SAFETY_TEXT_FIELD}
+
+
+class FieldPlan:
+    """
+    Gets a chosen list of fields out of sentences quickly.
+
+    For each message type, works out once how to get each field: a bits
+    getter where the field can be shifted and masked out of the payload,
+    otherwise the field's own decoder. A field the type doesn't have gets
+    missing(name) if that returns a getter, and is left out if it returns
+    None. With no fields, every field of each type is used, between
+    received_at and text as in Sentence.as_dict(). The text field is always
+    the sentence's NMEA lines; safety_text is the decoded text of types 12
+    and 14.
+    """
+
+    def __init__(self, fields=None, missing=lambda name: None):
+        self.fields = None if fields is None else list(fields)
+        self.missing = missing
+        self.layouts = {}
+
+    def _layout_for(self, type_num):
+        decoder = _decoder_for_type(type_num)
+        if self.fields is None:
+            names = [TIME_FIELD] + [d.name for d in decoder.fields()]
+            # as_dict() puts the sentence text over a text field of the
+            # type's own, as in types 12 and 14, rather than adding another
+            if TEXT_FIELD not in names:
+                names.append(TEXT_FIELD)
+        else:
+            names = self.fields
+        result = []
+        bits_needed = 0
+        for name in names:
+            bits_getter = None
+            if name == TIME_FIELD:
+                getter = _time_of
+            elif name == TEXT_FIELD:
+                getter = _text_of
+            elif name in decoder or (name == SAFETY_TEXT_FIELD and TEXT_FIELD in decoder):
+                field_decoder = decoder.field(TEXT_FIELD if name == SAFETY_TEXT_FIELD else name)
+                getter = field_decoder.decode
+                bits_getter, needed = _bits_getter(field_decoder)
+                bits_needed = max(bits_needed, needed)
+            else:
+                getter = self.missing(name)
+                if getter is None:
+                    continue
+            result.append((name, getter, bits_getter))
+        layout = self.layouts[type_num] = [name for name, _, _ in result], result, bits_needed
+        return layout
+
+    def names_and_values(self, sentence):
+        """Returns the sentence's field names and values as two lists."""
+        layout = self.layouts.get(sentence.type_num)
+        if layout is None:
+            layout = self._layout_for(sentence.type_num)
+        names, getters, bits_needed = layout
+        whole = None
+        if sentence.payload.bit_length() >= bits_needed:
+            whole = _payload_int(sentence.payload)
+        if whole is None:
+            return names, [getter(sentence) for _, getter, _ in getters]
+        v, w = whole
+        return names, [getter(sentence) if bits_getter is None else bits_getter(v, w)
+                       for _, getter, bits_getter in getters]
+
+
+class _BufferedWriter:
+    def __init__(self, file, buffer_lines):
+        self.file = file
+        self.buffer_lines = buffer_lines
+        self.buffer = []
+
+    def write(self, sentence):
+        self.buffer.append(self.encode(sentence))
+        if len(self.buffer) >= self.buffer_lines:
+            self.flush()
+
+    def write_all(self, sentences):
+        for sentence in sentences:
+            self.write(sentence)
+        self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.buffer.append('')
+            self.file.write('\n'.join(self.buffer))
+            self.buffer.clear()
+            self.file.flush()
+
+
+class NdjsonWriter(_BufferedWriter):
+    """
+    Writes sentences to a file as newline-delimited JSON.
+
+    With fields, only those fields are written, in that order, and types
+    without a field just leave it out; received_at and text can be chosen
+    like any other field. With compact_enums, enumerated values such as
+    status and shiptype are written as their number rather than as an
+    object with the number and its description.
+    """
+
+    def __init__(self, file, fields=None, compact_enums=False, buffer_lines=BUFFER_LINES):
+        super().__init__(file, buffer_lines)
+        self.plan = FieldPlan(fields)
+        self.compact_enums = compact_enums
+        self.keys = {}
+
+    def _keys_for(self, type_num, names):
+        """Returns the text before each value, and where received_at is, for one message type."""
+        time_index = names.index(TIME_FIELD) if TIME_FIELD in names else None
+        result = self.keys[type_num] = [encode_basestring_ascii(name) + ': ' for name in names], time_index
+        return result
+
+    def encode(self, sentence):
+        """Returns the JSON for one sentence, without a newline."""
+        names, values = self.plan.names_and_values(sentence)
+        keys = self.keys.get(sentence.type_num)
+        if keys is None:
+            keys = self._keys_for(sentence.type_num, names)
+        keys, time_index = keys
+        fast = _FAST_ENCODERS
+        compact_enums = self.compact_enums
+        parts = [key + (fast[type(value)](value) if type(value) in fast else json_value(value, compact_enums))
+                 for key, value in zip(keys, values)]
+        if time_index is not None and not values[time_index]:
+            del parts[time_index]
+        return '{' + ', '.join(parts) + '}'
+
+
+def csv_value(value, enum_names=False):
+    """Returns the text for one field value in delimited output."""
+    if value is None:
+        return ''
+    value_type = type(value)
+    if value_type is str:
+        return value
+    if value_type is float:
+        return float.__repr__(value)
+    if value_type is bool:
+        return 'true' if value else 'false'
+    if isinstance(value, AisEnum):
+        return value.value if enum_names else str(value.key)
+    if isinstance(value, list):
+        # sentence text; NMEA sentences have no spaces, so this splits back apart
+        return ' '.join(value)
+    return str(value)
+
+
+class DelimitedWriter(_BufferedWriter):
+    """
+    Writes the given fields of each sentence as CSV, or TSV or anything else
+    with a different delimiter, after a header line of the field names.
+
+    Fields a message type doesn't have are written as defaults[name] if
+    given, or empty otherwise. Enumerated values are written as their number
+    unless enum_names is set, and the text of multi-part sentences is joined
+    with spaces. Values are quoted only when they need it.
+    """
+
+    def __init__(self, file, fields, delimiter=',', defaults=None, enum_names=False, header=True,
+                 buffer_lines=BUFFER_LINES):
+        super().__init__(file, buffer_lines)
+        if not fields:
+            raise ValueError("at least one field needed")
+        defaults = defaults or {}
+        self.fields = list(fields)
+        self.delimiter = delimiter
+        self.enum_names = enum_names
+        self.plan = FieldPlan(fields, lambda name: lambda sentence, value=defaults.get(name): value)
+        self.needs_quotes = re.compile('[{}"\r\n]'.format(re.escape(delimiter))).search
+        if header:
+            self.buffer.append(self._join(self.fields))
+
+    def _quoted(self, text):
+        return '"' + text.replace('"', '""') + '"'
+
+    def _join(self, texts):
+        needs_quotes = self.needs_quotes
+        return self.delimiter.join([self._quoted(t) if needs_quotes(t) else t for t in texts])
+
+    def encode(self, sentence):
+        """Returns one delimited line for the sentence, without a newline."""
+        enum_names = self.enum_names
+        _, values = self.plan.names_and_values(sentence)
+        return self._join([csv_value(value, enum_names) for value in values])
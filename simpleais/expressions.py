@@ -0,0 +1,346 @@
+"""
+A small expression language for choosing sentences, as used by aisgrep -e.
+
+    type in (1, 2, 3) and speed > 10 and lat between 50 and 60
+    mmsi = '366985310' or not (shipname is null)
+    status = 'Moored' and received_at >= 1452468552
+
+Names are sentence fields, plus a few extras: type is the message type,
+received_at the time the sentence was received, class is 'a' or 'b' for the
+message types only that class of transponder sends, and valid_checksum is
+true when the NMEA checksums are right. A name on its own is true when the
+sentence has that field. Comparisons with a missing field are false, except
+for != and is null.
+
+Numbers compare with numeric fields, enums by their number, and MMSIs as
+numbers; strings compare with a field's text, so enums match their
+description.
+
+compile_expression() turns an expression into a function of a sentence. The
+expression is parsed once into a tree of tuples, and each and/or is
+rearranged so that cheap checks (message type, receive time, MMSI) come
+before ones that decode fields or check checksums, then built into nested
+closures that stop as soon as the answer is known. Only fields the
+expression names are decoded.
+"""
+
+import re
+
+from simpleais import FieldAccessor, field_names
+
+CLASS_TYPES = {'a': (1, 2, 3, 5), 'b': (18, 19, 24)}
+SPECIAL_NAMES = ('type', 'received_at', 'class', 'valid_checksum')
+KEYWORDS = ('and', 'or', 'not', 'in', 'between', 'is', 'null', 'true', 'false')
+COMPARISONS = ('=', '==', '!=', '<', '<=', '>', '>=')
+
+_TOKEN = re.compile(r"""\s*(?:
+    (?P<number>-?\d+(?:\.\d*)?(?:[eE][-+]?\d+)?|-?\.\d+) |
+    (?P<string>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*") |
+    (?P<name>[A-Za-z_][\w-]*) |
+    (?P<op><=|>=|!=|==|=|<|>|\(|\)|,)
+)""", re.VERBOSE)
+
+
+_known_fields = None
+
+
+def known_fields():
+    """Returns the names an expression can use, as a frozenset."""
+    global _known_fields
+    if _known_fields is None:
+        _known_fields = field_names() | frozenset(SPECIAL_NAMES)
+    return _known_fields
+
+
+class _Parser:
+    def __init__(self, text):
+        self.text = text
+        self.tokens = []
+        position = 0
+        text = text.rstrip()
+        while position < len(text):
+            m = _TOKEN.match(text, position)
+            if not m:
+                raise ValueError("can't make sense of {!r} at position {}".format(self.text[position:], position))
+            kind = m.lastgroup
+            value = m.group(kind)
+            start = m.start(kind)
+            if kind == 'number':
+                value = float(value) if any(c in value for c in '.eE') else int(value)
+            elif kind == 'string':
+                value = re.sub(r'\\(.)', r'\1', value[1:-1])
+            elif kind == 'name' and value.lower() in KEYWORDS:
+                kind, value = 'keyword', value.lower()
+            self.tokens.append((kind, value, start))
+            position = m.end()
+        self.position = 0
+        self.fields = known_fields()
+
+    def peek(self, kind=None, value=None):
+        if self.position >= len(self.tokens):
+            return None
+        token = self.tokens[self.position]
+        if (kind is None or token[0] == kind) and (value is None or token[1] == value):
+            return token
+        return None
+
+    def take(self, kind=None, value=None):
+        token = self.peek(kind, value)
+        if token is None:
+            if self.position < len(self.tokens):
+                found = "{!r} at position {}".format(self.tokens[self.position][1], self.tokens[self.position][2])
+            else:
+                found = "the end"
+            raise ValueError("expected {} but found {}".format(value or kind, found))
+        self.position += 1
+        return token
+
+    def parse(self):
+        result = self.expression()
+        if self.position < len(self.tokens):
+            self.take('end')
+        return result
+
+    def expression(self):
+        children = [self.conjunction()]
+        while self.peek('keyword', 'or'):
+            self.take()
+            children.append(self.conjunction())
+        return children[0] if len(children) == 1 else ('or', children)
+
+    def conjunction(self):
+        children = [self.negation()]
+        while self.peek('keyword', 'and'):
+            self.take()
+            children.append(self.negation())
+        return children[0] if len(children) == 1 else ('and', children)
+
+    def negation(self):
+        if self.peek('keyword', 'not'):
+            self.take()
+            return ('not', self.negation())
+        return self.comparison()
+
+    def literal(self):
+        if self.peek('keyword', 'true') or self.peek('keyword', 'false'):
+            return self.take()[1] == 'true'
+        token = self.peek('number') or self.peek('string')
+        if token is None:
+            self.take('number or string')
+        self.position += 1
+        return token[1]
+
+    def comparison(self):
+        if self.peek('op', '('):
+            self.take()
+            result = self.expression()
+            self.take('op', ')')
+            return result
+        if self.peek('keyword', 'true') or self.peek('keyword', 'false'):
+            return ('const', self.take()[1] == 'true')
+        _, name, position = self.take('name')
+        if name not in self.fields:
+            raise ValueError("unknown field {!r} at position {}".format(name, position))
+
+        if self.peek('keyword', 'is'):
+            self.take()
+            negated = bool(self.peek('keyword', 'not'))
+            if negated:
+                self.take()
+            self.take('keyword', 'null')
+            return ('present', name) if negated else ('not', ('present', name))
+        negated = False
+        if self.peek('keyword', 'not'):
+            self.take()
+            negated = True
+            if not (self.peek('keyword', 'in') or self.peek('keyword', 'between')):
+                self.take('keyword', 'in')
+        if self.peek('keyword', 'in'):
+            self.take()
+            self.take('op', '(')
+            values = [self.literal()]
+            while self.peek('op', ','):
+                self.take()
+                values.append(self.literal())
+            self.take('op', ')')
+            result = ('in', name, tuple(values))
+        elif self.peek('keyword', 'between'):
+            self.take()
+            low = self.literal()
+            self.take('keyword', 'and')
+            result = ('between', name, low, self.literal())
+        elif self.peek('op') and self.peek('op')[1] in COMPARISONS:
+            op = self.take()[1]
+            result = ('compare', '=' if op == '==' else op, name, self.literal())
+        else:
+            return ('present', name)
+        return ('not', result) if negated else result
+
+
+def parse_expression(text):
+    """
+    Parses an expression into a tree of tuples: ('and', [nodes]), ('or',
+    [nodes]), ('not', node), ('compare', op, field, value), ('in', field,
+    values), ('between', field, low, high), ('present', field), and ('const',
+    bool). Raises ValueError for anything it doesn't understand.
+    """
+    return _Parser(text).parse()
+
+
+def cost(node):
+    """A rough relative cost of evaluating a node, for putting cheap checks first."""
+    kind = node[0]
+    if kind in ('and', 'or'):
+        return sum(cost(child) for child in node[1])
+    if kind == 'not':
+        return cost(node[1])
+    if kind == 'const':
+        return 0
+    name = node[1] if kind == 'present' else node[2] if kind == 'compare' else node[1]
+    if name in ('type', 'received_at', 'class'):
+        return 1
+    if name == 'mmsi':
+        return 2
+    if name == 'valid_checksum':
+        return 10
+    return 4
+
+
+def _getter(name):
+    if name == 'type':
+        return lambda sentence: sentence.type_num
+    if name == 'received_at':
+        return lambda sentence: sentence.time
+    if name == 'valid_checksum':
+        return lambda sentence: sentence.check()
+    if name == 'class':
+        classes = {t: c for c, types in CLASS_TYPES.items() for t in types}
+        return lambda sentence: classes.get(sentence.type_num)
+    return FieldAccessor(name)
+
+
+def _as_number(value):
+    """Returns value as a number for comparing with a number, or None if it isn't one."""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return None
+
+
+def _comparable(value, like):
+    """Converts a field value for comparing with the literal like."""
+    if isinstance(like, str):
+        return value if value is None or isinstance(value, str) else str(value)
+    if isinstance(like, bool):
+        return value
+    return _as_number(value)
+
+
+_ORDERINGS = {
+    '<': lambda a, b: a < b,
+    '<=': lambda a, b: a <= b,
+    '>': lambda a, b: a > b,
+    '>=': lambda a, b: a >= b,
+}
+
+
+def _compile(node):
+    kind = node[0]
+    if kind == 'const':
+        value = node[1]
+        return lambda sentence: value
+    if kind == 'not':
+        inner = _compile(node[1])
+        return lambda sentence: not inner(sentence)
+    if kind in ('and', 'or'):
+        children = [_compile(child) for child in sorted(node[1], key=cost)]
+        if not children:
+            value = kind == 'and'
+            return lambda sentence: value
+        if len(children) == 1:
+            return children[0]
+        if len(children) == 2:
+            first, second = children
+            if kind == 'and':
+                return lambda sentence: first(sentence) and second(sentence)
+            return lambda sentence: first(sentence) or second(sentence)
+        if kind == 'and':
+            return lambda sentence: all(child(sentence) for child in children)
+        return lambda sentence: any(child(sentence) for child in children)
+
+    if kind == 'present':
+        get = _getter(node[1])
+        return lambda sentence: get(sentence) is not None
+
+    if kind == 'compare':
+        _, op, name, literal = node
+        get = _getter(name)
+        if name == 'type' and op in ('=', '!=') and isinstance(literal, int):
+            if op == '=':
+                return lambda sentence: sentence.type_num == literal
+            return lambda sentence: sentence.type_num != literal
+        if op in ('=', '!='):
+            def equal(sentence):
+                value = get(sentence)
+                return value == literal or (value is not None and _comparable(value, literal) == literal)
+
+            if op == '=':
+                return equal
+            return lambda sentence: not equal(sentence)
+        if isinstance(literal, str):
+            raise ValueError("{} needs a number, not {!r}".format(op, literal))
+        ordering = _ORDERINGS[op]
+
+        def compare(sentence):
+            value = _as_number(get(sentence))
+            return value is not None and ordering(value, literal)
+
+        return compare
+
+    if kind == 'in':
+        _, name, values = node
+        if name == 'type' and all(isinstance(v, int) for v in values):
+            types = frozenset(values)
+            return lambda sentence: sentence.type_num in types
+        get = _getter(name)
+        values = frozenset(values)
+        strings = frozenset(v for v in values if isinstance(v, str))
+        numbers = frozenset(v for v in values if not isinstance(v, str))
+        if name == 'mmsi' and not numbers:
+            return lambda sentence: sentence['mmsi'] in strings
+
+        def contains(sentence):
+            value = get(sentence)
+            if value is None:
+                return False
+            if strings and (value if isinstance(value, str) else str(value)) in strings:
+                return True
+            return bool(numbers) and _as_number(value) in numbers
+
+        return contains
+
+    if kind == 'between':
+        _, name, low, high = node
+        if isinstance(low, str) or isinstance(high, str):
+            raise ValueError("between needs numbers, not {!r} and {!r}".format(low, high))
+        get = _getter(name)
+
+        def between(sentence):
+            value = _as_number(get(sentence))
+            return value is not None and low <= value <= high
+
+        return between
+
+    raise ValueError("unknown expression node {!r}".format(node))
+
+
+def compile_expression(expression):
+    """Returns a function that takes a sentence and says whether the expression, text or tree, is true for it."""
+    if isinstance(expression, str):
+        expression = parse_expression(expression)
+    return _compile(expression)
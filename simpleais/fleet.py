@@ -0,0 +1,198 @@
+"""
+Latest known state of every vessel in a feed, kept in compact column arrays.
+
+FleetState keeps one row per MMSI in a set of NumPy arrays, found through a
+single MMSI -> row dict. Names, call signs and destinations are interned in
+a StringPool and stored as integer ids, so a fleet of hundreds of thousands
+of vessels costs a few hundred bytes each, and a snapshot of the whole fleet
+is a handful of array copies.
+"""
+
+import math
+
+import numpy
+
+POSITION_TYPES = frozenset([1, 2, 3, 18, 19, 27])
+LOCATION_TYPES = frozenset([4, 9, 21])
+STATIC_TYPES = frozenset([5, 19, 24])
+
+NO_STRING = 0
+
+# name -> (dtype, missing value)
+COLUMNS = {
+    'mmsi': (numpy.uint32, 0),
+    'position_time': (numpy.float64, math.nan),
+    'lon': (numpy.float64, math.nan),
+    'lat': (numpy.float64, math.nan),
+    'speed': (numpy.float32, math.nan),
+    'course': (numpy.float32, math.nan),
+    'heading': (numpy.int16, -1),
+    'status': (numpy.int8, -1),
+    'last_type': (numpy.int8, 0),
+    'last_seen': (numpy.float64, math.nan),
+    'static_time': (numpy.float64, math.nan),
+    'shipname': (numpy.int32, NO_STRING),
+    'callsign': (numpy.int32, NO_STRING),
+    'destination': (numpy.int32, NO_STRING),
+    'shiptype': (numpy.int16, -1),
+    'imo': (numpy.uint32, 0),
+    'to_bow': (numpy.int16, -1),
+    'to_stern': (numpy.int16, -1),
+    'to_port': (numpy.int16, -1),
+    'to_starboard': (numpy.int16, -1),
+    'draught': (numpy.float32, math.nan),
+}
+STRING_COLUMNS = ('shipname', 'callsign', 'destination')
+DIMENSIONS = ('to_bow', 'to_stern', 'to_port', 'to_starboard')
+
+
+class StringPool:
+    """Interns strings as small integer ids. Id 0 is reserved for no string."""
+
+    def __init__(self):
+        self.strings = [None]
+        self.ids = {}
+
+    def id_for(self, s):
+        if not s:
+            return NO_STRING
+        result = self.ids.get(s)
+        if result is None:
+            result = self.ids[s] = len(self.strings)
+            self.strings.append(s)
+        return result
+
+    def __getitem__(self, string_id):
+        return self.strings[string_id]
+
+    def __len__(self):
+        return len(self.strings) - 1
+
+
+class FleetState:
+    """
+    Latest position, motion, and static data per MMSI.
+
+    add() is O(1): one dict lookup to find the row plus a few array stores;
+    the arrays grow by doubling. Position updates older than the stored
+    position are ignored, so slightly out-of-order feeds don't move vessels
+    backwards. Missing values are NaN for floats and -1 (or 0 for ids) for
+    integers.
+    """
+
+    def __init__(self, capacity=1024):
+        self.rows = {}
+        self.size = 0
+        self.strings = StringPool()
+        self.columns = {name: numpy.full(capacity, missing, dtype) for name, (dtype, missing) in COLUMNS.items()}
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, mmsi):
+        return int(mmsi) in self.rows
+
+    def capacity(self):
+        return len(self.columns['mmsi'])
+
+    def _grow(self):
+        new_capacity = 2 * self.capacity()
+        for name, (dtype, missing) in COLUMNS.items():
+            column = numpy.full(new_capacity, missing, dtype)
+            column[:self.size] = self.columns[name][:self.size]
+            self.columns[name] = column
+
+    def _row(self, mmsi):
+        row = self.rows.get(mmsi)
+        if row is None:
+            if self.size == self.capacity():
+                self._grow()
+            row = self.rows[mmsi] = self.size
+            self.size += 1
+            self.columns['mmsi'][row] = mmsi
+        return row
+
+    def add(self, sentence):
+        type_id = sentence.type_id()
+        mmsi = sentence['mmsi']
+        if not mmsi:
+            return
+        row = self._row(int(mmsi))
+        c = self.columns
+        t = sentence.time
+        c['last_type'][row] = type_id
+        if t is not None and not c['last_seen'][row] > t:
+            c['last_seen'][row] = t
+
+        if type_id in POSITION_TYPES or type_id in LOCATION_TYPES:
+            previous = c['position_time'][row]
+            if t is None or not previous > t:
+                self._add_position(row, sentence, type_id, t)
+        if type_id in STATIC_TYPES:
+            self._add_static(row, sentence, type_id, t)
+
+    def _add_position(self, row, sentence, type_id, t):
+        location = sentence.location()
+        if location is None:
+            return
+        c = self.columns
+        c['position_time'][row] = math.nan if t is None else t
+        c['lon'][row], c['lat'][row] = location
+        if type_id in POSITION_TYPES:
+            c['speed'][row] = _or_nan(sentence['speed'])
+            c['course'][row] = _or_nan(sentence['course'])
+            heading = sentence['heading']
+            c['heading'][row] = -1 if heading is None else heading
+            status = sentence['status']
+            c['status'][row] = -1 if status is None else int(status)
+
+    def _add_static(self, row, sentence, type_id, t):
+        c = self.columns
+        if t is not None:
+            c['static_time'][row] = t
+        if type_id == 24 and sentence['partno'] == 0:
+            c['shipname'][row] = self.strings.id_for(sentence['shipname'])
+            return
+        if type_id != 24:
+            c['shipname'][row] = self.strings.id_for(sentence['shipname'])
+        shiptype = sentence['shiptype']
+        if shiptype is not None:
+            c['shiptype'][row] = int(shiptype)
+        for name in DIMENSIONS:
+            value = sentence[name]
+            if value is not None:
+                c[name][row] = value
+        if type_id != 19:
+            c['callsign'][row] = self.strings.id_for(sentence['callsign'])
+        if type_id == 5:
+            c['imo'][row] = sentence['imo']
+            c['draught'][row] = _or_nan(sentence['draught'])
+            c['destination'][row] = self.strings.id_for(sentence['destination'])
+
+    def get(self, mmsi):
+        """Returns one vessel's state as a dict, or None if it hasn't been seen."""
+        row = self.rows.get(int(mmsi))
+        if row is None:
+            return None
+        result = {}
+        for name, column in self.columns.items():
+            value = column[row].item()
+            if name in STRING_COLUMNS:
+                value = self.strings[value]
+            result[name] = value
+        result['mmsi'] = "%09i" % result['mmsi']
+        return result
+
+    def snapshot(self):
+        """
+        Returns a copy of every column, trimmed to the vessels seen so far. String
+        columns hold StringPool ids; see strings_for() to turn them back into text.
+        """
+        return {name: column[:self.size].copy() for name, column in self.columns.items()}
+
+    def strings_for(self, ids):
+        return [self.strings[i] for i in ids]
+
+
+def _or_nan(value):
+    return math.nan if value is None else value
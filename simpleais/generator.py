@@ -0,0 +1,232 @@
+"""
+Synthetic AIS traffic for load testing.
+
+TrafficGenerator simulates a fleet of vessels moving around a bounding box,
+plus base stations and aids to navigation, and produces the NMEA lines a
+receiver would log for them: class A position reports (types 1, 2 and 3) and
+two-fragment voyage data (type 5), class B position reports (type 18) and
+static data (type 24), base station reports (type 4), and AtoN reports
+(type 21). It can also mix in the things real feeds have: the same sentence
+heard by a second receiver, bad checksums, and junk lines.
+"""
+
+import heapq
+import itertools
+import math
+import random
+import time
+
+from simpleais.encoder import encode, nmea_lines
+
+# San Francisco Bay, roughly: (min lon, min lat, max lon, max lat)
+DEFAULT_BOUNDS = (-122.9, 37.4, -122.0, 38.1)
+
+CLASS_A_INTERVAL = 10
+CLASS_A_FAST_INTERVAL = 6
+CLASS_B_INTERVAL = 30
+ANCHORED_INTERVAL = 180
+STATIC_INTERVAL = 360
+BASE_STATION_INTERVAL = 10
+ATON_INTERVAL = 180
+
+_SHIP_TYPES = [30, 31, 36, 37, 52, 60, 69, 70, 79, 80, 89, 90]
+_DESTINATIONS = ['SAN FRANCISCO', 'OAKLAND', 'RICHMOND', 'US SFO', 'US OAK', 'LONG BEACH', 'SEATTLE',
+                 'VANCOUVER', 'SHANGHAI', 'BUSAN', 'HONOLULU', 'FISHING GROUNDS']
+_SYLLABLES = ['AL', 'BA', 'COR', 'DEL', 'EN', 'FAR', 'GO', 'HAL', 'IN', 'KA', 'LU', 'MAR', 'NO', 'OR', 'PAC',
+              'RA', 'SEA', 'TA', 'VIS', 'WIND']
+_JUNK = ['', '$GPGGA,123519,4807.038,N,01131.000,E,1,08,0.9,545.4,M,46.9,M,,*47', '!AIVDM,1,1,,A,',
+         'garbage data', '\x00\x00\x00', '!AIVDM,1,1,,B,1><<<,0']
+
+
+class Vessel:
+    def __init__(self, rng, mmsi, vessel_class, bounds):
+        self.rng = rng
+        self.mmsi = mmsi
+        self.vessel_class = vessel_class
+        self.bounds = bounds
+        self.lon = rng.uniform(bounds[0], bounds[2])
+        self.lat = rng.uniform(bounds[1], bounds[3])
+        self.anchored = rng.random() < 0.2
+        self.cruise_speed = rng.uniform(4, 22) if vessel_class == 'a' else rng.uniform(2, 12)
+        self.speed = 0.0 if self.anchored else self.cruise_speed
+        self.course = rng.uniform(0, 360)
+        self.shipname = " ".join(rng.choice(_SYLLABLES) + rng.choice(_SYLLABLES).lower()
+                                 for _ in range(rng.randint(1, 2))).upper()
+        self.callsign = "".join(rng.choice('ABCDKNW0123456789') for _ in range(rng.randint(4, 7)))
+        self.shiptype = rng.choice(_SHIP_TYPES)
+        self.imo = rng.randint(1000000, 9999999) if vessel_class == 'a' else 0
+        self.to_bow = rng.randint(5, 250) if vessel_class == 'a' else rng.randint(3, 15)
+        self.to_stern = max(1, self.to_bow // rng.randint(3, 6))
+        self.to_port = self.to_starboard = max(1, min(63, (self.to_bow + self.to_stern) // 12))
+        self.draught = round(rng.uniform(1.0, 15.0), 1) if vessel_class == 'a' else 0.0
+        self.destination = rng.choice(_DESTINATIONS)
+        self.last_moved = None
+
+    def interval(self):
+        if self.anchored:
+            return ANCHORED_INTERVAL
+        elif self.vessel_class == 'b':
+            return CLASS_B_INTERVAL
+        elif self.speed > 14:
+            return CLASS_A_FAST_INTERVAL
+        else:
+            return CLASS_A_INTERVAL
+
+    def move_to(self, t):
+        if self.last_moved is not None and not self.anchored:
+            dt = t - self.last_moved
+            self.course = (self.course + self.rng.gauss(0, 0.5) * math.sqrt(dt)) % 360
+            self.speed = max(0.5, min(30.0, self.speed + self.rng.gauss(0, 0.05) * math.sqrt(dt)))
+            distance = self.speed * dt / 3600 / 60  # knots -> degrees of latitude
+            self.lat += distance * math.cos(math.radians(self.course))
+            self.lon += distance * math.sin(math.radians(self.course)) / max(0.01, math.cos(math.radians(self.lat)))
+            if not self.bounds[0] <= self.lon <= self.bounds[2]:
+                self.lon = min(max(self.lon, self.bounds[0]), self.bounds[2])
+                self.course = (360 - self.course) % 360
+            if not self.bounds[1] <= self.lat <= self.bounds[3]:
+                self.lat = min(max(self.lat, self.bounds[1]), self.bounds[3])
+                self.course = (180 - self.course) % 360
+        self.last_moved = t
+
+    def heading(self):
+        return int(round(self.course + self.rng.uniform(-3, 3))) % 360
+
+    def position_payload(self, t):
+        common = {'mmsi': self.mmsi, 'speed': self.speed, 'accuracy': True, 'lon': self.lon, 'lat': self.lat,
+                  'course': round(self.course, 1) % 360, 'heading': self.heading(), 'second': int(t) % 60,
+                  'radio': self.rng.randint(0, 2 ** 19 - 1)}
+        if self.vessel_class == 'b':
+            return encode(18, dict(common, cs=True, dsc=True, band=True, msg22=True))
+        type_id = self.rng.choices([1, 2, 3], [80, 5, 15])[0]
+        return encode(type_id, dict(common, status=1 if self.anchored else 0))
+
+    def static_payloads(self, t):
+        if self.vessel_class == 'b':
+            return [encode(24, {'mmsi': self.mmsi, 'partno': 0, 'shipname': self.shipname}),
+                    encode(24, {'mmsi': self.mmsi, 'partno': 1, 'shiptype': self.shiptype, 'vendorid': 'SIMAIS',
+                                'callsign': self.callsign, 'to_bow': self.to_bow, 'to_stern': self.to_stern,
+                                'to_port': self.to_port, 'to_starboard': self.to_starboard})]
+        eta = time.gmtime(t + 86400 * self.rng.uniform(0.2, 10))
+        return [encode(5, {'mmsi': self.mmsi, 'imo': self.imo, 'callsign': self.callsign,
+                           'shipname': self.shipname, 'shiptype': self.shiptype, 'to_bow': self.to_bow,
+                           'to_stern': self.to_stern, 'to_port': self.to_port, 'to_starboard': self.to_starboard,
+                           'epfd': 1, 'month': eta.tm_mon, 'day': eta.tm_mday, 'hour': eta.tm_hour,
+                           'minute': eta.tm_min, 'draught': self.draught, 'destination': self.destination})]
+
+
+class TrafficGenerator:
+    """
+    Produces a stream of (receive time, line) pairs for a simulated fleet.
+
+    Each vessel reports at the ITU nominal intervals (every few seconds when
+    under way, every few minutes at anchor), so the message rate grows with the
+    number of vessels: a hundred vessels make roughly ten sentences a second of
+    simulated time. The *_rate arguments are the probability of each kind of
+    noise per sentence.
+    """
+
+    def __init__(self, vessels=100, seed=None, bounds=DEFAULT_BOUNDS, start_time=None, class_b_share=0.3,
+                 base_stations=None, aids_to_navigation=None,
+                 duplicate_rate=0.0, bad_checksum_rate=0.0, junk_rate=0.0):
+        self.rng = random.Random(seed)
+        self.bounds = bounds
+        self.start_time = time.time() if start_time is None else start_time
+        self.duplicate_rate = duplicate_rate
+        self.bad_checksum_rate = bad_checksum_rate
+        self.junk_rate = junk_rate
+        self.message_id = 0
+        self.sequence = itertools.count()
+        if base_stations is None:
+            base_stations = max(1, vessels // 200)
+        if aids_to_navigation is None:
+            aids_to_navigation = max(1, vessels // 50)
+
+        used = set()
+        self.vessels = []
+        for _ in range(vessels):
+            vessel_class = 'b' if self.rng.random() < class_b_share else 'a'
+            self.vessels.append(Vessel(self.rng, self._unique_mmsi(used, 201000000, 775999999), vessel_class, bounds))
+        self.base_stations = [(self._unique_mmsi(used, 2010000, 7759999), self._random_point())
+                              for _ in range(base_stations)]
+        self.aids = [(self._unique_mmsi(used, 992010000, 997759999), self._random_point(), "BUOY {}".format(i + 1))
+                     for i in range(aids_to_navigation)]
+
+        self.events = []
+        for vessel in self.vessels:
+            self._schedule(self.rng.uniform(0, vessel.interval()), 'position', vessel)
+            self._schedule(self.rng.uniform(0, STATIC_INTERVAL), 'static', vessel)
+        for station in self.base_stations:
+            self._schedule(self.rng.uniform(0, BASE_STATION_INTERVAL), 'base', station)
+        for aid in self.aids:
+            self._schedule(self.rng.uniform(0, ATON_INTERVAL), 'aton', aid)
+
+    def _unique_mmsi(self, used, low, high):
+        while True:
+            mmsi = self.rng.randint(low, high)
+            if mmsi not in used:
+                used.add(mmsi)
+                return mmsi
+
+    def _random_point(self):
+        return self.rng.uniform(self.bounds[0], self.bounds[2]), self.rng.uniform(self.bounds[1], self.bounds[3])
+
+    def _schedule(self, offset, kind, thing):
+        heapq.heappush(self.events, (self.start_time + offset, next(self.sequence), kind, thing))
+
+    def _payloads(self, t, kind, thing):
+        if kind == 'position':
+            thing.move_to(t)
+            self._schedule(t - self.start_time + thing.interval(), kind, thing)
+            return [thing.position_payload(t)]
+        elif kind == 'static':
+            self._schedule(t - self.start_time + STATIC_INTERVAL, kind, thing)
+            return thing.static_payloads(t)
+        elif kind == 'base':
+            self._schedule(t - self.start_time + BASE_STATION_INTERVAL, kind, thing)
+            mmsi, (lon, lat) = thing
+            now = time.gmtime(t)
+            return [encode(4, {'mmsi': mmsi, 'year': now.tm_year, 'month': now.tm_mon, 'day': now.tm_mday,
+                               'hour': now.tm_hour, 'minute': now.tm_min, 'second': now.tm_sec, 'accuracy': True,
+                               'lon': lon, 'lat': lat, 'epfd': 7})]
+        else:
+            self._schedule(t - self.start_time + ATON_INTERVAL, kind, thing)
+            mmsi, (lon, lat), name = thing
+            return [encode(21, {'mmsi': mmsi, 'aid_type': 22, 'name': name, 'accuracy': True, 'lon': lon,
+                                'lat': lat, 'epfd': 7, 'second': int(t) % 60})]
+
+    def _corrupt(self, line):
+        message, checksum = line.rsplit('*', 1)
+        return "{}*{:02X}".format(message, int(checksum, 16) ^ self.rng.randint(1, 255))
+
+    def lines(self, count=None, duration=None):
+        """
+        Yields (receive time, line) pairs in time order. Stops after count lines
+        or duration simulated seconds if either is given; otherwise runs forever.
+        """
+        produced = 0
+        end = None if duration is None else self.start_time + duration
+        while count is None or produced < count:
+            t, _, kind, thing = heapq.heappop(self.events)
+            if end is not None and t > end:
+                return
+            batch = []
+            for payload, fill in self._payloads(t, kind, thing):
+                channel = self.rng.choice('AB')
+                sentence = nmea_lines(payload, fill, channel, message_id=self.message_id)
+                if self.rng.random() < self.bad_checksum_rate:
+                    sentence = [self._corrupt(l) for l in sentence]
+                batch.append((t, sentence))
+                if self.rng.random() < self.duplicate_rate:
+                    # the same transmission, as logged by a second receiver
+                    batch.append((t + self.rng.uniform(0.001, 0.2),
+                                  nmea_lines(payload, fill, 'B' if channel == 'A' else 'A', 'AB', self.message_id)))
+                if len(sentence) > 1:
+                    self.message_id = (self.message_id + 1) % 10
+            for sentence_time, sentence in batch:
+                for line in sentence:
+                    if self.rng.random() < self.junk_rate:
+                        yield sentence_time, self.rng.choice(_JUNK)
+                    yield sentence_time, "{:.3f} {}".format(sentence_time, line)
+                    produced += 1
+                    if count is not None and produced >= count:
+                        return
@@ -0,0 +1,219 @@
+"""
+Text maps of where sentences came from, as drawn by aisinfo --map.
+
+A DensityMap counts positions into a grid of cells, using a Bucketer for
+each axis, and draws it as text, one character per cell, with a digit for
+how busy the cell is relative to the busiest and * for marked points.
+"""
+
+import sys
+
+import numpy
+
+from simpleais.tools import GeoInfo
+
+
+class Bucketer:
+    """Given min, max, and buckets, buckets values"""
+
+    def __init__(self, min_val, max_val, bucket_count):
+        self.min_val = min_val
+        self.max_val = max_val
+        self.bucket_count = bucket_count
+        self.max_buckets = bucket_count - 1
+        if self.min_val == self.max_val:
+            self.bins = numpy.linspace(min_val - 1, max_val + 1, bucket_count + 1)
+        else:
+            self.bins = numpy.linspace(min_val, max_val + sys.float_info.epsilon, bucket_count + 1)
+
+    def bucket(self, value):
+        result = numpy.digitize(value, self.bins) - 1
+
+        # this shouldn't be necessary, but it somehow is
+        if result > self.max_buckets:
+            return self.max_buckets
+        return result
+
+    def bucket_all(self, values):
+        """Buckets an array of values at once."""
+        return numpy.minimum(numpy.digitize(values, self.bins) - 1, self.max_buckets)
+
+    def __str__(self, *args, **kwargs):
+        return "Bucketer({}, {}, {}, {})".format(self.min_val, self.max_val, self.bucket_count, self.bins)
+
+
+class DensityMap:
+    """
+    Counts points into a grid for display as text.
+
+    Given bounds, (min lon, min lat, max lon, max lat), the grid is fixed up
+    front and points are counted as they arrive, in batches, so memory stays
+    the same however many points there are; points outside the bounds are
+    ignored. Without bounds, the map fits itself to the points, so it keeps
+    them all (as compact arrays) until it's drawn. Either way the text is the
+    same when the bounds match the points' extent.
+
+    If a map without bounds is given more than max_points, it drops the
+    points it has and ignores the rest, setting overflowed; the caller can
+    then start again with bounds.
+    """
+
+    BATCH_SIZE = 4096
+
+    def __init__(self, width=60, height_scale=0.5, indent="", bounds=None, max_points=None):
+        self.desired_width = width
+        self.height_scale = height_scale  # terminal characters are about 2x tall as they are wide
+        self.indent = indent
+        self.geo_info = GeoInfo()
+        self.bounds = bounds
+        self.batch = numpy.empty((self.BATCH_SIZE, 2))
+        self.batch_size = 0
+        self.point_chunks = []
+        self.point_count = 0
+        self.max_points = max_points
+        self.overflowed = False
+        self.marks = []
+        self.cached_height = None
+        self.counts = None
+        if bounds is not None:
+            self.geo_info.add(bounds[:2])
+            self.geo_info.add(bounds[2:])
+            self.counts = numpy.zeros(self.height() * self.width(), dtype=numpy.int64)
+
+    def add(self, point):
+        self.batch[self.batch_size] = point
+        self.batch_size += 1
+        if self.batch_size == self.BATCH_SIZE:
+            self._add_batch()
+
+    def add_all(self, lons, lats):
+        """Adds many points at once, given as parallel arrays."""
+        self._add_batch()
+        self._add_points(numpy.column_stack((lons, lats)).astype(numpy.float64))
+
+    def _add_batch(self):
+        if self.batch_size:
+            points = self.batch[:self.batch_size].copy()
+            self.batch_size = 0
+            self._add_points(points)
+
+    def _add_points(self, points):
+        if not len(points) or self.overflowed:
+            return
+        if self.counts is None:
+            if self.max_points is not None and self.point_count + len(points) > self.max_points:
+                self.overflowed = True
+                self.point_chunks = []
+                return
+            self.point_chunks.append(points)
+            self.point_count += len(points)
+            self.geo_info.add(points.min(axis=0).tolist())
+            self.geo_info.add(points.max(axis=0).tolist())
+            self.cached_height = None
+        else:
+            min_lon, min_lat, max_lon, max_lat = self.bounds
+            inside = (points[:, 0] >= min_lon) & (points[:, 0] <= max_lon) & \
+                     (points[:, 1] >= min_lat) & (points[:, 1] <= max_lat)
+            points = points[inside]
+            self.point_count += len(points)
+            self.counts += numpy.bincount(self._cells(points), minlength=len(self.counts))
+
+    def merge(self, other):
+        """Adds in the points and marks of another map with the same bounds."""
+        self._add_batch()
+        other._add_batch()
+        if (self.counts is None) != (other.counts is None) or self.bounds != other.bounds:
+            raise ValueError("can't merge maps with different bounds")
+        if self.counts is None:
+            for chunk in other.point_chunks:
+                self._add_points(chunk)
+        else:
+            self.counts += other.counts
+            self.point_count += other.point_count
+        for mark in other.marks:
+            if mark not in self.marks:
+                self.mark(mark)
+        return self
+
+    def _cells(self, points):
+        x, y = self.bucket_all(points)
+        return y * self.width() + x
+
+    def valid(self):
+        self._add_batch()
+        return self.point_count > 0 and self.geo_info.valid()
+
+    def bucket(self, points):
+        x, y = self.bucket_all(numpy.array(points, dtype=numpy.float64).reshape(-1, 2))
+        return list(zip(x.tolist(), y.tolist()))
+
+    def bucket_all(self, points):
+        """Returns x and y arrays of the cells an array of (lon, lat) points fall in."""
+        xb = Bucketer(self.geo_info.lon.min, self.geo_info.lon.max, self.width())
+        yb = Bucketer(self.geo_info.lat.min, self.geo_info.lat.max, self.height())
+        return xb.bucket_all(points[:, 0]), self.height() - 1 - yb.bucket_all(points[:, 1])
+
+    def height(self):
+        if self.cached_height is None:
+            if self.geo_info.valid() and self.geo_info.width() > 0 and self.geo_info.height() > 0:
+                self.cached_height = int(
+                    self.height_scale * self.geo_info.height() * self.width() / self.geo_info.width())
+            else:
+                self.cached_height = int(self.height_scale * self.width())
+        return min(self.desired_width, max(1, self.cached_height))
+
+    def width(self):
+        return self.desired_width
+
+    def to_counts(self):
+        self._add_batch()
+        if self.counts is not None:
+            counts = self.counts.copy()
+        elif self.point_chunks and self.geo_info.valid():
+            counts = numpy.bincount(self._cells(numpy.concatenate(self.point_chunks)),
+                                    minlength=self.height() * self.width())
+        else:
+            counts = numpy.zeros(self.height() * self.width(), dtype=numpy.int64)
+        results = counts.reshape(self.height(), self.width()).tolist()
+        if self.geo_info.valid():
+            for x, y in self.bucket(self.marks):
+                results[y][x] = -1
+        return results
+
+    def to_text(self):
+        counts = self.to_counts()
+
+        max_count = max([max(l) for l in counts])
+
+        def value_to_text(value):
+            if value == -1:
+                return "*"
+            elif value == 0:
+                return " "
+            else:
+                c = str(int(9.99999 * value / max_count))
+                if c == '0':
+                    return '.'
+                return c
+
+        output = []
+        header_footer_line = "{}+{}+".format(self.indent, "-" * self.width())
+        output.append(header_footer_line)
+        for row in counts:
+            line = []
+            for col in row:
+                line.append(value_to_text(col))
+            output.append("{}|{}|".format(self.indent, "".join(line)))
+        output.append(header_footer_line)
+        return output
+
+    def show(self, file=sys.stdout):
+        print("\n".join(self.to_text()), file=file)
+
+    def mark(self, point):
+        if self.counts is None:
+            self.marks.append(point)
+            self.geo_info.add(point)
+            self.cached_height = None
+        elif self.bounds[0] <= point[0] <= self.bounds[2] and self.bounds[1] <= point[1] <= self.bounds[3]:
+            self.marks.append(point)
@@ -0,0 +1,258 @@
+"""
+Partitioned output for aisburst.
+
+A flat directory with one file per sender gets slow to write and to list
+once there are hundreds of thousands of senders. With a Partitioner, sender
+files go into a tree of directories by any of: a hash bucket of the MMSI,
+the UTC day or hour the sentence was received, and the message type.
+Directory names are key=value, as in day=2016-01-10/mmsi=042/366985310.ais,
+which most data tools read as partition columns. A manifest.json at the top
+records each file's partition, sentence count, and first and last times.
+
+With several jobs, each worker owns the senders whose MMSI modulo the
+number of jobs is its own number, and only writes their files, so no two
+processes ever touch the same file. Every worker reads all of the input, so
+reading costs jobs times as much; what's split is the parsing and writing.
+Each skips single-fragment lines from other workers' senders after a quick
+look at the payload, so it parses little more than its own share. Routing
+lines instead, with one process sending each to the worker owning its
+sender, would have that process alone take the same look at every line and
+pickle it besides, and it would become the bottleneck; reading a file again
+is cheap, as it's mostly in the page cache by then.
+"""
+
+import json
+import logging
+import os
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+from simpleais import StreamParser, lines_from_source, sentence_source_text
+from simpleais.sinks import WriterPool
+
+PARTITION_KEYS = ('mmsi', 'day', 'hour', 'type')
+MANIFEST_NAME = 'manifest.json'
+OTHER = 'other'
+UNKNOWN = 'unknown'
+
+
+def peek_mmsi(line):
+    """
+    Returns the MMSI of a single-fragment sentence from its payload characters
+    alone, or None if the line isn't one or is too short to be sure.
+    """
+    fields = line.split(',', 6)
+    if len(fields) < 7 or fields[1] != '1' or len(fields[5]) < 8:
+        return None
+    value = 0
+    for c in fields[5][1:7]:
+        n = ord(c) - 48
+        if n > 40:
+            n -= 8
+        value = (value << 6) | n
+    # characters 1 to 6 hold payload bits 6 to 41; the MMSI is bits 8 to 37
+    return (value >> 4) & 0x3fffffff
+
+
+def owner_for(mmsi, jobs):
+    """The worker that writes a sender's files; senders with no MMSI go to worker 0."""
+    if not mmsi:
+        return 0
+    return int(mmsi) % jobs
+
+
+class Partitioner:
+    """Works out which directory, relative to the top of the tree, a sentence's file goes in."""
+
+    def __init__(self, keys, buckets=256):
+        for key in keys:
+            if key not in PARTITION_KEYS:
+                raise ValueError("unknown partition key {}; choose from {}".format(key, ", ".join(PARTITION_KEYS)))
+        if len(set(keys)) != len(keys):
+            raise ValueError("partition keys must be different")
+        if buckets < 1:
+            raise ValueError("buckets must be at least 1")
+        self.keys = tuple(keys)
+        self.buckets = buckets
+        self.bucket_format = "{:0%dd}" % len(str(buckets - 1))
+        self.hours = {}
+        self.directories = {}
+
+    def bucket_for(self, mmsi):
+        return self.bucket_format.format(zlib.crc32(mmsi.encode('ascii')) % self.buckets)
+
+    def _hour(self, t):
+        hour = int(t // 3600)
+        result = self.hours.get(hour)
+        if result is None:
+            result = self.hours[hour] = time.strftime("%Y-%m-%dT%H", time.gmtime(hour * 3600))
+        return result
+
+    def partition_for(self, sentence, mmsi):
+        """Returns the sentence's partition as a tuple of (key, value) pairs."""
+        result = []
+        for key in self.keys:
+            if key == 'mmsi':
+                value = self.bucket_for(mmsi)
+            elif key == 'type':
+                value = str(sentence.type_id())
+            elif sentence.time is None:
+                value = UNKNOWN
+            elif key == 'day':
+                value = self._hour(sentence.time)[:10]
+            else:
+                value = self._hour(sentence.time)
+            result.append((key, value))
+        return tuple(result)
+
+    def directory_for(self, partition):
+        result = self.directories.get(partition)
+        if result is None:
+            result = self.directories[partition] = os.path.join(*["{}={}".format(k, v) for k, v in partition])
+        return result
+
+
+class Manifest:
+    """What went where: for each file, its sender, partition, sentence count, and first and last times."""
+
+    def __init__(self, keys=(), buckets=256):
+        self.keys = tuple(keys)
+        self.buckets = buckets
+        self.files = {}
+
+    def add(self, path, mmsi, partition, t):
+        entry = self.files.get(path)
+        if entry is None:
+            entry = self.files[path] = {'mmsi': mmsi, 'partition': dict(partition),
+                                        'sentences': 0, 'first': None, 'last': None}
+        entry['sentences'] += 1
+        if t is not None:
+            if entry['first'] is None or t < entry['first']:
+                entry['first'] = t
+            if entry['last'] is None or t > entry['last']:
+                entry['last'] = t
+
+    def check_layout(self, other):
+        if (other.keys, other.buckets) != (self.keys, self.buckets):
+            raise ValueError("partitioned by {} into {} buckets, not {} into {}".format(
+                list(self.keys), self.buckets, list(other.keys), other.buckets))
+
+    def merge(self, other):
+        self.check_layout(other)
+        for path, other_entry in other.files.items():
+            entry = self.files.get(path)
+            if entry is None:
+                self.files[path] = dict(other_entry)
+                continue
+            entry['sentences'] += other_entry['sentences']
+            for name, better in ('first', min), ('last', max):
+                values = [v for v in (entry[name], other_entry[name]) if v is not None]
+                entry[name] = better(values) if values else None
+        return self
+
+    def sentence_count(self):
+        return sum(entry['sentences'] for entry in self.files.values())
+
+    def to_dict(self):
+        return {'partitions': list(self.keys), 'buckets': self.buckets,
+                'files': [dict(path=path, **self.files[path]) for path in sorted(self.files)]}
+
+    @classmethod
+    def from_dict(cls, d):
+        result = cls(d['partitions'], d['buckets'])
+        for entry in d['files']:
+            entry = dict(entry)
+            result.files[entry.pop('path')] = entry
+        return result
+
+    @classmethod
+    def load(cls, directory):
+        """Returns the manifest in directory, or None if there isn't one."""
+        path = os.path.join(directory, MANIFEST_NAME)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+    def save(self, directory):
+        path = os.path.join(directory, MANIFEST_NAME)
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.to_dict(), f, indent=1)
+        os.replace(path + '.tmp', path)
+
+
+def _sentences_for_worker(sources, worker, jobs, log_errors):
+    for source in sources:
+        parser = StreamParser(log_errors=log_errors and worker == 0)
+        for line in lines_from_source(source):
+            if jobs > 1:
+                mmsi = peek_mmsi(line)
+                if mmsi is not None and mmsi % jobs != worker:
+                    continue
+            # noinspection PyBroadException
+            try:
+                parser.add(line)
+                if parser.has_sentence():
+                    yield parser.next_sentence()
+            except Exception:
+                logging.getLogger().error("unexpected failure for fragment {} in source {}".format(line, source),
+                                          exc_info=True)
+
+
+def burst_worker(sources, dest, keys, buckets=256, worker=0, jobs=1, max_open=256, compress=False, verbose=False):
+    """Writes this worker's share of the sentences in sources under dest and returns its Manifest."""
+    partitioner = Partitioner(keys, buckets)
+    manifest = Manifest(keys, buckets)
+    ext = '.ais.gz' if compress else '.ais'
+    made = set()
+    pool = WriterPool(max_open, compress=compress)
+    try:
+        for sentence in _sentences_for_worker(sources, worker, jobs, verbose):
+            mmsi = sentence['mmsi']
+            if jobs > 1 and owner_for(mmsi, jobs) != worker:
+                continue
+            if not mmsi:
+                mmsi = OTHER
+            partition = partitioner.partition_for(sentence, mmsi)
+            directory = partitioner.directory_for(partition)
+            if directory not in made:
+                os.makedirs(os.path.join(dest, directory), exist_ok=True)
+                made.add(directory)
+            path = os.path.join(directory, mmsi + ext)
+            pool.write(os.path.join(dest, path), sentence_source_text(sentence))
+            manifest.add(path, mmsi, partition, sentence.time)
+    finally:
+        pool.close()
+    return manifest
+
+
+def _burst_job(sources, dest, keys, buckets, worker, jobs, max_open, compress, verbose):
+    return burst_worker(sources, dest, keys, buckets, worker, jobs, max_open, compress, verbose).to_dict()
+
+
+def burst_partitioned(sources, dest, keys, buckets=256, jobs=1, max_open=256, compress=False, verbose=False):
+    """
+    Splits sources into a partitioned tree under dest, using up to jobs
+    processes, and returns the updated Manifest. Files already there are
+    appended to, so dest must have been partitioned the same way.
+    """
+    manifest = Manifest(keys, buckets)
+    existing = Manifest.load(dest)
+    if existing is not None:
+        existing.check_layout(manifest)
+        manifest = existing
+    os.makedirs(dest, exist_ok=True)
+
+    if jobs == 1:
+        manifest.merge(burst_worker(sources, dest, keys, buckets, 0, 1, max_open, compress, verbose))
+    else:
+        with ProcessPoolExecutor(jobs) as pool:
+            partials = pool.map(_burst_job, repeat(sources, jobs), repeat(dest, jobs), repeat(keys, jobs),
+                                repeat(buckets, jobs), range(jobs), repeat(jobs, jobs), repeat(max_open, jobs),
+                                repeat(compress, jobs), repeat(verbose, jobs))
+            for partial in partials:
+                manifest.merge(Manifest.from_dict(partial))
+    manifest.save(dest)
+    return manifest
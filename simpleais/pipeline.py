@@ -0,0 +1,226 @@
+"""
+Runs per-sentence work, such as aisgrep's filtering and printing, on several
+processes while keeping the output in input order.
+
+There are three parts. read_chunks() reads the sources in this process and
+cuts their lines into numbered chunks. run_ordered() hands the chunks to a
+process pool, where each is parsed, filtered, and formatted. Its
+ReorderBuffer then holds results that finish early until the ones before
+them are done, so they come out in the order they went in. At most
+max_pending chunks are being worked on or waiting at once, so memory stays
+bounded however far ahead the reader could get.
+
+A chunk gives the same sentences as reading the whole source would. Chunks
+never span two sources, and the lines of a multi-part sentence that's still
+incomplete when a chunk is cut are repeated at the start of the next one.
+That way the next worker can finish the sentence, while the earlier one
+never could.
+
+On a live feed, lines can arrive too slowly to fill a chunk for a long
+time. Given max_wait, read_chunks() also cuts a chunk once its first line
+has waited that many seconds, and run_ordered() passes on results while
+it waits for the next chunk rather than only once it arrives.
+"""
+
+import logging
+import sys
+import time
+from collections import defaultdict
+
+from simpleais import FragmentPool, SentenceFragment, StreamParser, aivdm_pattern, lines_from_source, parse_one
+
+CHUNK_LINES = 2000
+
+
+def read_chunks(sources, chunk_lines=CHUNK_LINES, max_wait=None):
+    """
+    Yields (sequence number, list of lines) for the lines of the sources, or
+    stdin if there are none. Given max_wait, a chunk is also cut once its
+    first new line has waited that many seconds, even if no more arrive.
+    """
+    if not sources:
+        sources = [sys.stdin]
+    sequence = 0
+    for source in sources:
+        pools = defaultdict(FragmentPool)
+        pending = defaultdict(list)  # the lines of each radio channel's incomplete sentence
+        chunk = []
+        carried = 0  # how many of the chunk's lines were pending in the last one
+        started = None
+        lines = lines_from_source(source)
+        if max_wait:
+            lines = paced(lines, max_wait)
+        try:
+            for line in lines:
+                full = False
+                if line is not None:
+                    chunk.append(line)
+                    if max_wait and len(chunk) == carried + 1:
+                        started = time.monotonic()
+                    m = aivdm_pattern.search(line)
+                    if m and m.group(2)[7] != '1':
+                        _track_fragment(line, pools, pending)
+                    full = len(chunk) >= chunk_lines
+                if full or (max_wait and len(chunk) > carried and time.monotonic() - started >= max_wait):
+                    yield sequence, chunk
+                    sequence += 1
+                    chunk = [pending_line for channel_lines in pending.values() for pending_line in channel_lines]
+                    carried = len(chunk)
+        except Exception:
+            logging.exception("Unexpected failure with source {}; continuing".format(source))
+        if len(chunk) > sum(len(lines) for lines in pending.values()):
+            yield sequence, chunk
+            sequence += 1
+
+
+def _track_fragment(line, pools, pending):
+    # follows a StreamParser's fragment pools, to know which lines a chunk
+    # cut here would leave incomplete
+    # noinspection PyBroadException
+    try:
+        fragment = parse_one(line)
+    except Exception:
+        return
+    if not isinstance(fragment, SentenceFragment):
+        return
+    channel = fragment.radio_channel
+    pool = pools[channel]
+    pool.add(fragment)
+    if pool.has_full_sentence():
+        pool.pop_full_sentence()
+    if not pool.fragments:
+        pending.pop(channel, None)
+    elif len(pool.fragments) == 1:
+        pending[channel] = [line]
+    else:
+        pending[channel].append(line)
+
+
+def sentences_from_lines(lines, log_errors=False):
+    """Yields the sentences in a chunk of lines, as sentences_from_source does for a source."""
+    parser = StreamParser(log_errors=log_errors)
+    for line in lines:
+        # noinspection PyBroadException
+        try:
+            parser.add(line)
+            if parser.has_sentence():
+                yield parser.next_sentence()
+        except Exception:
+            logging.getLogger().error("unexpected failure for fragment {}".format(line), exc_info=True)
+
+
+def paced(items, interval, read_ahead=10000):
+    """
+    Yields the items, and None whenever interval seconds pass without a new
+    one, so that code batching a live feed gets a chance to pass on a batch
+    that has waited long enough. The items are read in a background thread,
+    at most read_ahead of them before they're asked for.
+    """
+    import queue
+    import threading
+
+    waiting = queue.Queue(maxsize=read_ahead)
+
+    def read():
+        # noinspection PyBroadException
+        try:
+            for item in items:
+                waiting.put((item, None))
+        except BaseException as e:
+            waiting.put((None, e))
+        waiting.put((_FINISHED, None))
+
+    threading.Thread(target=read, name="paced reader", daemon=True).start()
+    while True:
+        try:
+            item, error = waiting.get(timeout=interval)
+        except queue.Empty:
+            yield None
+            continue
+        if error is not None:
+            raise error
+        if item is _FINISHED:
+            return
+        yield item
+
+
+_FINISHED = object()
+
+
+class ReorderBuffer:
+    """Takes results numbered from 0 in any order and releases them in order."""
+
+    def __init__(self):
+        self.next_sequence = 0
+        self.waiting = {}
+
+    def add(self, sequence, result):
+        """Returns the results, possibly none, that are now ready, in order."""
+        self.waiting[sequence] = result
+        ready = []
+        while self.next_sequence in self.waiting:
+            ready.append(self.waiting.pop(self.next_sequence))
+            self.next_sequence += 1
+        return ready
+
+    def __len__(self):
+        return len(self.waiting)
+
+
+_work = None
+
+
+def _start_worker(factory, args):
+    global _work
+    _work = factory(*args)
+
+
+def _run_work(item):
+    return _work(item)
+
+
+def run_ordered(chunks, factory, args=(), jobs=2, max_pending=None, max_wait=None):
+    """
+    Yields factory(*args)(item) for each (sequence, item) in chunks, in
+    sequence order, computed by jobs processes. The factory runs once in
+    each process, so expensive setup such as compiling a filter is done
+    once per process rather than once per chunk; it must be a module-level
+    function and args must pickle. At most max_pending chunks, 4 per job by
+    default, are in the pool or waiting to be yielded. Given max_wait, the
+    chunks are read in the background, and finished results are yielded
+    at least that often while waiting for the next chunk.
+    """
+    from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+    max_pending = max_pending or 4 * jobs
+    buffer = ReorderBuffer()
+    running = {}
+    with ProcessPoolExecutor(jobs, initializer=_start_worker, initargs=(factory, args)) as pool:
+        if max_wait:
+            # start the workers before paced() starts reading threads: a
+            # worker forked while one of them is blocked reading stdin would
+            # hang closing its copy of stdin, whose lock that thread holds
+            pool.submit(int).result()
+        chunks = paced(chunks, max_wait, read_ahead=1) if max_wait else iter(chunks)
+        try:
+            while True:
+                while chunks is not None and len(running) + len(buffer) < max_pending:
+                    try:
+                        chunk = next(chunks)
+                    except StopIteration:
+                        chunks = None
+                        break
+                    if chunk is None:
+                        break
+                    sequence, item = chunk
+                    running[pool.submit(_run_work, item)] = sequence
+                if not running:
+                    if chunks is None:
+                        break
+                    continue
+                done, _ = wait(running, timeout=max_wait, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from buffer.add(running.pop(future), future.result())
+        finally:
+            for future in running:
+                future.cancel()
@@ -0,0 +1,257 @@
+"""
+Refinement: a sort of lossy compression for AIS feeds.
+
+A sentence is kept if it's the first of its type from a vessel in
+BORING_SECONDS, if it's a position report where the speed changed by more
+than BORING_SPEED_CHANGE knots (or dropped to zero), or the course by more
+than BORING_ANGLE degrees while moving at 5 knots or more, or if it's voyage
+data that differs from the last kept. Everything else is dropped.
+
+RefineEngine applies those rules to batches of sentences at once, keeping
+per-vessel state in NumPy arrays. A vessel that has sent nothing kept for
+BORING_SECONDS is forgotten, since by the rules above its next sentence of
+any type will be kept anyway; that keeps memory proportional to the number
+of vessels active recently rather than ever seen.
+"""
+
+import math
+import time
+
+import numpy
+
+from simpleais.pipeline import paced
+from simpleais.refine_rules import BORING_ANGLE, BORING_SECONDS, BORING_SPEED_CHANGE, MOTION_TYPES, VOYAGE_TYPE
+
+# The payload's first character can claim types up to 63, and RefineFilter
+# keeps each apart, defined by the standard or not, so there's a column each.
+TYPE_COUNT = 64
+
+_IS_MOTION = numpy.zeros(TYPE_COUNT, dtype=bool)
+_IS_MOTION[list(MOTION_TYPES)] = True
+
+# name -> (dtype, value for a new vessel)
+_VESSEL_COLUMNS = {
+    'speed': (numpy.float64, math.nan),
+    'course': (numpy.float64, math.nan),
+    'voyage': (numpy.int64, 0),
+    'has_voyage': (bool, False),
+    'last_kept': (numpy.float64, -math.inf),
+}
+
+
+def voyage_key(sentence):
+    """Hashes the voyage fields RefineFilter compares, so they can be kept as one int."""
+    shiptype = sentence['shiptype']
+    return hash((sentence['callsign'], sentence['shipname'], None if shiptype is None else int(shiptype),
+                 sentence['to_bow'], sentence['to_stern'], sentence['to_port'], sentence['to_starboard'],
+                 sentence['draught'], sentence['destination']))
+
+
+class RefineEngine:
+    """
+    Decides which sentences to keep, a batch at a time.
+
+    State is one row per vessel: the time each message type was last kept,
+    the speed and course of the last kept position report, and a hash of the
+    last kept voyage data. A batch is handled in rounds, each round taking at
+    most one sentence per vessel, so a vessel's sentences still see each
+    other's effects in order while everything within a round is computed with
+    array operations.
+
+    Forgetting idle vessels assumes the feed's times never go backwards by
+    more than a moment; that holds for live feeds and time-ordered files.
+    """
+
+    BORING_SECONDS = BORING_SECONDS
+    BORING_ANGLE = BORING_ANGLE
+    BORING_SPEED_CHANGE = BORING_SPEED_CHANGE
+
+    def __init__(self, capacity=1024, evict_interval=600):
+        self.evict_interval = evict_interval
+        self.rows = {}
+        self.size = 0
+        self.keys = [None] * capacity
+        self.last_seen = numpy.full((capacity, TYPE_COUNT), math.nan)
+        self.columns = {name: numpy.full(capacity, fill, dtype) for name, (dtype, fill) in _VESSEL_COLUMNS.items()}
+        self.now = None
+        self.last_eviction = None
+
+    def __len__(self):
+        return self.size
+
+    def _grow(self, needed):
+        capacity = max(needed, 2 * len(self.keys))
+        self.keys.extend([None] * (capacity - len(self.keys)))
+        self.last_seen = self._resized(self.last_seen, (capacity, TYPE_COUNT), math.nan)
+        for name, (dtype, fill) in _VESSEL_COLUMNS.items():
+            self.columns[name] = self._resized(self.columns[name], capacity, fill)
+
+    def _resized(self, array, shape, fill):
+        result = numpy.full(shape, fill, array.dtype)
+        result[:self.size] = array[:self.size]
+        return result
+
+    def _rows_for(self, keys):
+        rows = self.rows
+        result = numpy.empty(len(keys), dtype=numpy.intp)
+        for i, key in enumerate(keys):
+            row = rows.get(key)
+            if row is None:
+                if self.size == len(self.keys):
+                    self._grow(self.size + 1)
+                row = rows[key] = self.size
+                self.keys[row] = key
+                self.size += 1
+            result[i] = row
+        return result
+
+    def wants(self, keys, type_ids, times, speeds, courses, voyages):
+        """
+        Takes one batch as parallel columns and returns a boolean array of the
+        sentences to keep, updating the state as if they'd been kept in order.
+        keys identify vessels (usually the MMSI); speeds and courses are NaN
+        where missing, and courses fall back to the heading; voyages are
+        voyage_key() values, used only for voyage data sentences.
+        """
+        count = len(keys)
+        result = numpy.zeros(count, dtype=bool)
+        if not count:
+            return result
+        rows = self._rows_for(keys)
+        type_ids = numpy.asarray(type_ids, dtype=numpy.intp)
+        times = numpy.asarray(times, dtype=numpy.float64)
+        speeds = numpy.asarray(speeds, dtype=numpy.float64)
+        courses = numpy.asarray(courses, dtype=numpy.float64)
+        voyages = numpy.asarray(voyages, dtype=numpy.int64)
+
+        # rank each sentence among those from the same vessel; round n takes rank n
+        order = numpy.argsort(rows, kind='stable')
+        sorted_rows = rows[order]
+        starts = numpy.concatenate(([True], sorted_rows[1:] != sorted_rows[:-1]))
+        group_start = numpy.maximum.accumulate(numpy.where(starts, numpy.arange(count), 0))
+        ranks = numpy.empty(count, dtype=numpy.intp)
+        ranks[order] = numpy.arange(count) - group_start
+
+        if ranks.max() == 0:
+            result[:] = self._round(rows, type_ids, times, speeds, courses, voyages)
+        else:
+            by_rank = numpy.argsort(ranks, kind='stable')
+            bounds = numpy.searchsorted(ranks[by_rank], numpy.arange(ranks.max() + 2))
+            for start, end in zip(bounds[:-1], bounds[1:]):
+                i = by_rank[start:end]
+                result[i] = self._round(rows[i], type_ids[i], times[i], speeds[i], courses[i], voyages[i])
+
+        batch_end = numpy.nanmax(times)
+        if self.now is None or batch_end > self.now:
+            self.now = batch_end
+        if self.last_eviction is None:
+            self.last_eviction = self.now
+        elif self.now - self.last_eviction >= self.evict_interval:
+            self.evict(self.now)
+        return result
+
+    def _round(self, rows, type_ids, times, speeds, courses, voyages):
+        c = self.columns
+        last = self.last_seen[rows, type_ids]
+        with numpy.errstate(invalid='ignore'):
+            wanted = numpy.isnan(last) | (times - last > self.BORING_SECONDS)
+
+            motion = _IS_MOTION[type_ids] & ~wanted
+            if motion.any():
+                recorded_speed = c['speed'][rows]
+                speed_change = numpy.abs(speeds - recorded_speed)
+                stopped = (speeds == 0.0) & (speeds != recorded_speed) & ~numpy.isnan(recorded_speed)
+                difference = numpy.abs(courses - c['course'][rows])
+                difference = numpy.where(difference <= 180, difference, numpy.abs(360 - difference))
+                turned = (speeds >= 5.0) & (difference > self.BORING_ANGLE)
+                wanted |= motion & ((speed_change > self.BORING_SPEED_CHANGE) | stopped | turned)
+
+            voyage = (type_ids == VOYAGE_TYPE) & ~wanted
+            if voyage.any():
+                wanted |= voyage & ~(c['has_voyage'][rows] & (c['voyage'][rows] == voyages))
+
+        kept = rows[wanted]
+        kept_types = type_ids[wanted]
+        kept_times = times[wanted]
+        self.last_seen[kept, kept_types] = kept_times
+        c['last_kept'][kept] = numpy.maximum(c['last_kept'][kept], kept_times)
+        kept_motion = _IS_MOTION[kept_types]
+        c['speed'][kept[kept_motion]] = speeds[wanted][kept_motion]
+        c['course'][kept[kept_motion]] = courses[wanted][kept_motion]
+        kept_voyage = kept_types == VOYAGE_TYPE
+        c['voyage'][kept[kept_voyage]] = voyages[wanted][kept_voyage]
+        c['has_voyage'][kept[kept_voyage]] = True
+        return wanted
+
+    def evict(self, now):
+        """Forgets vessels with nothing kept for more than BORING_SECONDS before now."""
+        self.last_eviction = now
+        live = numpy.flatnonzero(self.columns['last_kept'][:self.size] >= now - self.BORING_SECONDS)
+        if len(live) == self.size:
+            return
+        self.last_seen[:len(live)] = self.last_seen[live]
+        self.last_seen[len(live):self.size] = math.nan
+        for name, (dtype, fill) in _VESSEL_COLUMNS.items():
+            column = self.columns[name]
+            column[:len(live)] = column[live]
+            column[len(live):self.size] = fill
+        self.keys = [self.keys[i] for i in live.tolist()]
+        self.rows = {key: row for row, key in enumerate(self.keys)}
+        self.size = len(self.keys)
+        self.keys.extend([None] * (len(self.columns['speed']) - self.size))
+
+    def refine(self, sentences, batch_size=500, max_wait=None):
+        """
+        Yields the sentences worth keeping, in their original order. Given
+        max_wait, as for a live feed, a batch is also refined once its first
+        sentence has waited that many seconds, even if no more arrive.
+        """
+        if max_wait:
+            sentences = paced(sentences, max_wait)
+        batch = []
+        started = None
+        for sentence in sentences:
+            if sentence is not None:
+                if not sentence.time:
+                    yield from self._refine_batch(batch)
+                    raise ValueError("time  needed for refinement in {}".format(sentence))
+                batch.append(sentence)
+                if max_wait and len(batch) == 1:
+                    started = time.monotonic()
+            if len(batch) >= batch_size or (batch and max_wait and time.monotonic() - started >= max_wait):
+                yield from self._refine_batch(batch)
+                batch = []
+        yield from self._refine_batch(batch)
+
+    def _refine_batch(self, sentences):
+        if not sentences:
+            return
+        keys = []
+        type_ids = []
+        times = []
+        speeds = []
+        courses = []
+        voyages = []
+        for sentence in sentences:
+            type_id = sentence.type_id()
+            keys.append(sentence['mmsi'])
+            type_ids.append(type_id)
+            times.append(sentence.time)
+            speed = course = math.nan
+            voyage = 0
+            if type_id in MOTION_TYPES:
+                speed = sentence['speed']
+                course = sentence['course']
+                if course is None:
+                    course = sentence['heading']
+                speed = math.nan if speed is None else speed
+                course = math.nan if course is None else course
+            elif type_id == VOYAGE_TYPE:
+                voyage = voyage_key(sentence)
+            speeds.append(speed)
+            courses.append(course)
+            voyages.append(voyage)
+        wanted = self.wants(keys, type_ids, times, speeds, courses, voyages)
+        for sentence, keep in zip(sentences, wanted.tolist()):
+            if keep:
+                yield sentence
@@ -0,0 +1,12 @@
+"""
+The thresholds of the refine rules, shared by RefineFilter in tools and
+RefineEngine in refine. They're kept apart from RefineEngine so that
+RefineFilter can use them without loading NumPy.
+"""
+
+BORING_SECONDS = 4 * 3600
+BORING_ANGLE = 45
+BORING_SPEED_CHANGE = 2.0
+
+MOTION_TYPES = (1, 2, 3, 18, 19)
+VOYAGE_TYPE = 5
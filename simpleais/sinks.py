@@ -0,0 +1,541 @@
+"""
+Places to send AIS text, from stdout and rotating capture files to network
+clients, plus a pacer for sending it on a schedule.
+
+Sinks are file-like: they take text through write(), push it out on flush(),
+and release resources on close(). Anything else with those three methods, such
+as an open file or sys.stdout, can be used wherever a sink is expected.
+"""
+
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+# logging, gzip, and socket are imported where they're used, as aiscat and
+# friends, which start often, need only OutputSink.
+
+# Largest UDP payload we'll send; keeps datagrams under a typical 1500-byte MTU.
+UDP_DATAGRAM_SIZE = 1400
+# where TCP servers listen when no host is given
+LOCAL_HOST = '127.0.0.1'
+
+
+def _split_address(address):
+    host, _, port = address.rpartition(':')
+    return host, int(port)
+
+
+class TcpServerSink:
+    """
+    Serves text to every client connected to a local TCP port.
+
+    The address is [HOST:]PORT. Without a host, the server listens on
+    127.0.0.1 only; give a host, such as 0.0.0.0 for every interface, to
+    serve other machines.
+
+    Each client gets its own sender thread and a bounded queue, so a slow reader
+    can't hold up the others. A client whose queue fills up is disconnected,
+    unless blocking is set, in which case flush() waits for it instead; that
+    suits as-fast-as-possible runs, where the slowest client sets the pace.
+    """
+
+    def __init__(self, address, client_queue_size=1024, blocking=False):
+        import socket
+
+        host, port = _split_address(address)
+        host = host or LOCAL_HOST
+        self.client_queue_size = client_queue_size
+        self.blocking = blocking
+        self.buffer = []
+        self.clients = set()
+        self.lock = threading.Lock()
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind((host, port))
+        self.server.listen(128)
+        self.address = self.server.getsockname()
+        self.closed = False
+        self.acceptor = threading.Thread(target=self._accept, name="tcp-accept-{}".format(port), daemon=True)
+        self.acceptor.start()
+
+    def _accept(self):
+        while not self.closed:
+            try:
+                connection, peer = self.server.accept()
+            except OSError:
+                break
+            client = _TcpClient(self, connection, peer, self.client_queue_size, self.blocking)
+            with self.lock:
+                self.clients.add(client)
+            import logging
+            logging.getLogger().info("client connected: {}".format(peer))
+
+    def _drop(self, client):
+        with self.lock:
+            self.clients.discard(client)
+
+    def client_count(self):
+        with self.lock:
+            return len(self.clients)
+
+    def wait_for_clients(self, count, timeout=None):
+        """Waits until at least count clients are connected; returns whether they are."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.client_count() < count:
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def write(self, text):
+        self.buffer.append(text)
+
+    def flush(self):
+        if not self.buffer:
+            return
+        data = "".join(self.buffer).encode('ascii')
+        self.buffer.clear()
+        with self.lock:
+            clients = list(self.clients)
+        for client in clients:
+            client.send(data)
+
+    def close(self, timeout=5):
+        self.flush()
+        self.closed = True
+        self.server.close()
+        with self.lock:
+            clients = list(self.clients)
+        for client in clients:
+            client.finish(timeout)
+
+
+class _TcpClient:
+    def __init__(self, sink, connection, peer, queue_size, blocking):
+        self.sink = sink
+        self.connection = connection
+        self.peer = peer
+        self.blocking = blocking
+        self.closed = False
+        self.queue = queue.Queue(queue_size)
+        self.thread = threading.Thread(target=self._send_loop, name="tcp-client-{}".format(peer), daemon=True)
+        self.thread.start()
+
+    def send(self, data):
+        if self.blocking:
+            while not self.closed:
+                try:
+                    self.queue.put(data, timeout=0.1)
+                    return
+                except queue.Full:
+                    pass
+            return
+        try:
+            self.queue.put_nowait(data)
+        except queue.Full:
+            import logging
+            logging.getLogger().warning("client {} fell behind; disconnecting".format(self.peer))
+            self.close()
+
+    def finish(self, timeout):
+        """Sends whatever is queued, then disconnects."""
+        try:
+            self.queue.put(None, timeout=timeout)
+            self.thread.join(timeout)
+        except queue.Full:
+            pass
+        if self.thread.is_alive():
+            self.close()
+
+    def close(self):
+        import socket
+
+        self.closed = True
+        self.sink._drop(self)
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            pass
+        try:
+            self.connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def _send_loop(self):
+        try:
+            while True:
+                data = self.queue.get()
+                if data is None:
+                    break
+                self.connection.sendall(data)
+        except OSError:
+            import logging
+            logging.getLogger().info("client disconnected: {}".format(self.peer))
+        finally:
+            self.closed = True
+            self.sink._drop(self)
+            self.connection.close()
+
+
+class UdpSink:
+    """
+    Sends text as UDP datagrams, packing as many whole lines into each datagram
+    as will fit. Addresses ending in .255 are sent as broadcasts.
+    """
+
+    def __init__(self, address):
+        import socket
+
+        self.address = _split_address(address)
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if self.address[0].endswith('.255'):
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+        self.buffer = []
+
+    def write(self, text):
+        self.buffer.append(text)
+
+    def flush(self):
+        if not self.buffer:
+            return
+        lines = "".join(self.buffer).splitlines(True)
+        self.buffer.clear()
+        datagram = []
+        size = 0
+        for line in lines:
+            if size + len(line) > UDP_DATAGRAM_SIZE and datagram:
+                self._send(datagram)
+                datagram = []
+                size = 0
+            datagram.append(line)
+            size += len(line)
+        if datagram:
+            self._send(datagram)
+
+    def _send(self, lines):
+        try:
+            self.socket.sendto("".join(lines).encode('ascii'), self.address)
+        except OSError:
+            import logging
+            logging.getLogger().warning("failed to send to {}".format(self.address), exc_info=True)
+
+    def close(self):
+        self.flush()
+        self.socket.close()
+
+
+class OutputSink:
+    """
+    Writes text to a file, usually stdout, in large chunks rather than a line
+    at a time.
+
+    Text is held until buffer_size characters are waiting, which suits files
+    and pipes. With flush_interval, a background thread also writes out
+    whatever is waiting every flush_interval seconds, so tailing a live feed
+    still shows each sentence promptly. When the reader goes away, the
+    BrokenPipeError is raised once, from write(), flush(), or close(); the
+    file is then pointed at /dev/null so the interpreter doesn't complain
+    again at exit. close() leaves the file itself open.
+    """
+
+    def __init__(self, file, flush_interval=None, buffer_size=64 * 1024):
+        self.file = file
+        self.buffer_size = buffer_size
+        self.buffer = []
+        self.size = 0
+        self.lock = threading.Lock()
+        self.error = None
+        self.stopping = threading.Event()
+        self.flusher = None
+        if flush_interval:
+            self.flusher = threading.Thread(target=self._flush_every, args=(flush_interval,),
+                                            name="output-flush", daemon=True)
+            self.flusher.start()
+
+    def write(self, text):
+        with self.lock:
+            if self.error:
+                raise self.error
+            self.buffer.append(text)
+            self.size += len(text)
+            if self.size >= self.buffer_size:
+                self._write_out()
+
+    def flush(self):
+        with self.lock:
+            if self.error:
+                raise self.error
+            self._write_out()
+
+    def close(self):
+        if self.flusher:
+            self.stopping.set()
+            self.flusher.join()
+            self.flusher = None
+        if self.error is None:
+            self.flush()
+
+    def _write_out(self):
+        if not self.buffer:
+            return
+        text = "".join(self.buffer)
+        self.buffer.clear()
+        self.size = 0
+        try:
+            self.file.write(text)
+            self.file.flush()
+        except BrokenPipeError as e:
+            self.error = e
+            self._discard_output()
+            raise
+
+    def _discard_output(self):
+        try:
+            devnull = os.open(os.devnull, os.O_WRONLY)
+            os.dup2(devnull, self.file.fileno())
+            os.close(devnull)
+        except (AttributeError, OSError, ValueError):
+            pass
+
+    def _flush_every(self, interval):
+        while not self.stopping.wait(interval):
+            with self.lock:
+                try:
+                    self._write_out()
+                except BrokenPipeError:
+                    return
+
+
+class WriterPool:
+    """
+    Appends text to any number of files while keeping at most max_open of
+    them open at once, closing the least recently used when it needs another.
+
+    Each open file has a write buffer of up to buffer_size characters, which is
+    written out when it fills and when the file is closed, so memory use is at
+    most max_open * buffer_size. With compress, files are written as gzip;
+    each time a file is reopened it gets another gzip member, which gzip and
+    zcat read as one stream.
+    """
+
+    def __init__(self, max_open=256, buffer_size=64 * 1024, compress=False):
+        if max_open < 1:
+            raise ValueError("max_open must be at least 1")
+        self.max_open = max_open
+        self.buffer_size = buffer_size
+        self.compress = compress
+        self.writers = OrderedDict()
+        self.opened_count = 0
+
+    def write(self, path, text):
+        writer = self.writers.get(path)
+        if writer is None:
+            writer = self._open(path)
+        else:
+            self.writers.move_to_end(path)
+        writer.buffer.append(text)
+        writer.size += len(text)
+        if writer.size >= self.buffer_size:
+            writer.flush()
+
+    def _open(self, path):
+        while len(self.writers) >= self.max_open:
+            _, oldest = self.writers.popitem(last=False)
+            oldest.close()
+        if self.compress:
+            import gzip
+            file = gzip.open(path, 'at')
+        else:
+            file = open(path, 'at')
+        self.opened_count += 1
+        writer = self.writers[path] = _BufferedWriter(file)
+        return writer
+
+    def open_count(self):
+        return len(self.writers)
+
+    def flush(self):
+        for writer in self.writers.values():
+            writer.flush()
+
+    def close(self):
+        while self.writers:
+            _, writer = self.writers.popitem(last=False)
+            writer.close()
+
+
+class _BufferedWriter:
+    def __init__(self, file):
+        self.file = file
+        self.buffer = []
+        self.size = 0
+
+    def flush(self):
+        if self.buffer:
+            self.file.write("".join(self.buffer))
+            self.buffer.clear()
+            self.size = 0
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+class RotatingSink:
+    """
+    Writes text to a series of files in a directory, for long-running
+    captures. A new file is started every rotate period, 'hour' or 'day' in
+    UTC, and whenever one reaches max_size characters. Files only change
+    between writes, so text should come in whole lines.
+
+    Files are named prefix-period.ais, as in ais-2016-01-10T13.ais, with -1,
+    -2, and so on added when the name is taken. Each is written as
+    name.part and renamed when finished, so a file without .part is
+    complete. With compress, a background thread gzips finished files to
+    name.gz and removes the originals, so writing never waits on it; close()
+    waits for it to catch up. finished lists the complete files, in order.
+    """
+
+    PERIODS = {'hour': (3600, "%Y-%m-%dT%H"), 'day': (86400, "%Y-%m-%d")}
+
+    def __init__(self, directory, rotate='hour', max_size=None, compress=False, prefix='ais', clock=time.time):
+        if rotate is not None and rotate not in self.PERIODS:
+            raise ValueError("rotate must be one of {}, or None".format(", ".join(sorted(self.PERIODS))))
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.rotate = rotate
+        self.max_size = max_size
+        self.prefix = prefix
+        self.clock = clock
+        self.file = None
+        self.path = None
+        self.size = 0
+        self.rotate_at = None
+        self.finished = []
+        self.compressor = None
+        if compress:
+            self.to_compress = queue.Queue()
+            self.compressor = threading.Thread(target=self._compress_loop, name="capture-gzip", daemon=True)
+            self.compressor.start()
+
+    def write(self, text):
+        if self.file is None or (self.rotate_at is not None and self.clock() >= self.rotate_at):
+            self._start()
+        self.file.write(text)
+        self.size += len(text)
+        if self.max_size and self.size >= self.max_size:
+            self._finish()
+
+    def flush(self):
+        if self.file:
+            self.file.flush()
+
+    def close(self):
+        if self.file:
+            self._finish()
+        if self.compressor:
+            self.to_compress.put(None)
+            self.compressor.join()
+            self.compressor = None
+
+    def _start(self):
+        if self.file:
+            self._finish()
+        now = self.clock()
+        if self.rotate:
+            seconds, period_format = self.PERIODS[self.rotate]
+            start = now - now % seconds
+            self.rotate_at = start + seconds
+            period = time.strftime(period_format, time.gmtime(start))
+        else:
+            period = time.strftime("%Y-%m-%dT%H%M%S", time.gmtime(now))
+        self.path = self._unused_path(period)
+        self.file = open(self.path + '.part', 'w')
+        self.size = 0
+
+    def _unused_path(self, period):
+        base = os.path.join(self.directory, "{}-{}".format(self.prefix, period))
+        path = base + '.ais'
+        number = 0
+        while any(os.path.exists(path + suffix) for suffix in ('', '.part', '.gz', '.gz.part')):
+            number += 1
+            path = "{}-{}.ais".format(base, number)
+        return path
+
+    def _finish(self):
+        self.file.close()
+        self.file = None
+        os.replace(self.path + '.part', self.path)
+        if self.compressor:
+            self.to_compress.put(self.path)
+        else:
+            self.finished.append(self.path)
+
+    def _compress_loop(self):
+        import gzip
+        import shutil
+
+        while True:
+            path = self.to_compress.get()
+            if path is None:
+                break
+            try:
+                with open(path, 'rb') as source, gzip.open(path + '.gz.part', 'wb') as dest:
+                    shutil.copyfileobj(source, dest, 1024 * 1024)
+                os.replace(path + '.gz.part', path + '.gz')
+                os.remove(path)
+                self.finished.append(path + '.gz')
+            except OSError:
+                import logging
+                logging.getLogger().warning("failed to compress {}".format(path), exc_info=True)
+
+
+class Pacer:
+    """
+    Releases timed items on a wall-clock schedule.
+
+    An item stamped t is due at start + (t - first_t) / speed. Rather than
+    sleeping once per item, the pacer hands back everything that is already due
+    as one batch and then sleeps once until the next item is due, so throughput
+    doesn't depend on how precisely the OS can sleep. A speed of None means as
+    fast as possible. Gaps in the timestamps longer than max_gap seconds are
+    shortened to max_gap. Items without a timestamp are due immediately.
+    """
+
+    def __init__(self, speed=1.0, max_gap=None, max_batch=10000, clock=time.monotonic, sleep=time.sleep):
+        self.speed = speed
+        self.max_gap = max_gap
+        self.max_batch = max_batch
+        self.clock = clock
+        self.sleep = sleep
+
+    def batches(self, timed_items):
+        batch = []
+        start = None
+        first = None
+        last = None
+        for t, item in timed_items:
+            if self.speed and t is not None:
+                if first is None:
+                    start = self.clock()
+                    first = last = t
+                if self.max_gap is not None and t - last > self.max_gap:
+                    first += t - last - self.max_gap
+                last = max(last, t)
+                due = start + (t - first) / self.speed
+                now = self.clock()
+                if due > now:
+                    if batch:
+                        yield batch
+                        batch = []
+                        now = self.clock()
+                    if due > now:
+                        self.sleep(due - now)
+            batch.append(item)
+            if len(batch) >= self.max_batch:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
@@ -1,23 +1,28 @@
-import functools
-import logging
 import math
 import os
 import re
 import sys
 from collections import defaultdict
 from contextlib import contextmanager
-from copy import copy
+from itertools import repeat
 from math import radians, sin, atan2, sqrt, cos
+from stat import S_ISREG
 from time import localtime
 from time import strftime
 
 import click
-import numpy
-from dateutil.parser import parse as dateutil_parse
 
-from simpleais import sentences_from_source
+from simpleais import _decoder_for_type, sentence_source_text, sentences_from_source
+from simpleais.expressions import compile_expression, parse_expression
+from simpleais.refine_rules import BORING_ANGLE, BORING_SECONDS, BORING_SPEED_CHANGE, MOTION_TYPES, VOYAGE_TYPE
+
+# NumPy, the maps, sketches, and refine modules that use it, dateutil, and
+# process pools are imported where they're used, so that short runs of tools
+# that don't need them start quickly.
 
 _RADIUS_OF_EARTH = 6373.0
+# how often printed output is flushed when the input may be a live feed
+FLUSH_INTERVAL = 0.25
 
 
 @contextmanager
@@ -33,20 +38,38 @@ def time_to_text(t):
 
 
 def print_sentence_source(sentence, file=None):
-    text = sentence.text
-    if isinstance(text, str):
-        text = [text]
-    for line in text:
-        if sentence.time:
-            output = "{:.3f} {}".format(sentence.time, line)
-        else:
-            output = line
+    if file:
+        file.write(sentence_source_text(sentence))
+    else:
+        # noinspection PyArgumentList
+        print(sentence_source_text(sentence), end='', flush=True)
+
+
+def reads_live(sources):
+    """Says whether any of the sources, or stdin if there are none, might be a live feed rather than a file."""
+    if not sources:
+        try:
+            return not S_ISREG(os.fstat(sys.stdin.fileno()).st_mode)
+        except (AttributeError, OSError, ValueError):
+            return False
+    return not all(os.path.isfile(source) for source in sources)
 
-        if file:
-            print(output, file=file)
-        else:
-            # noinspection PyArgumentList
-            print(output, flush=True)
+
+def choose_flush_interval(flush_interval, sources):
+    """
+    Returns the interval for an OutputSink given a --flush-interval option:
+    if it wasn't given, FLUSH_INTERVAL when reading what might be a live
+    feed and None, full buffering, when reading files; 0 also means None.
+    """
+    if flush_interval is None:
+        return FLUSH_INTERVAL if reads_live(sources) else None
+    return flush_interval or None
+
+
+def output_sink(file=None, flush_interval=FLUSH_INTERVAL):
+    from simpleais.sinks import OutputSink
+
+    return OutputSink(file or sys.stdout, flush_interval)
 
 
 def sentences_from_sources(sources, log_errors=False):
@@ -55,7 +78,8 @@ def sentences_from_sources(sources, log_errors=False):
             try:
                 for sentence in sentences_from_source(source, log_errors):
                     yield sentence
-            except:
+            except Exception:
+                import logging
                 logging.exception("Unexpected failure with source {}; continuing".format(source))
     else:
         for sentence in sentences_from_source(sys.stdin, log_errors):
@@ -65,18 +89,147 @@ def sentences_from_sources(sources, log_errors=False):
 @click.command()
 @click.argument('sources', nargs=-1)
 @click.option('--verbose', is_flag=True)
-def cat(sources, verbose):
-    """ Prints out all complete AIS transmissions.  """
-    for sentence in sentences_from_sources(sources, log_errors=verbose):
-        with wild_disregard_for(BrokenPipeError):
-            print_sentence_source(sentence)
+@click.option('--flush-interval', type=float)
+@click.option('--capture', 'capture_directory', type=click.Path(file_okay=False))
+@click.option('--rotate', type=click.Choice(['hour', 'day', 'none']), default='hour')
+@click.option('--max-size', type=int)
+@click.option('--gzip', 'compress', is_flag=True)
+@click.option('--jobs', '-j', type=int, default=1)
+def cat(sources, verbose, flush_interval=None, capture_directory=None, rotate='hour', max_size=None, compress=False,
+        jobs=1):
+    """ Prints out all complete AIS transmissions.
+
+    With --capture DIRECTORY, writes them to files there instead, starting a
+    new one every --rotate period (UTC) and every --max-size megabytes.
+    Files are named like ais-2016-01-10T13.ais, end in .part until they're
+    finished, and with --gzip are compressed once finished.
+
+    With --jobs N, N processes parse the input, a chunk at a time, and the
+    output stays in input order.
+    """
+    flush_interval = choose_flush_interval(flush_interval, sources)
+    if jobs <= 1:
+        cat_sentences(sentences_from_sources(sources, log_errors=verbose), flush_interval,
+                      capture_directory, rotate, max_size, compress)
+        return
+    capture = open_capture(capture_directory, rotate, max_size, compress) if capture_directory else None
+    try:
+        print_in_parallel(sources, jobs, chunk_texts, (None, verbose), flush_interval, file=capture)
+    finally:
+        if capture:
+            capture.close()
+
+
+def cat_sentences(sentences, flush_interval=FLUSH_INTERVAL, capture_directory=None, rotate='hour', max_size=None,
+                  compress=False):
+    """Prints the sentences as cat does, or with capture_directory writes them to a RotatingSink there."""
+    if not capture_directory:
+        return print_sentences(sentences, flush_interval=flush_interval)
+    capture = open_capture(capture_directory, rotate, max_size, compress)
+    try:
+        print_sentences(sentences, capture, flush_interval)
+    finally:
+        capture.close()
+
+
+def open_capture(capture_directory, rotate='hour', max_size=None, compress=False):
+    """Returns a RotatingSink for cat's --capture options, with max_size in megabytes."""
+    from simpleais.sinks import RotatingSink
+
+    return RotatingSink(capture_directory, None if rotate == 'none' else rotate,
+                        max_size * 1024 * 1024 if max_size else None, compress)
+
+
+def print_sentences(sentences, file=None, flush_interval=FLUSH_INTERVAL):
+    """
+    Prints the sentences as they were read, through an OutputSink, so output
+    goes out in large chunks, and at least every flush_interval seconds if
+    that's set. If the reader goes away, printing stops quietly.
+    """
+    sink = output_sink(file, flush_interval)
+    with wild_disregard_for(BrokenPipeError):
+        try:
+            for sentence in sentences:
+                sink.write(sentence_source_text(sentence))
+        finally:
+            sink.close()
+
+
+def print_in_parallel(sources, jobs, factory, args, flush_interval=None, max=None, file=None):
+    """
+    Reads the sources a chunk at a time and prints, in input order, what
+    factory(*args) returns for each chunk, a list of text per sentence, with
+    the chunks spread over jobs processes; see simpleais.pipeline. With max,
+    stops after that many sentences. With flush_interval, as for a live
+    feed, chunks are also cut and passed on at that interval.
+    """
+    from simpleais.pipeline import read_chunks, run_ordered
+
+    sink = output_sink(file, flush_interval)
+    printed = 0
+    with wild_disregard_for(BrokenPipeError):
+        results = run_ordered(read_chunks(sources, max_wait=flush_interval), factory, args, jobs,
+                              max_wait=flush_interval)
+        try:
+            for texts in results:
+                if max and printed + len(texts) >= max:
+                    sink.write("".join(texts[:max - printed]))
+                    break
+                printed += len(texts)
+                sink.write("".join(texts))
+        finally:
+            results.close()
+            sink.close()
+
+
+def chunk_texts(grep_options, log_errors=False):
+    """
+    For print_in_parallel: returns a function giving the text cat prints
+    for each sentence in a chunk of lines, or with grep_options, a dict of
+    grep's options, the text grep prints.
+    """
+    from simpleais.pipeline import sentences_from_lines
+
+    likes = grep_taster(**grep_options).likes if grep_options is not None else None
+
+    def texts(lines):
+        sentences = sentences_from_lines(lines, log_errors)
+        if likes is not None:
+            sentences = filter(likes, sentences)
+        return [sentence_source_text(sentence) for sentence in sentences]
+
+    return texts
+
+
+def chunk_json(fields, compact_enums=False):
+    """For print_in_parallel: returns a function giving the JSON for a chunk of lines, as write_json writes it."""
+    import io
+    from simpleais.export import NdjsonWriter
+    from simpleais.pipeline import sentences_from_lines
+
+    output = io.StringIO()
+    writer = NdjsonWriter(output, fields or None, compact_enums)
+
+    def texts(lines):
+        writer.write_all(sentences_from_lines(lines))
+        result = output.getvalue()
+        output.seek(0)
+        output.truncate()
+        return [result]
+
+    return texts
 
 
 class Taster(object):
-    pass
+    """
+    Decides which sentences aisgrep prints. The criteria become a filter
+    expression (see simpleais.expressions), all of them true or any of them
+    true depending on mode, which is compiled once; expression can add
+    criteria written in that language.
+    """
 
     def __init__(self, mmsi=None, sentence_type=None, vessel_class=None, lon=None, lat=None, field=None, value=None,
-                 before=None, after=None, mode='and', checksum=None, invert_match=False):
+                 before=None, after=None, mode='and', checksum=None, invert_match=False, expression=None):
         self.mmsi = mmsi
         self.sentence_type = sentence_type
         self.vessel_class = vessel_class
@@ -86,55 +239,49 @@ class Taster(object):
         self.value = value
         self.before = before
         self.after = after
-        if mode == 'and' or mode is None:
-            self.default_result = [True]
-            self.reducer = lambda x, y: x and y
-        elif mode == 'or':
-            self.default_result = [False]
-            self.reducer = lambda x, y: x or y
-        else:
+        if mode not in ('and', 'or', None):
             raise ValueError("unknown mode {}".format(mode))
+        self.mode = mode or 'and'
         self.checksum = checksum
         self.invert_match = invert_match
+        self.expression = self._expression(expression)
+        self.likes = compile_expression(self.expression)
 
-    def likes(self, sentence):
-        factors = copy(self.default_result)
+    def _expression(self, expression):
+        criteria = []
         if self.mmsi:
-            factors.append(sentence['mmsi'] in self.mmsi)
+            mmsi = [self.mmsi] if isinstance(self.mmsi, str) else self.mmsi
+            criteria.append(('in', 'mmsi', tuple(str(m) for m in mmsi)))
         if self.sentence_type:
-            factors.append(sentence.type_id() in self.sentence_type)
+            criteria.append(('in', 'type', tuple(self.sentence_type)))
         if self.vessel_class:
-            if self.vessel_class == 'a':
-                factors.append(sentence.type_id() in [1, 2, 3, 5])
-            elif self.vessel_class == 'b':
-                factors.append(sentence.type_id() in [18, 19, 24])
-        if self.lon or self.lat:
-            loc = sentence.location()
-            if self.lon:
-                factors.append(loc is not None and self.lon[0] <= loc[0] <= self.lon[1])
-            if self.lat:
-                factors.append(loc is not None and self.lat[0] <= loc[1] <= self.lat[1])
-        if self.field:
-            for f in self.field:
-                factors.append(sentence[f] is not None)
-        if self.value:
-            for f, v in self.value:
-                factors.append(sentence[f] == v or str(sentence[f]) == str(v))
+            criteria.append(('compare', '=', 'class', self.vessel_class))
+        if self.lon:
+            criteria.append(('between', 'lon', self.lon[0], self.lon[1]))
+        if self.lat:
+            criteria.append(('between', 'lat', self.lat[0], self.lat[1]))
+        for f in self.field or ():
+            criteria.append(('present', f))
+        for f, v in self.value or ():
+            # --value FIELD None has always matched sentences without the field
+            criteria.append(('not', ('present', f)) if v == 'None' else ('compare', '=', f, v))
         if self.before:
-            factors.append(sentence.time <= self.before)
+            criteria.append(('compare', '<=', 'received_at', self.before))
         if self.after:
-            factors.append(self.after <= sentence.time)
+            criteria.append(('compare', '>=', 'received_at', self.after))
         if self.checksum is not None:
-            factors.append(sentence.check() == self.checksum)
-        result = functools.reduce(self.reducer, factors)
+            criteria.append(('compare', '=', 'valid_checksum', self.checksum))
+        if expression:
+            criteria.append(parse_expression(expression) if isinstance(expression, str) else expression)
+        result = (self.mode, criteria)
         if self.invert_match:
-            return not result
-        else:
-            return result
+            result = ('not', result)
+        return result
 
 
 def parse_date(string):
     if string:
+        from dateutil.parser import parse as dateutil_parse
         return int(dateutil_parse(string).strftime("%s"))
     else:
         return None
@@ -154,14 +301,59 @@ def parse_date(string):
 @click.option('--after')
 @click.option('--checksum', type=click.Choice(['valid', 'invalid']))
 @click.option('--mode', type=click.Choice(['and', 'or']))
+@click.option('--expression', '-e')
 @click.option('--invert-match', '-v', is_flag=True)
 @click.option('--max-count', 'max', type=int)
 @click.option('--verbose', is_flag=True)
+@click.option('--flush-interval', type=float)
+@click.option('--jobs', '-j', type=int, default=1)
 def grep(sources, mmsi=None, mmsi_file=None, sentence_type=None, vessel_class=None, lon=None, lat=None,
          value=None, before=None, after=None, field=None, checksum=None,
-         mode='and', invert_match=False, max=None, verbose=False):
-    """ Filters AIS transmissions.  """
-    print(f'mmsi={mmsi}', file=sys.stderr)
+         mode='and', expression=None, invert_match=False, max=None, verbose=False, flush_interval=None, jobs=1):
+    """ Filters AIS transmissions.
+
+    Besides the options, --expression takes criteria like
+    "type in (1, 2, 3) and speed > 10 and lat between 50 and 60"; see
+    simpleais.expressions for the details. It's combined with the other
+    options according to --mode. With --jobs N, N processes do the work, a
+    chunk at a time, and the output stays in input order.
+    """
+    if jobs > 1:
+        options = dict(mmsi=mmsi, mmsi_file=mmsi_file, sentence_type=sentence_type, vessel_class=vessel_class,
+                       lon=lon, lat=lat, value=value, before=before, after=after, field=field, checksum=checksum,
+                       mode=mode, expression=expression, invert_match=invert_match)
+        grep_taster(**options)  # so bad options are reported before any work starts
+        print_in_parallel(sources, jobs, chunk_texts, (options, verbose),
+                          choose_flush_interval(flush_interval, sources), max)
+        return
+    print_sentences(grep_sentences(sentences_from_sources(sources, log_errors=verbose), mmsi, mmsi_file,
+                                   sentence_type, vessel_class, lon, lat, value, before, after, field, checksum,
+                                   mode, expression, invert_match, max),
+                    flush_interval=choose_flush_interval(flush_interval, sources))
+
+
+def grep_sentences(sentences, mmsi=None, mmsi_file=None, sentence_type=None, vessel_class=None, lon=None, lat=None,
+                   value=None, before=None, after=None, field=None, checksum=None,
+                   mode='and', expression=None, invert_match=False, max=None):
+    """Returns an iterator of the sentences that grep, given the same options, would print."""
+    taster = grep_taster(mmsi, mmsi_file, sentence_type, vessel_class, lon, lat, value, before, after, field,
+                         checksum, mode, expression, invert_match)
+
+    def matching():
+        matches = 0
+        for sentence in sentences:
+            if taster.likes(sentence):
+                yield sentence
+                matches += 1
+                if max and matches >= max:
+                    break
+
+    return matching()
+
+
+def grep_taster(mmsi=None, mmsi_file=None, sentence_type=None, vessel_class=None, lon=None, lat=None, value=None,
+                before=None, after=None, field=None, checksum=None, mode='and', expression=None, invert_match=False):
+    """Returns the Taster for grep's options."""
     if not mmsi:
         mmsi = frozenset()
     if mmsi_file:
@@ -171,17 +363,11 @@ def grep(sources, mmsi=None, mmsi_file=None, sentence_type=None, vessel_class=No
         checksum_desire = None
     else:
         checksum_desire = checksum == "valid"
-    taster = Taster(mmsi, sentence_type, vessel_class, lon, lat, field, value, parse_date(before), parse_date(after),
-                    mode, checksum_desire, invert_match)
-    print(taster.mmsi, file=sys.stderr)
-    with wild_disregard_for(BrokenPipeError):
-        matches = 0
-        for sentence in sentences_from_sources(sources, log_errors=verbose):
-            if taster.likes(sentence):
-                print_sentence_source(sentence)
-                matches += 1
-                if max and matches >= max:
-                    break
+    try:
+        return Taster(mmsi, sentence_type, vessel_class, lon, lat, field, value, parse_date(before),
+                      parse_date(after), mode, checksum_desire, invert_match, expression)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='--expression')
 
 
 def read_mmsi_file(mmsi_file):
@@ -193,11 +379,23 @@ def read_mmsi_file(mmsi_file):
 @click.argument('sources', nargs=-1)
 @click.option('--verbose', is_flag=True)
 @click.option('--raw', is_flag=True)
-def as_text(sources, verbose, raw):
+@click.option('--flush-interval', type=float)
+def as_text(sources, verbose, raw, flush_interval=None):
     """ Simple text display, one line per AIS sentence. """
-    for sentence in sentences_from_sources(sources, log_errors=verbose):
-        with wild_disregard_for(BrokenPipeError):
-            print(text_for(sentence, raw))
+    print_texts(sentences_from_sources(sources, log_errors=verbose), raw,
+                flush_interval=choose_flush_interval(flush_interval, sources))
+
+
+def print_texts(sentences, raw=False, file=None, flush_interval=FLUSH_INTERVAL):
+    """Prints each sentence's text_for() line, buffered as print_sentences does."""
+    formatter = TextFormatter(raw)
+    sink = output_sink(file, flush_interval)
+    with wild_disregard_for(BrokenPipeError):
+        try:
+            for sentence in sentences:
+                sink.write(formatter.format(sentence) + '\n')
+        finally:
+            sink.close()
 
 
 def text_for(sentence, raw=False):
@@ -253,27 +451,193 @@ def dimensions_as_text(type_5_sentence):
             type_5_sentence['draught'])
 
 
+class TextFormatter:
+    """
+    Gives the same text as text_for(), but faster, for many sentences.
+
+    For each message type it builds, the first time it sees one, a list of
+    the parts of text_for()'s line that the type can have: a position report
+    gets the location part but no voyage part, static and voyage data the
+    reverse, a base station its time, and so on. The fields those parts use
+    are decoded together, once per sentence, by a FieldPlan, which shifts
+    most of them straight out of the payload bits; checks for fields the
+    type doesn't have are left out altogether.
+    """
+
+    FIELDS = ('mmsi', 'dest_mmsi', 'name', 'lon', 'lat', 'speed', 'course', 'heading', 'shipname',
+              'to_bow', 'to_stern', 'to_port', 'to_starboard', 'draught', 'destination', 'month', 'day', 'hour',
+              'minute', 'partno', 'time')
+
+    def __init__(self, raw=False):
+        self.raw = raw
+        self.formatters = {}
+        self.last_second = None
+        self.last_second_text = None
+
+    def format(self, sentence):
+        formatter = self.formatters.get(sentence.type_num)
+        if formatter is None:
+            formatter = self.formatters[sentence.type_num] = self._formatter_for(sentence.type_num)
+        return formatter(sentence)
+
+    def _time_text(self, t):
+        # runs of sentences arrive within the same second, and strftime is slow
+        second = t // 1
+        if second != self.last_second:
+            self.last_second = second
+            self.last_second_text = time_to_text(t)
+        return self.last_second_text
+
+    def _formatter_for(self, type_num):
+        from simpleais.export import FieldPlan
+
+        decoder = _decoder_for_type(type_num)
+        present = [name for name in self.FIELDS if name in decoder]
+        plan = FieldPlan(present)
+        # values get a None added at the end, where fields the type doesn't have point
+        index = {name: i for i, name in enumerate(present)}
+        at = lambda name: index.get(name, -1)
+        has = index.__contains__
+
+        parts = []
+        if self.raw:
+            parts.append(lambda sentence, v: "{:.3f}".format(sentence.time) if sentence.time else None)
+        else:
+            parts.append(lambda sentence, v: self._time_text(sentence.time) if sentence.time else None)
+
+        type_text = "{:2}".format(type_num)
+        parts.append(lambda sentence, v: type_text)
+        mmsi = at('mmsi')
+        parts.append(lambda sentence, v: "{:9}".format(str(v[mmsi])))
+
+        if has('dest_mmsi'):
+            dest_mmsi = at('dest_mmsi')
+            parts.append(lambda sentence, v: "-> {:9}".format(str(v[dest_mmsi])) if v[dest_mmsi] else None)
+
+        if type_num == 21:
+            name = at('name')
+            parts.append(lambda sentence, v: "{}".format(v[name]))
+
+        if has('lon') and has('lat'):
+            parts.append(self._location_part(at))
+
+        if has('shipname'):
+            shipname = at('shipname')
+            parts.append(lambda sentence, v: v[shipname] if v[shipname] else None)
+
+        if has('to_bow'):
+            to_bow, to_stern, to_port, to_starboard, draught = [
+                at(n) for n in ('to_bow', 'to_stern', 'to_port', 'to_starboard', 'draught')]
+
+            def dimensions(sentence, v):
+                if v[to_bow] and v[to_bow] > 0:
+                    return "({}x{}x{}m)".format(v[to_bow] + v[to_stern], v[to_port] + v[to_starboard], v[draught])
+
+            parts.append(dimensions)
+
+        if has('destination') or type_num in (12, 14, 24):
+            # a FieldPlan's text is the sentence's, so safety messages' text field is decoded on its own
+            text = decoder.field('text').decode if 'text' in decoder else lambda sentence: None
+            parts.append(self._voyage_part(type_num, at, text))
+
+        if has('time'):
+            reported = at('time')
+            parts.append(lambda sentence, v: time_to_text(v[reported]) if v[reported] else None)
+
+        def formatter(sentence):
+            _, values = plan.names_and_values(sentence)
+            values.append(None)
+            return " ".join([text for text in [part(sentence, values) for part in parts] if text is not None])
+
+        return formatter
+
+    @staticmethod
+    def _location_part(at):
+        lon, lat, speed, course, heading = [at(n) for n in ('lon', 'lat', 'speed', 'course', 'heading')]
+
+        def location(sentence, v):
+            if not (v[lon] and v[lat]):
+                return None
+            result = ["{:9.4f} {:9.4f}".format(v[lon], v[lat])]
+            if v[speed] and v[speed] < 102.3:
+                result.append("{}kn".format(v[speed]))
+            if v[course] and v[course] < 360:
+                if v[heading] and v[heading] < 360:
+                    result.append("{}°/{}°".format(v[course], v[heading]))
+                else:
+                    result.append("{}°".format(v[course]))
+            return " ".join(result)
+
+        return location
+
+    @staticmethod
+    def _voyage_part(type_num, at, text):
+        destination, minute, month, day, hour, partno, shipname = [
+            at(n) for n in ('destination', 'minute', 'month', 'day', 'hour', 'partno', 'shipname')]
+
+        def voyage(sentence, v):
+            if v[destination]:
+                if v[minute] and v[minute] < 60:
+                    return "-> {} at {}/{} {}:{:02d}".format(v[destination], v[month], v[day], v[hour], v[minute])
+                return "-> {}".format(v[destination])
+            elif type_num in (12, 14):
+                return "{}".format(text(sentence))
+            elif type_num == 24 and v[partno] == 0:
+                return "{}".format(v[shipname])
+
+        return voyage
+
+
 @click.command()
-@click.argument('source', nargs=1)
-@click.argument('dest', nargs=1, required=False)
+@click.argument('paths', nargs=-1, required=True)
+@click.option('--partition', '-p', type=click.Choice(['mmsi', 'day', 'hour', 'type']), multiple=True)
+@click.option('--buckets', type=int, default=256)
+@click.option('--jobs', '-j', type=int, default=1)
+@click.option('--max-open', type=int, default=256)
+@click.option('--gzip', 'compress', is_flag=True)
 @click.option('--verbose', is_flag=True)
-def burst(source, dest, verbose):
-    """ Takes large AIS files and splits them up by sender. """
-    if not dest:
-        dest = source
-    writers = {}
-    fname, ext = os.path.splitext(dest)
+def burst(paths, partition, buckets, jobs, max_open, compress, verbose):
+    """ Takes large AIS files and splits them up by sender.
+
+    Given SOURCE [DEST], writes DEST-MMSI files next to DEST, or SOURCE if
+    there's no DEST. With --partition, takes SOURCE... DIRECTORY and writes
+    DIRECTORY/key=value/.../MMSI.ais for each key given, in order, plus a
+    manifest.json; --jobs splits the work between processes by sender,
+    each of which reads all of the input and skips other senders' lines.
+
+    At most --max-open files are open at once; the least recently used is
+    closed when another is needed. With --gzip, each file is compressed and
+    gets .gz added to its name.
+    """
+    from simpleais.sinks import WriterPool
 
-    for sentence in sentences_from_source(source, log_errors=verbose):
-        mmsi = sentence['mmsi']
-        if not mmsi:
-            mmsi = 'other'
-        if mmsi not in writers:
-            writers[mmsi] = open("{}-{}{}".format(fname, mmsi, ext), "at")
-        print_sentence_source(sentence, writers[mmsi])
+    if partition:
+        from simpleais.partitions import burst_partitioned
 
-    for writer in writers.values():
-        writer.close()
+        if len(paths) < 2:
+            raise click.UsageError("--partition needs at least one source and a destination directory")
+        try:
+            burst_partitioned(paths[:-1], paths[-1], partition, buckets, jobs, max_open, compress, verbose)
+        except ValueError as e:
+            raise click.UsageError(str(e))
+        return
+
+    if len(paths) > 2:
+        raise click.UsageError("one source only without --partition")
+    source = paths[0]
+    dest = paths[1] if len(paths) > 1 else source
+    fname, ext = os.path.splitext(dest)
+    if compress:
+        ext += '.gz'
+    pool = WriterPool(max_open, compress=compress)
+    try:
+        for sentence in sentences_from_source(source, log_errors=verbose):
+            mmsi = sentence['mmsi']
+            if not mmsi:
+                mmsi = 'other'
+            pool.write("{}-{}{}".format(fname, mmsi, ext), sentence_source_text(sentence))
+    finally:
+        pool.close()
 
 
 class FieldsHistory:
@@ -284,6 +648,8 @@ class FieldsHistory:
         return self.values[key]
 
     def __setitem__(self, key, value):
+        if value is None:
+            return
         value = value.strip()
         if key and value and len(value) > 0:
             if value not in (self.values[key]):
@@ -292,6 +658,23 @@ class FieldsHistory:
     def __iter__(self):
         return self.values.__iter__()
 
+    def merge(self, other):
+        for key, values in other.values.items():
+            for value in values:
+                if value not in self.values[key]:
+                    self.values[key].append(value)
+        return self
+
+    def to_dict(self):
+        return {key: list(values) for key, values in self.values.items()}
+
+    @classmethod
+    def from_dict(cls, d):
+        result = cls()
+        for key, values in d.items():
+            result.values[key] = list(values)
+        return result
+
 
 class SenderInfo:
     def __init__(self):
@@ -300,6 +683,28 @@ class SenderInfo:
         self.type_counts = defaultdict(int)
         self.fields = FieldsHistory()
 
+    def merge(self, other):
+        if not self.mmsi:
+            self.mmsi = other.mmsi
+        self.sentence_count += other.sentence_count
+        for type_id, count in other.type_counts.items():
+            self.type_counts[type_id] += count
+        self.fields.merge(other.fields)
+        return self
+
+    def to_dict(self):
+        return {'mmsi': self.mmsi, 'sentence_count': self.sentence_count,
+                'type_counts': sorted(self.type_counts.items()), 'fields': self.fields.to_dict()}
+
+    @classmethod
+    def from_dict(cls, d):
+        result = cls()
+        result.mmsi = d['mmsi']
+        result.sentence_count = d['sentence_count']
+        result.type_counts.update((int(t), c) for t, c in d['type_counts'])
+        result.fields = FieldsHistory.from_dict(d['fields'])
+        return result
+
     def add(self, sentence):
         if not self.mmsi:
             self.mmsi = sentence['mmsi']
@@ -335,6 +740,22 @@ class MaxMin:
         if value < self.min:
             self.min = value
 
+    def merge(self, other):
+        if other.valid():
+            self.add(other.min)
+            self.add(other.max)
+        return self
+
+    def to_dict(self):
+        return {'min': self.min, 'max': self.max}
+
+    @classmethod
+    def from_dict(cls, d):
+        result = cls()
+        result.min = d['min']
+        result.max = d['max']
+        return result
+
     def range(self):
         if self.valid:
             return self.max - self.min
@@ -357,6 +778,21 @@ class GeoInfo:
         self.lon.add(point[0])
         self.lat.add(point[1])
 
+    def merge(self, other):
+        self.lon.merge(other.lon)
+        self.lat.merge(other.lat)
+        return self
+
+    def to_dict(self):
+        return {'lon': self.lon.to_dict(), 'lat': self.lat.to_dict()}
+
+    @classmethod
+    def from_dict(cls, d):
+        result = cls()
+        result.lon = MaxMin.from_dict(d['lon'])
+        result.lat = MaxMin.from_dict(d['lat'])
+        return result
+
     def report(self, indent="", file=sys.stdout):
         if not self.valid():
             return
@@ -400,14 +836,25 @@ def distance(p1, p2):
 
 
 class SentencesInfo:
-    def __init__(self, by_type=False):
+    """
+    Overall counts for aisinfo. With approximate, distinct senders are
+    estimated with a HyperLogLog in fixed memory (within about 1.6%, 95% of
+    the time) rather than counted exactly.
+    """
+
+    def __init__(self, by_type=False, approximate=False):
         self.by_type = by_type
+        self.approximate = approximate
         self.sentence_count = 0
         self.bad_checksum_count = 0
         self.time_range = MaxMin()
         if by_type:
             self.type_counts = defaultdict(int)
-        self.sender_counts = defaultdict(int)
+        if approximate:
+            from simpleais.sketches import HyperLogLog
+            self.senders = HyperLogLog()
+        else:
+            self.sender_counts = defaultdict(int)
 
     def add(self, sentence):
         self.sentence_count += 1
@@ -415,17 +862,64 @@ class SentencesInfo:
             self.time_range.add(sentence.time)
         if self.by_type:
             self.type_counts[sentence.type_id()] += 1
-        self.sender_counts[sentence['mmsi']] += 1
+        if self.approximate:
+            self.senders.add(sentence['mmsi'])
+        else:
+            self.sender_counts[sentence['mmsi']] += 1
+
+    def sender_count(self):
+        return len(self.senders) if self.approximate else len(self.sender_counts)
 
     def count_bad_checksum(self):
         self.bad_checksum_count += 1
 
+    def merge(self, other):
+        self.sentence_count += other.sentence_count
+        self.bad_checksum_count += other.bad_checksum_count
+        self.time_range.merge(other.time_range)
+        if self.by_type:
+            for type_id, count in other.type_counts.items():
+                self.type_counts[type_id] += count
+        if self.approximate:
+            self.senders.merge(other.senders)
+        else:
+            for mmsi, count in other.sender_counts.items():
+                self.sender_counts[mmsi] += count
+        return self
+
+    def to_dict(self):
+        result = {'by_type': self.by_type, 'sentence_count': self.sentence_count,
+                  'bad_checksum_count': self.bad_checksum_count, 'time_range': self.time_range.to_dict()}
+        if self.approximate:
+            result['senders'] = self.senders.to_dict()
+        else:
+            result['sender_counts'] = list(self.sender_counts.items())
+        if self.by_type:
+            result['type_counts'] = sorted(self.type_counts.items())
+        return result
+
+    @classmethod
+    def from_dict(cls, d):
+        result = cls(d['by_type'], 'senders' in d)
+        result.sentence_count = d['sentence_count']
+        result.bad_checksum_count = d['bad_checksum_count']
+        result.time_range = MaxMin.from_dict(d['time_range'])
+        if result.by_type:
+            result.type_counts.update((int(t), c) for t, c in d['type_counts'])
+        if result.approximate:
+            from simpleais.sketches import HyperLogLog
+            result.senders = HyperLogLog.from_dict(d['senders'])
+        else:
+            result.sender_counts.update((m, c) for m, c in d['sender_counts'])
+        return result
+
     def report(self, file=sys.stdout):
         if self.sentence_count < 1:
             print("No sentences found.", file=file)
             return
-        print("Found {} senders in {} good sentences with {} invalid ({:0.2f}%).".format(
-            len(self.sender_counts),
+        print("Found {}{} senders in {} good sentences with {} invalid ({:0.2f}%).".format(
+            "about " if self.approximate else "",
+            self.sender_count(),
             self.sentence_count,
             self.bad_checksum_count,
             100.0 * self.bad_checksum_count / (self.sentence_count + self.bad_checksum_count)
@@ -445,135 +939,19 @@ class SentencesInfo:
                 print(file=file)
 
 
-class Bucketer:
-    """Given min, max, and buckets, buckets values"""
-
-    def __init__(self, min_val, max_val, bucket_count):
-        self.min_val = min_val
-        self.max_val = max_val
-        self.bucket_count = bucket_count
-        self.max_buckets = bucket_count - 1
-        if self.min_val == self.max_val:
-            self.bins = numpy.linspace(min_val - 1, max_val + 1, bucket_count + 1)
-        else:
-            self.bins = numpy.linspace(min_val, max_val + sys.float_info.epsilon, bucket_count + 1)
+# positions aisinfo will hold for a map before it decides to re-read the files instead
+MAP_POINT_LIMIT = 2000000
 
-    def bucket(self, value):
-        result = numpy.digitize(value, self.bins) - 1
-
-        # this shouldn't be necessary, but it somehow is
-        if result > self.max_buckets:
-            return self.max_buckets
-        return result
-
-    def __str__(self, *args, **kwargs):
-        return "Bucketer({}, {}, {}, {})".format(self.min_val, self.max_val, self.bucket_count, self.bins)
-
-
-class DensityMap:
-    def __init__(self, width=60, height_scale=0.5, indent=""):
-        self.desired_width = width
-        self.height_scale = height_scale  # terminal characters are about 2x tall as they are wide
-        self.indent = indent
-        self.geo_info = GeoInfo()
-        self.points = []
-        self.marks = []
-        self.cached_height = None
-
-    def add(self, point):
-        self.points.append(point)
-        self.geo_info.add(point)
-        if self.cached_height is not None:
-            self.cached_height = None
-
-    def valid(self):
-        return len(self.points) > 0 and self.geo_info.valid()
-
-    def bucket(self, points):
-        xb = Bucketer(self.geo_info.lon.min, self.geo_info.lon.max, self.width())
-        yb = Bucketer(self.geo_info.lat.min, self.geo_info.lat.max, self.height())
-        result = []
-        for point in points:
-            x = xb.bucket(point[0])
-            y = self.height() - 1 - yb.bucket(point[1])
-            result.append((x, y))
-        return result
-
-    def height(self):
-        if self.cached_height is None:
-            if self.geo_info.valid() and self.geo_info.width() > 0 and self.geo_info.height() > 0:
-                self.cached_height = int(
-                    self.height_scale * self.geo_info.height() * self.width() / self.geo_info.width())
-            else:
-                self.cached_height = int(self.height_scale * self.width())
-        return min(self.desired_width, max(1, self.cached_height))
-
-    def width(self):
-        return self.desired_width
-
-    def to_counts(self):
-        # noinspection PyUnusedLocal
-        results = [[0 for ignored in range(self.width())] for ignored in range(self.height())]
-        if self.geo_info.valid():
-            for x, y in self.bucket(self.points):
-                results[y][x] += 1
-            for x, y in self.bucket(self.marks):
-                results[y][x] = -1
-        return results
-
-    def to_text(self):
-        counts = self.to_counts()
-
-        max_count = max([max(l) for l in counts])
-
-        def value_to_text(value):
-            if value == -1:
-                return "*"
-            elif value == 0:
-                return " "
-            else:
-                c = str(int(9.99999 * value / max_count))
-                if c == '0':
-                    return '.'
-                return c
-
-        output = []
-        header_footer_line = "{}+{}+".format(self.indent, "-" * self.width())
-        output.append(header_footer_line)
-        for row in counts:
-            line = []
-            for col in row:
-                line.append(value_to_text(col))
-            output.append("{}|{}|".format(self.indent, "".join(line)))
-        output.append(header_footer_line)
-        return output
-
-    def show(self, file=sys.stdout):
-        print("\n".join(self.to_text()), file=file)
-
-    def mark(self, point):
-        self.marks.append(point)
-        self.geo_info.add(point)
 
-
-@click.command()
-@click.argument('sources', nargs=-1)
-@click.option('--individual', '-i', is_flag=True)
-@click.option('--map', '-m', "show_map", is_flag=True)
-@click.option('--by-type', '-t', is_flag=True)
-@click.option('--point', '-p', type=(float, float), multiple=True)
-@click.option('--verbose', is_flag=True)
-def info(sources, individual, by_type, show_map, point, verbose):
-    """ Summarizes AIS transmissions. """
-    sentences_info = SentencesInfo(by_type)
+def summarize(sources, by_type=False, individual=False, map_info=None, verbose=False, approximate=False):
+    """
+    Reads sources into a (SentencesInfo, {mmsi: SenderInfo}, GeoInfo) tuple,
+    adding each position to map_info if there is one.
+    """
+    sentences_info = SentencesInfo(by_type, approximate)
     sender_info = defaultdict(SenderInfo)
     geo_info = GeoInfo()
 
-    map_info = DensityMap()
-    if point:
-        for p in point:
-            map_info.mark(p)
-
     for sentence in sentences_from_sources(sources, log_errors=verbose):
         try:
             if not sentence.check():
@@ -585,7 +963,7 @@ def info(sources, individual, by_type, show_map, point, verbose):
             loc = sentence.location()
             if loc:
                 geo_info.add(loc)
-                if show_map:
+                if map_info is not None:
                     map_info.add(loc)
 
             if individual:
@@ -594,6 +972,118 @@ def info(sources, individual, by_type, show_map, point, verbose):
             print("Unexpected failure for sentence", sentence.text, file=sys.stderr)
             raise
 
+    return sentences_info, sender_info, geo_info
+
+
+def fill_map(sources, map_info):
+    for sentence in sentences_from_sources(sources):
+        if sentence.check():
+            loc = sentence.location()
+            if loc:
+                map_info.add(loc)
+    return map_info
+
+
+def map_for_extent(geo_info, marks):
+    """Returns a fixed-size DensityMap that fits the area in geo_info, plus any marks."""
+    from simpleais.maps import DensityMap
+
+    lons = [geo_info.lon.min, geo_info.lon.max] + [m[0] for m in marks]
+    lats = [geo_info.lat.min, geo_info.lat.max] + [m[1] for m in marks]
+    result = DensityMap(bounds=(min(lons), min(lats), max(lons), max(lats)))
+    for mark in marks:
+        result.mark(mark)
+    return result
+
+
+def _summarize_job(source, by_type, individual, bounds, verbose, approximate):
+    from simpleais.maps import DensityMap
+
+    map_info = None if bounds is None else DensityMap(bounds=bounds)
+    sentences_info, sender_info, geo_info = summarize([source], by_type, individual, map_info, verbose, approximate)
+    return sentences_info, dict(sender_info), geo_info, map_info
+
+
+def _map_job(source, bounds):
+    from simpleais.maps import DensityMap
+
+    return fill_map([source], DensityMap(bounds=bounds))
+
+
+def summarize_in_parallel(sources, jobs, by_type=False, individual=False, show_map=False, bounds=None, marks=(),
+                          verbose=False, approximate=False):
+    """
+    Like summarize(), but reads each source in its own process, up to jobs at
+    a time, and merges the results in source order. Also returns the map; if
+    it has no bounds, the sources are read a second time to fill it in.
+    """
+    from simpleais.maps import DensityMap
+
+    sentences_info = SentencesInfo(by_type, approximate)
+    sender_info = defaultdict(SenderInfo)
+    geo_info = GeoInfo()
+    map_info = DensityMap(bounds=bounds)
+    for mark in marks:
+        map_info.mark(mark)
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    count = len(sources)
+    with ProcessPoolExecutor(jobs) as pool:
+        partials = pool.map(_summarize_job, sources, repeat(by_type, count), repeat(individual, count),
+                            repeat(bounds if show_map else None, count), repeat(verbose, count),
+                            repeat(approximate, count))
+        for partial_sentences, partial_senders, partial_geo, partial_map in partials:
+            sentences_info.merge(partial_sentences)
+            for mmsi, partial_sender in partial_senders.items():
+                sender_info[mmsi].merge(partial_sender)
+            geo_info.merge(partial_geo)
+            if partial_map is not None:
+                map_info.merge(partial_map)
+
+        if show_map and not bounds and geo_info.valid():
+            map_info = map_for_extent(geo_info, marks)
+            for partial_map in pool.map(_map_job, sources, repeat(map_info.bounds, count)):
+                map_info.merge(partial_map)
+
+    return sentences_info, sender_info, geo_info, map_info
+
+
+@click.command()
+@click.argument('sources', nargs=-1)
+@click.option('--individual', '-i', is_flag=True)
+@click.option('--map', '-m', "show_map", is_flag=True)
+@click.option('--by-type', '-t', is_flag=True)
+@click.option('--point', '-p', type=(float, float), multiple=True)
+@click.option('--bounds', '-b', type=(float, float, float, float), default=None)
+@click.option('--jobs', '-j', type=int, default=1)
+@click.option('--approximate', '-a', is_flag=True)
+@click.option('--verbose', is_flag=True)
+def info(sources, individual, by_type, show_map, point, bounds, jobs, approximate, verbose):
+    """ Summarizes AIS transmissions.
+
+    The map fits itself to the data, so it keeps every position until the
+    end; for files with more than MAP_POINT_LIMIT positions, it drops them
+    and makes a second pass instead. Given --bounds MIN_LON MIN_LAT MAX_LON
+    MAX_LAT, the map is drawn for that area in one pass with fixed memory.
+    With --jobs N, up to N sources are read at once, each in its own process.
+    With --approximate, the number of senders is estimated in fixed memory.
+    """
+    from simpleais.maps import DensityMap
+
+    if jobs > 1 and sources:
+        sentences_info, sender_info, geo_info, map_info = summarize_in_parallel(
+            sources, jobs, by_type, individual, show_map, bounds, point, verbose, approximate)
+    else:
+        can_reread = not bounds and sources and all(os.path.isfile(s) for s in sources)
+        map_info = DensityMap(bounds=bounds, max_points=MAP_POINT_LIMIT if can_reread else None)
+        for p in point:
+            map_info.mark(p)
+        sentences_info, sender_info, geo_info = summarize(sources, by_type, individual,
+                                                          map_info if show_map else None, verbose, approximate)
+        if map_info.overflowed and geo_info.valid():
+            map_info = fill_map(sources, map_for_extent(geo_info, point))
+
     with wild_disregard_for(BrokenPipeError):
         sentences_info.report(file=sys.stdout)
 
@@ -689,7 +1179,173 @@ def tuple_display(t):
         return "+".join([str(i) for i in t])
 
 
-# TODO: need tab-delimited output format for further parsing
+class ValueCounts(dict):
+    """How many times each value tuple was seen, in the order first seen."""
+
+    def add(self, key):
+        self[key] = self.get(key, 0) + 1
+
+    def merge(self, other):
+        for key, count in other.items():
+            self[key] = self.get(key, 0) + count
+        return self
+
+    def to_dict(self):
+        return {'counts': [[list(key), count] for key, count in self.items()]}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls((tuple(key), count) for key, count in d['counts'])
+
+
+def count_values(sources, fields, verbose=False, top=None):
+    """Counts value tuples exactly, or just the top most frequent ones approximately if top is given."""
+    from simpleais.sketches import TopK
+
+    counts = ValueCounts() if top is None else TopK(top)
+    for sentence in sentences_from_sources(sources, log_errors=verbose):
+        val = value_tuple_for(fields, sentence)
+        if val:
+            counts.add(val)
+    return counts
+
+
+def _count_values_job(source, fields, verbose, top):
+    return count_values([source], fields, verbose, top)
+
+
+def number_for(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def interval_for(sentence, last_times):
+    """Returns the seconds since the last sentence from the same sender, remembering this one's time."""
+    if not sentence.time:
+        return None
+    mmsi = sentence['mmsi']
+    previous = last_times.get(mmsi)
+    last_times[mmsi] = sentence.time
+    if previous is not None:
+        return sentence.time - previous
+
+
+class NumericStats:
+    """A quantile sketch of one numeric field for each value tuple of the grouping fields."""
+
+    def __init__(self, k=200):
+        self.k = k
+        self.sketches = {}
+
+    def add(self, key, value):
+        sketch = self.sketches.get(key)
+        if sketch is None:
+            from simpleais.sketches import KllSketch
+            sketch = self.sketches[key] = KllSketch(self.k)
+        sketch.add(value)
+
+    def merge(self, other):
+        for key, sketch in other.sketches.items():
+            if key in self.sketches:
+                self.sketches[key].merge(sketch)
+            else:
+                self.sketches[key] = sketch
+        return self
+
+    def to_dict(self):
+        return {'k': self.k, 'groups': [[list(key), sketch.to_dict()] for key, sketch in self.sketches.items()]}
+
+    @classmethod
+    def from_dict(cls, d):
+        from simpleais.sketches import KllSketch
+
+        result = cls(d['k'])
+        for key, sketch in d['groups']:
+            result.sketches[tuple(key)] = KllSketch.from_dict(sketch)
+        return result
+
+
+def summarize_numbers(sources, numeric_field, fields=(), verbose=False, firsts=None, last_times=None):
+    """
+    Returns the NumericStats for numeric_field in the sources. For
+    time-interval, the time each sender was last heard is kept in last_times,
+    and if firsts is given, the time and grouping key of each sender's first
+    timed sentence go in it, so that add_first_intervals() can add the
+    intervals that span from one part of the input to the next.
+    """
+    stats = NumericStats()
+    if last_times is None:
+        last_times = {}
+    for sentence in sentences_from_sources(sources, log_errors=verbose):
+        if numeric_field == 'time-interval':
+            value = interval_for(sentence, last_times)
+            if value is None and firsts is not None and sentence.time and sentence['mmsi'] not in firsts:
+                firsts[sentence['mmsi']] = sentence.time, value_tuple_for(fields, sentence) if fields else ()
+        else:
+            value = number_for(value_for(numeric_field, sentence))
+        if value is None:
+            continue
+        key = value_tuple_for(fields, sentence) if fields else ()
+        if key is not None:
+            stats.add(key, value)
+    return stats
+
+
+def add_first_intervals(stats, firsts, last_times):
+    """Adds the intervals from senders' times in last_times to their first times in a later part of the input."""
+    for mmsi, (first, key) in firsts.items():
+        previous = last_times.get(mmsi)
+        if previous is not None and key is not None:
+            stats.add(key, first - previous)
+
+
+def _summarize_numbers_job(source, numeric_field, fields, verbose):
+    firsts = {}
+    last_times = {}
+    stats = summarize_numbers([source], numeric_field, fields, verbose, firsts, last_times)
+    return stats, firsts, last_times
+
+
+QUANTILES = [('p50', 0.5), ('p90', 0.9), ('p99', 0.99)]
+
+
+def print_numeric_stats(stats, fields, output, bins):
+    keys = sorted(stats.sketches)
+    if not keys:
+        return
+    if output == 'tsv':
+        print("\t".join(list(fields) + ['count', 'min'] + [name for name, _ in QUANTILES] + ['max']))
+        for key in keys:
+            sketch = stats.sketches[key]
+            numbers = [sketch.min] + sketch.quantiles([f for _, f in QUANTILES]) + [sketch.max]
+            print("\t".join([str(v) for v in key] + [str(sketch.count)] + [repr(n) for n in numbers]))
+    elif output == 'count':
+        rows = [['', 'count', 'min'] + [name for name, _ in QUANTILES] + ['max']]
+        for key in keys:
+            sketch = stats.sketches[key]
+            numbers = [sketch.min] + sketch.quantiles([f for _, f in QUANTILES]) + [sketch.max]
+            rows.append([tuple_display(key) if fields else 'all', str(sketch.count)] +
+                        ["{:.2f}".format(n) for n in numbers])
+        widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+        for row in rows:
+            print("  ".join([row[0].ljust(widths[0])] + [c.rjust(w) for c, w in zip(row[1:], widths[1:])]))
+    else:
+        for key in keys:
+            if fields:
+                print("{}:".format(tuple_display(key)))
+            counts, edges = stats.sketches[key].histogram(bins)
+            labels = ["{:.2f}".format(e) for e in edges[:-1]]
+            label_width = max(len(l) for l in labels)
+            count_width = max(len(str(c)) for c in counts)
+            largest = max(counts)
+            for label, count in zip(labels, counts):
+                print("{label:>{label_width}}  {count:{count_width}}  {hist}".format(
+                    label=label, count=count, label_width=label_width, count_width=count_width,
+                    hist="*" * int(1 + 40 * count // largest) if count else ""))
+
+
 @click.command()
 @click.argument('sources', nargs=-1)
 @click.option('--field', '-f', 'fields', multiple=True)
@@ -701,19 +1357,69 @@ def tuple_display(t):
 @click.option('--hundredth', 'fields', flag_value='geo-hundredth', multiple=True)
 @click.option('--count', '-c', 'output', flag_value='count', default=True)
 @click.option('--hist', '-h', 'output', flag_value='hist')
+@click.option('--tsv', 'output', flag_value='tsv')
+@click.option('--jobs', '-j', type=int, default=1)
+@click.option('--approximate', '-a', is_flag=True)
+@click.option('--top', type=int, default=100)
+@click.option('--numeric', '-n', 'numeric_field', default=None)
+@click.option('--bins', type=int, default=10)
 @click.option('--verbose', is_flag=True)
-def stat(sources, fields, output, verbose):
+def stat(sources, fields, output, jobs, approximate, top, numeric_field, bins, verbose):
+    """ Counts sentences by the values of the given fields.
+
+    With --approximate, only the --top most frequent values are kept, with
+    counts estimated by a count-min sketch in fixed memory. Estimates are
+    never low, and are rarely high by more than the bound printed to stderr.
+
+    With --numeric FIELD, summarizes a numeric field such as speed or draught
+    instead, for each value of the other fields if any are given: count, min,
+    p50, p90, p99 and max, or a histogram of --bins bins with --hist. The
+    field time-interval is the time since the sender's previous sentence.
+    Quantiles come from a KLL sketch, so they use fixed memory and are
+    approximate once a group has more than a few hundred values.
+
+    --tsv prints the same numbers tab-separated, one column per field, for
+    other programs to read.
+    """
+    if numeric_field:
+        if jobs > 1 and sources:
+            from concurrent.futures import ProcessPoolExecutor
+            stats = NumericStats()
+            last_times = {}
+            with ProcessPoolExecutor(jobs) as pool:
+                for partial, firsts, partial_last_times in pool.map(
+                        _summarize_numbers_job, sources, repeat(numeric_field), repeat(fields), repeat(verbose)):
+                    add_first_intervals(stats, firsts, last_times)
+                    last_times.update(partial_last_times)
+                    stats.merge(partial)
+        else:
+            stats = summarize_numbers(sources, numeric_field, fields, verbose)
+        with wild_disregard_for(BrokenPipeError):
+            print_numeric_stats(stats, fields, output, bins)
+        return
     if not fields or len(fields) < 1:
         raise click.UsageError("at least one field required; try --hour or -f type")
-    counts = defaultdict(int)
-    for sentence in sentences_from_sources(sources, log_errors=verbose):
-        val = value_tuple_for(fields, sentence)
-        if val:
-            counts[val] += 1
+    top = top if approximate else None
+    if jobs > 1 and sources:
+        from concurrent.futures import ProcessPoolExecutor
+        from simpleais.sketches import TopK
+        counts = ValueCounts() if top is None else TopK(top)
+        with ProcessPoolExecutor(jobs) as pool:
+            for partial in pool.map(_count_values_job, sources, repeat(fields), repeat(verbose), repeat(top)):
+                counts.merge(partial)
+    else:
+        counts = count_values(sources, fields, verbose, top)
+    if approximate:
+        print("counts are estimates, likely no more than {:.0f} too high".format(counts.error_bound()),
+              file=sys.stderr)
 
     key_width = max([len(str(tuple_display(k))) for k in counts.keys()], default=0)
     val_width = max([len(str(v)) for v in counts.values()], default=0)
-    if output == 'count':
+    if output == 'tsv':
+        print("\t".join(list(fields) + ['count']))
+        for key in sorted(counts, key=lambda k: counts[k], reverse=True):
+            print("\t".join([str(v) for v in key] + [str(counts[key])]))
+    elif output == 'count':
         for key in sorted(counts, key=lambda k: counts[k], reverse=True):
             print("{key:{key_width}}  {value:{val_width}}".format(
                 key=tuple_display(key), value=counts[key],
@@ -730,9 +1436,15 @@ def stat(sources, fields, output, verbose):
 
 
 class RefineFilter:
-    BORING_SECONDS = 4 * 3600
-    BORING_ANGLE = 45
-    BORING_SPEED_CHANGE = 2.0
+    """
+    The refine rules for a single vessel, one sentence at a time. The refine
+    command uses RefineEngine, which applies the same rules to many vessels at
+    once.
+    """
+
+    BORING_SECONDS = BORING_SECONDS
+    BORING_ANGLE = BORING_ANGLE
+    BORING_SPEED_CHANGE = BORING_SPEED_CHANGE
 
     def __init__(self):
         self.last_seen_by_type = {}
@@ -754,10 +1466,10 @@ class RefineFilter:
         return False
 
     def is_voyage_info(self, sentence):
-        return sentence.type_id() is 5
+        return sentence.type_id() == VOYAGE_TYPE
 
     def is_motion(self, sentence):
-        return sentence.type_id() in [1, 2, 3, 18, 19]
+        return sentence.type_id() in MOTION_TYPES
 
     def motion_interesting(self, sentence):
         current_speed = sentence['speed']
@@ -807,23 +1519,211 @@ class RefineFilter:
 
 @click.command()
 @click.argument('sources', nargs=-1)
-def refine(sources):
-    filters = defaultdict(RefineFilter)
-    for sentence in sentences_from_sources(sources):
-        with wild_disregard_for(BrokenPipeError):
-            filter = filters[sentence['mmsi']]
-            if filter.wants(sentence):
-                print_sentence_source(sentence)
-                filter.mark(sentence)
+@click.option('--flush-interval', type=float)
+def refine(sources, flush_interval=None):
+    """ Drops sentences that add little to what's already known about each vessel. """
+    flush_interval = choose_flush_interval(flush_interval, sources)
+    print_sentences(refine_sentences(sentences_from_sources(sources), flush_interval), flush_interval=flush_interval)
+
+
+def refine_sentences(sentences, max_wait=None):
+    from simpleais.refine import RefineEngine
+
+    return RefineEngine().refine(sentences, max_wait=max_wait)
 
 
 @click.command()
 @click.argument('sources', nargs=-1)
-def to_json(sources):
-    """ Prints out all complete AIS transmissions.  """
-    for sentence in sentences_from_sources(sources):
+@click.option('--fields', '-f', multiple=True)
+@click.option('--compact-enums', is_flag=True)
+@click.option('--jobs', '-j', type=int, default=1)
+def to_json(sources, fields, compact_enums, jobs=1):
+    """ Prints out all complete AIS transmissions as JSON, one per line.
+
+    --fields picks which fields to print, in order; give it more than once
+    or separate names with commas. text is the NMEA lines, and safety_text
+    the decoded text of types 12 and 14. --compact-enums prints enumerated
+    values such as status as just their number. With --jobs N, N processes
+    do the work, a chunk at a time, and the output stays in input order.
+    """
+    if jobs > 1:
+        print_in_parallel(sources, jobs, chunk_json, (_field_names(fields), compact_enums),
+                          choose_flush_interval(None, sources))
+        return
+    write_json(sentences_from_sources(sources), fields, compact_enums)
+
+
+def _field_names(fields):
+    """Splits --fields options into names, raising a UsageError for any that aren't fields."""
+    from simpleais.export import known_fields
+
+    names = [name for option in fields for name in option.split(',') if name]
+    _check_field_names(names, known_fields())
+    return names
+
+
+def _check_field_names(names, known):
+    unknown = [name for name in names if name not in known]
+    if unknown:
+        raise click.UsageError("unknown field{} {}".format('s' if len(unknown) > 1 else '', ", ".join(unknown)))
+
+
+def write_json(sentences, fields=(), compact_enums=False):
+    from simpleais.export import NdjsonWriter
+
+    if fields:
+        fields = _field_names(fields)
+    writer = NdjsonWriter(sys.stdout, fields or None, compact_enums)
+    with wild_disregard_for(BrokenPipeError):
+        writer.write_all(sentences)
+
+
+@click.command()
+@click.argument('sources', nargs=-1)
+@click.option('--fields', '-f', multiple=True, required=True)
+@click.option('--tab', '-t', is_flag=True)
+@click.option('--delimiter', '-d', default=',')
+@click.option('--default', 'defaults', type=(str, str), multiple=True)
+@click.option('--enum-names', is_flag=True)
+@click.option('--no-header', is_flag=True)
+def to_csv(sources, fields, tab, delimiter, defaults, enum_names, no_header):
+    """ Prints the given fields of each sentence as CSV, after a header line.
+
+    Give --fields more than once or separate names with commas; received_at,
+    text (the NMEA lines), and safety_text (the decoded text of types 12 and
+    14) are fields too, and unknown names are an error. --tab gives
+    tab-separated values instead. A field the sentence's type doesn't have is
+    left empty, or takes the value from --default FIELD VALUE. Enumerated
+    values such as status are printed as numbers unless --enum-names is
+    given.
+    """
+    write_delimited(sentences_from_sources(sources), fields, tab, delimiter, defaults, enum_names, no_header)
+
+
+def write_delimited(sentences, fields, tab=False, delimiter=',', defaults=(), enum_names=False, no_header=False):
+    from simpleais.export import DelimitedWriter, known_fields
+
+    fields = _field_names(fields)
+    _check_field_names([name for name, _ in defaults], known_fields())
+    writer = DelimitedWriter(sys.stdout, fields, '\t' if tab else delimiter, dict(defaults), enum_names,
+                             header=not no_header)
+    with wild_disregard_for(BrokenPipeError):
+        writer.write_all(sentences)
+
+
+@click.command()
+@click.option('--vessels', '-n', type=int, default=100)
+@click.option('--count', '-c', type=int)
+@click.option('--duration', type=float)
+@click.option('--speed', type=float, default=1.0)
+@click.option('--fast', is_flag=True)
+@click.option('--seed', type=int)
+@click.option('--duplicates', type=float, default=0.0)
+@click.option('--bad-checksums', type=float, default=0.0)
+@click.option('--junk', type=float, default=0.0)
+@click.option('--output', '-o', multiple=True)
+@click.option('--tcp', multiple=True)
+@click.option('--udp', multiple=True)
+def generate(vessels, count, duration, speed, fast, seed, duplicates, bad_checksums, junk, output, tcp, udp):
+    """ Generates synthetic AIS traffic for load testing.
+
+    Writes to stdout unless given files (--output), local TCP ports to serve
+    on (--tcp [HOST:]PORT), or UDP destinations (--udp HOST:PORT). Runs in
+    real time unless sped up with --speed or --fast; with --fast, the slowest
+    TCP client sets the pace rather than being dropped. TCP ports are served
+    on 127.0.0.1 only unless HOST is given.
+    """
+    from simpleais.generator import TrafficGenerator
+    from simpleais.sinks import Pacer, TcpServerSink, UdpSink
+
+    generator = TrafficGenerator(vessels, seed=seed, duplicate_rate=duplicates, bad_checksum_rate=bad_checksums,
+                                 junk_rate=junk)
+    sinks = [open(o, 'w') for o in output]
+    sinks += [TcpServerSink(t if ':' in t else ':' + t, blocking=fast) for t in tcp]
+    sinks += [UdpSink(u) for u in udp]
+    if not sinks:
+        sinks = [sys.stdout]
+
+    pacer = Pacer(None if fast else speed)
+    try:
         with wild_disregard_for(BrokenPipeError):
-            print(sentence.as_json())
+            for batch in pacer.batches(generator.lines(count, duration)):
+                text = "\n".join(batch) + "\n"
+                for sink in sinks:
+                    sink.write(text)
+                    sink.flush()
+    finally:
+        for sink in sinks:
+            if sink is not sys.stdout:
+                sink.close()
+
+
+def timed_lines(lines):
+    """
+    Pairs each line with its leading receive timestamp, if it has one. Lines
+    without a timestamp inherit the previous line's.
+    """
+    last = None
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if line[:1].isdigit():
+            stamp = line.split(None, 1)[0]
+            try:
+                last = float(stamp)
+            except ValueError:
+                pass
+        yield last, line
+
+
+@click.command()
+@click.argument('sources', nargs=-1)
+@click.option('--tcp', multiple=True)
+@click.option('--udp', multiple=True)
+@click.option('--speed', type=float, default=1.0)
+@click.option('--fast', is_flag=True)
+@click.option('--max-gap', type=float)
+@click.option('--wait-for-clients', type=int, default=0)
+@click.option('--verbose', is_flag=True)
+def replay(sources, tcp, udp, speed, fast, max_gap, wait_for_clients, verbose):
+    """ Replays recorded AIS over TCP and UDP, paced by the recorded times.
+
+    Serves each --tcp [HOST:]PORT to any number of clients, on 127.0.0.1
+    only unless HOST is given, and sends to each --udp HOST:PORT. Plays back
+    in real time unless sped up with --speed or --fast; --max-gap shortens
+    long silences to the given number of seconds.
+    """
+    from simpleais import lines_from_source
+    from simpleais.sinks import Pacer, TcpServerSink, UdpSink
+
+    if not tcp and not udp:
+        raise click.UsageError("at least one --tcp or --udp destination required")
+    if verbose:
+        import logging
+        logging.getLogger().setLevel(logging.INFO)
+    servers = [TcpServerSink(t if ':' in t else ':' + t, blocking=fast) for t in tcp]
+    sinks = servers + [UdpSink(u) for u in udp]
+    if wait_for_clients:
+        for server in servers:
+            server.wait_for_clients(wait_for_clients)
+
+    def all_lines():
+        for source in sources or [sys.stdin]:
+            try:
+                yield from lines_from_source(source)
+            except Exception:
+                import logging
+                logging.exception("Unexpected failure with source {}; continuing".format(source))
+
+    pacer = Pacer(None if fast else speed, max_gap)
+    try:
+        for batch in pacer.batches(timed_lines(all_lines())):
+            text = "\n".join(batch) + "\n"
+            for sink in sinks:
+                sink.write(text)
+                sink.flush()
+    finally:
+        for sink in sinks:
+            sink.close()
 
 
 # used for profiling; call with something like "grep ../tests/sample.ais -t 20"
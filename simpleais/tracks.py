@@ -0,0 +1,365 @@
+"""
+Vessel tracks: position reports grouped by MMSI into NumPy arrays.
+
+A Track holds time, lon, lat, speed and course columns for one vessel, so
+building tracks keeps five numbers per report rather than whole Sentence
+objects. Tracks can be thinned with decimate() (drop reports too close in
+time or distance to the last one kept) or simplify() (Douglas-Peucker with a
+tolerance in metres).
+
+There are two ways to build them. build_tracks() reads everything into one
+set of flat arrays and splits it by MMSI at the end, which is the fast way
+to handle an archive file. stream_tracks() keeps at most max_points reports
+per vessel and hands back track segments as they fill up, so memory stays
+bounded on an endless feed.
+"""
+
+import math
+
+import numpy
+
+from simpleais.fleet import POSITION_TYPES
+
+EARTH_RADIUS_M = 6371000.0
+
+COLUMNS = (
+    ('time', numpy.float64),
+    ('lon', numpy.float64),
+    ('lat', numpy.float64),
+    ('speed', numpy.float32),
+    ('course', numpy.float32),
+)
+
+
+def position_for(sentence):
+    """Returns a (time, lon, lat, speed, course) tuple, or None if the sentence has no vessel position."""
+    if sentence.type_id() not in POSITION_TYPES:
+        return None
+    location = sentence.location()
+    if location is None:
+        return None
+    speed = sentence['speed']
+    course = sentence['course']
+    return (math.nan if sentence.time is None else sentence.time, location[0], location[1],
+            math.nan if speed is None else speed, math.nan if course is None else course)
+
+
+def _xy(lon, lat):
+    """Projects to metres on a plane tangent at the points' mean latitude; fine at track scale."""
+    scale = math.radians(1) * EARTH_RADIUS_M
+    return lon * (scale * math.cos(math.radians(numpy.nanmean(lat)))), lat * scale
+
+
+def douglas_peucker(lon, lat, tolerance):
+    """
+    Returns a boolean mask of the points to keep so that no dropped point is
+    more than tolerance metres from the simplified line. The first and last
+    points are always kept.
+    """
+    count = len(lon)
+    keep = numpy.zeros(count, dtype=bool)
+    if count == 0:
+        return keep
+    keep[0] = keep[-1] = True
+    if count < 3:
+        return keep
+    x, y = _xy(numpy.asarray(lon, dtype=numpy.float64), numpy.asarray(lat, dtype=numpy.float64))
+    stack = [(0, count - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        px = x[first + 1:last]
+        py = y[first + 1:last]
+        dx = x[last] - x[first]
+        dy = y[last] - y[first]
+        length_squared = dx * dx + dy * dy
+        if length_squared == 0:
+            distances = numpy.hypot(px - x[first], py - y[first])
+        else:
+            along = numpy.clip(((px - x[first]) * dx + (py - y[first]) * dy) / length_squared, 0, 1)
+            distances = numpy.hypot(px - (x[first] + along * dx), py - (y[first] + along * dy))
+        worst = int(numpy.argmax(distances))
+        if distances[worst] > tolerance:
+            split = first + 1 + worst
+            keep[split] = True
+            stack.append((first, split))
+            stack.append((split, last))
+    return keep
+
+
+def _distance(lon1, lat1, lon2, lat2):
+    x = math.radians(lon2 - lon1) * math.cos(math.radians((lat1 + lat2) / 2))
+    y = math.radians(lat2 - lat1)
+    return EARTH_RADIUS_M * math.sqrt(x * x + y * y)
+
+
+def _far_enough(last, point, min_interval, min_distance):
+    if min_interval and point[0] - last[0] < min_interval:
+        return False
+    if min_distance and _distance(last[1], last[2], point[1], point[2]) < min_distance:
+        return False
+    return True
+
+
+def decimate(time, lon, lat, min_interval=0, min_distance=0):
+    """
+    Returns a boolean mask keeping each point that is at least min_interval
+    seconds and min_distance metres from the last point kept. The first and
+    last points are always kept.
+    """
+    count = len(time)
+    keep = numpy.zeros(count, dtype=bool)
+    if count == 0:
+        return keep
+    keep[0] = keep[-1] = True
+    if not (min_interval or min_distance):
+        keep[:] = True
+        return keep
+    points = list(zip(time.tolist(), lon.tolist(), lat.tolist()))
+    last = points[0]
+    for i in range(1, count - 1):
+        if _far_enough(last, points[i], min_interval, min_distance):
+            keep[i] = True
+            last = points[i]
+    return keep
+
+
+class Track:
+    """
+    Reports for one vessel, in arrival order. The time, lon, lat, speed and
+    course attributes are views of the filled part of each column; missing
+    speeds, courses and times are NaN.
+    """
+
+    def __init__(self, mmsi, capacity=16):
+        self.mmsi = mmsi
+        self.size = 0
+        self.columns = {name: numpy.empty(capacity, dtype) for name, dtype in COLUMNS}
+
+    @classmethod
+    def from_arrays(cls, mmsi, time, lon, lat, speed, course):
+        result = cls(mmsi, capacity=0)
+        result.columns = {name: numpy.asarray(values, dtype) for (name, dtype), values in
+                          zip(COLUMNS, (time, lon, lat, speed, course))}
+        result.size = len(result.columns['time'])
+        return result
+
+    def __len__(self):
+        return self.size
+
+    def __repr__(self):
+        return "Track({}, {} points)".format(self.mmsi, self.size)
+
+    def append(self, point):
+        """Adds a (time, lon, lat, speed, course) tuple."""
+        if self.size == len(self.columns['time']):
+            self._grow()
+        row = self.size
+        for (name, _), value in zip(COLUMNS, point):
+            self.columns[name][row] = value
+        self.size += 1
+
+    def _grow(self):
+        capacity = max(16, 2 * self.size)
+        for name, dtype in COLUMNS:
+            column = numpy.empty(capacity, dtype)
+            column[:self.size] = self.columns[name][:self.size]
+            self.columns[name] = column
+
+    def last(self):
+        row = self.size - 1
+        return tuple(self.columns[name][row].item() for name, _ in COLUMNS)
+
+    @property
+    def time(self):
+        return self.columns['time'][:self.size]
+
+    @property
+    def lon(self):
+        return self.columns['lon'][:self.size]
+
+    @property
+    def lat(self):
+        return self.columns['lat'][:self.size]
+
+    @property
+    def speed(self):
+        return self.columns['speed'][:self.size]
+
+    @property
+    def course(self):
+        return self.columns['course'][:self.size]
+
+    def select(self, mask):
+        """Returns a new track with just the points where mask is true."""
+        return Track.from_arrays(self.mmsi, *(self.columns[name][:self.size][mask] for name, _ in COLUMNS))
+
+    def simplify(self, tolerance):
+        return self.select(douglas_peucker(self.lon, self.lat, tolerance))
+
+    def decimate(self, min_interval=0, min_distance=0):
+        return self.select(decimate(self.time, self.lon, self.lat, min_interval, min_distance))
+
+    def copy(self):
+        return self.select(slice(None))
+
+
+class TrackBuilder:
+    """
+    Builds tracks one sentence at a time.
+
+    Decimation happens as reports arrive, so dropped reports never take up
+    space; the most recent dropped report is held aside and added at the end
+    so a track always finishes where the vessel was last seen. When max_points
+    is set, a track that fills up is simplified in place if a tolerance is
+    given, and if that doesn't free a quarter of the space, add() returns the
+    filled segment and starts a new one from its last point.
+    """
+
+    def __init__(self, tolerance=None, min_interval=0, min_distance=0, max_points=None):
+        if max_points is not None and max_points < 4:
+            raise ValueError("max_points must be at least 4")
+        self.tolerance = tolerance
+        self.min_interval = min_interval
+        self.min_distance = min_distance
+        self.max_points = max_points
+        self.building = {}
+        self.pending = {}
+
+    def add(self, sentence):
+        point = position_for(sentence)
+        if point is None:
+            return None
+        mmsi = sentence['mmsi']
+        track = self.building.get(mmsi)
+        if track is None:
+            track = self.building[mmsi] = Track(mmsi)
+        elif (self.min_interval or self.min_distance) and \
+                not _far_enough(track.last(), point, self.min_interval, self.min_distance):
+            self.pending[mmsi] = point
+            return None
+        self.pending.pop(mmsi, None)
+        track.append(point)
+        if self.max_points is not None and len(track) >= self.max_points:
+            return self._make_room(mmsi, track)
+        return None
+
+    def _make_room(self, mmsi, track):
+        if self.tolerance is not None:
+            track = self.building[mmsi] = track.simplify(self.tolerance)
+            if len(track) <= self.max_points * 3 // 4:
+                return None
+        restart = Track(mmsi)
+        restart.append(track.last())
+        self.building[mmsi] = restart
+        return track
+
+    def _finish(self, mmsi, track):
+        pending = self.pending.get(mmsi)
+        if pending is not None:
+            track.append(pending)
+        if self.tolerance is not None:
+            track = track.simplify(self.tolerance)
+        return track
+
+    def flush(self):
+        """Returns every track still being built, finished off, and forgets them."""
+        result = [self._finish(mmsi, track) for mmsi, track in self.building.items()]
+        self.building = {}
+        self.pending = {}
+        return result
+
+
+def stream_tracks(sentences, max_points=1000, tolerance=None, min_interval=0, min_distance=0):
+    """
+    Yields track segments of at most max_points points as they fill up, then
+    the remainder of every track once the sentences run out. Consecutive
+    segments for a vessel share an end point, so they join up when drawn.
+    """
+    builder = TrackBuilder(tolerance, min_interval, min_distance, max_points)
+    for sentence in sentences:
+        segment = builder.add(sentence)
+        if segment is not None:
+            yield segment
+    yield from builder.flush()
+
+
+class _PointBuffer:
+    """
+    Reports and their MMSIs for build_tracks(), in NumPy arrays that double
+    when full. Reports are copied in a chunk at a time, so only chunk_points
+    of them are ever held as Python tuples.
+    """
+
+    def __init__(self, chunk_points=4096):
+        self.chunk_points = chunk_points
+        self.mmsis = []
+        self.points = []
+        self.size = 0
+        self.mmsi_column = numpy.empty(chunk_points, numpy.uint32)
+        self.columns = numpy.empty((chunk_points, len(COLUMNS)), numpy.float64)
+
+    def add(self, mmsi, point):
+        self.mmsis.append(mmsi)
+        self.points.append(point)
+        if len(self.points) >= self.chunk_points:
+            self._store()
+
+    def _store(self):
+        count = len(self.points)
+        if not count:
+            return
+        end = self.size + count
+        if end > len(self.mmsi_column):
+            capacity = max(end, 2 * len(self.mmsi_column))
+            self.mmsi_column = numpy.resize(self.mmsi_column, capacity)
+            self.columns = numpy.resize(self.columns, (capacity, len(COLUMNS)))
+        self.mmsi_column[self.size:end] = self.mmsis
+        self.columns[self.size:end] = self.points
+        self.size = end
+        self.mmsis = []
+        self.points = []
+
+    def finish(self):
+        """Returns the MMSI column and the report columns, one row per column of COLUMNS."""
+        self._store()
+        return self.mmsi_column[:self.size], self.columns[:self.size].T
+
+
+def build_tracks(sentences, tolerance=None, min_interval=0, min_distance=0, sort=True):
+    """
+    Returns a dict of MMSI -> Track for every vessel position in sentences.
+
+    Reports are gathered into flat columns and split by MMSI in one go at the
+    end. With sort, each track is put in time order; otherwise it keeps the
+    order the reports arrived in.
+    """
+    buffer = _PointBuffer()
+    for sentence in sentences:
+        point = position_for(sentence)
+        if point is not None:
+            buffer.add(int(sentence['mmsi']), point)
+    mmsi_column, columns = buffer.finish()
+    if not len(mmsi_column):
+        return {}
+
+    if sort:
+        order = numpy.lexsort((columns[0], mmsi_column))
+    else:
+        order = numpy.argsort(mmsi_column, kind='stable')
+    mmsi_column = mmsi_column[order]
+    columns = columns[:, order]
+    starts = numpy.flatnonzero(numpy.diff(mmsi_column)) + 1
+    bounds = zip(numpy.concatenate(([0], starts)), numpy.concatenate((starts, [len(mmsi_column)])))
+
+    result = {}
+    for start, end in bounds:
+        mmsi = "%09i" % mmsi_column[start]
+        track = Track.from_arrays(mmsi, *columns[:, start:end])
+        if min_interval or min_distance:
+            track = track.decimate(min_interval, min_distance)
+        if tolerance is not None:
+            track = track.simplify(tolerance)
+        result[mmsi] = track
+    return result
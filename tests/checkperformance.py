@@ -1,58 +1,282 @@
+"""
+Reproducible benchmarks for simpleais.
+
+Builds deterministic corpora from tests/sample.ais, times the main library
+paths and every command-line tool against them, and writes the results as
+JSON so that runs can be compared with a stored baseline:
+
+    python tests/checkperformance.py --output baseline.json
+    # ...make changes...
+    python tests/checkperformance.py --baseline baseline.json
+
+Without --output the JSON goes to stdout, and the comparison table and
+progress go to stderr, so a run against a baseline can itself be saved.
+
+Throughput is reported as lines/s (input lines) and sentences/s (complete
+sentences). Each case is timed several times and the best run is kept;
+peak memory is measured on a separate run under tracemalloc so that the
+tracing overhead doesn't distort the timings.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
 import time
-from collections import defaultdict
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from simpleais import aivdm_pattern, fragments_from_source, nmea_checksum, sentences_from_source
+from simpleais import tools
+
+SAMPLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sample.ais')
+POSITION_TYPES = {1, 2, 3, 18, 19, 27}
+STATIC_TYPES = {5, 24}
+JUNK_LINES = ['garbage data', '', '$GPGGA,123519,4807.038,N,01131.000,E,1,08,0.9,545.4,M,46.9,M,,*47',
+              '!AIVDM,1,1,,A,', 'AIVDM,1,1,,B,15N2Wl?P02oRV=nCBrNn3gvJ2@7T,0*12']
+
+
+def sentence_groups(path):
+    """Splits a file into lists of lines, one list per complete sentence."""
+    groups = []
+    pending = []
+    with open(path) as f:
+        for line in f:
+            line = line.rstrip('\n')
+            m = aivdm_pattern.search(line)
+            if not m:
+                continue
+            fields = m.group(2).split(',')
+            count, number = int(fields[1]), int(fields[2])
+            if count == 1:
+                groups.append([line])
+                pending = []
+            else:
+                if number == 1:
+                    pending = []
+                pending.append(line)
+                if number == count:
+                    if len(pending) == count:
+                        groups.append(pending)
+                    pending = []
+    return groups
+
+
+def group_type(group):
+    payload = aivdm_pattern.search(group[0]).group(2).split(',')[5]
+    c = ord(payload[0]) - 48
+    return c - 8 if c > 40 else c
+
+
+def corrupt_checksum(line):
+    m = aivdm_pattern.search(line)
+    message = m.group(2)
+    good = nmea_checksum(message)
+    return line.replace(message, "{}*{:02X}".format(message.split('*')[0], good ^ 0x55))
+
+
+def build_corpora(line_count, seed=0):
+    """Returns deterministic corpora, as lists of lines, keyed by name."""
+    groups = sentence_groups(SAMPLE_FILE)
+    selections = {
+        'position': [g for g in groups if len(g) == 1 and group_type(g) in POSITION_TYPES],
+        'static': [g for g in groups if group_type(g) in STATIC_TYPES],
+        'fragmented': [g for g in groups if len(g) > 1],
+        'mixed': groups,
+    }
+    corpora = {}
+    for name, selection in sorted(selections.items()):
+        rng = random.Random("{}-{}".format(seed, name))
+        lines = []
+        while len(lines) < line_count:
+            lines.extend(rng.choice(selection))
+        corpora[name] = lines
+
+    rng = random.Random("{}-noisy".format(seed))
+    noisy = []
+    while len(noisy) < line_count:
+        roll = rng.random()
+        group = rng.choice(groups)
+        if roll < 0.05:
+            noisy.append(rng.choice(JUNK_LINES))
+        elif roll < 0.10:
+            noisy.extend(corrupt_checksum(l) for l in group)
+        elif roll < 0.13 and len(group) > 1:
+            noisy.extend(group[:-1])  # orphaned fragments
+        else:
+            noisy.extend(group)
+    corpora['noisy'] = noisy
+    return corpora
+
+
+def run_command(command, args):
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        command.main(args, standalone_mode=False)
+
+
+def library_cases(path, sentences):
+    taster = tools.Taster(sentence_type=[1, 2, 3, 18], lat=(30, 40))
+
+    def tokenize():
+        for _ in fragments_from_source(path):
+            pass
+
+    def parse():
+        for _ in sentences_from_source(path):
+            pass
+
+    def decode():
+        for sentence in sentences:
+            for field in sentence.fields():
+                field.value()
 
-from simpleais import lines_from_source, sentences_from_source
+    def as_json():
+        for sentence in sentences:
+            sentence.as_json()
 
+    def taste():
+        for sentence in sentences:
+            taster.likes(sentence)
 
-class Timer:
-    def __enter__(self):
-        self.start = time.clock()
-        return self
+    return [('tokenize', tokenize), ('parse', parse), ('decode', decode), ('as_json', as_json),
+            ('taster', taste)]
 
-    def __exit__(self, *args):
-        self.end = time.clock()
-        self.duration = self.end - self.start
 
+def command_cases(path, scratch):
+    burst_dest = os.path.join(scratch, 'burst.ais')
 
-class Counter:
-    def __init__(self):
-        self.counts = defaultdict(int)
+    def burst():
+        for name in os.listdir(scratch):
+            if name.startswith('burst-'):
+                os.remove(os.path.join(scratch, name))
+        run_command(tools.burst, [path, burst_dest])
 
-    def countChars(self, string):
-        for char in string:
-            self.count(char)
+    return [
+        ('aiscat', lambda: run_command(tools.cat, [path])),
+        ('aisgrep', lambda: run_command(tools.grep, ['-t', '1', '-t', '5', path])),
+        ('aist', lambda: run_command(tools.as_text, [path])),
+        ('aisburst', burst),
+        ('aisinfo', lambda: run_command(tools.info, ['-i', '-t', '-m', path])),
+        ('aisdump', lambda: run_command(tools.dump, [path])),
+        ('aisstat', lambda: run_command(tools.stat, ['-f', 'type', '--hour', path])),
+        ('aisrefine', lambda: run_command(tools.refine, [path])),
+        ('ais2json', lambda: run_command(tools.to_json, [path])),
+    ]
 
-    def count(self, thingy):
-        self.counts[thingy] += 1
 
+def measure(function, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak
 
-counter = Counter()
-filename = '/home/william/projects/simpleais/interval-20160210.ais'
 
+def run(corpora, repeat, only=None, commands=True):
+    results = {}
+    with tempfile.TemporaryDirectory() as scratch:
+        for corpus_name, lines in sorted(corpora.items()):
+            path = os.path.join(scratch, corpus_name + '.ais')
+            with open(path, 'w') as f:
+                f.write("\n".join(lines))
+                f.write("\n")
+            sentences = list(sentences_from_source(path))
 
-def fake_thing():
-    global t1
-    with Timer() as t1:
-        for line in lines_from_source(filename):
-            counter.countChars(line)
+            cases = library_cases(path, sentences)
+            if commands:
+                cases += command_cases(path, scratch)
+            for case_name, function in cases:
+                key = "{}/{}".format(corpus_name, case_name)
+                if only and not any(o in key for o in only):
+                    continue
+                seconds, peak = measure(function, repeat)
+                results[key] = {
+                    'lines': len(lines),
+                    'sentences': len(sentences),
+                    'seconds': round(seconds, 6),
+                    'lines_per_s': round(len(lines) / seconds, 1),
+                    'sentences_per_s': round(len(sentences) / seconds, 1),
+                    'peak_kib': round(peak / 1024, 1),
+                }
+                print("{:24} {:>12,.0f} lines/s {:>12,.0f} sentences/s {:>10,.0f} KiB".format(
+                    key, results[key]['lines_per_s'], results[key]['sentences_per_s'], results[key]['peak_kib']),
+                    file=sys.stderr)
+    return results
 
 
-fake_thing()
+def compare(results, baseline, tolerance, file=None):
+    """Prints a comparison table to file, or stdout, and returns the keys that regressed beyond the tolerance."""
+    regressions = []
+    print("{:24} {:>10} {:>10} {:>8}".format('case', 'sent/s', 'baseline', 'ratio'), file=file)
+    for key in sorted(results):
+        if key not in baseline:
+            continue
+        now = results[key]['sentences_per_s']
+        then = baseline[key]['sentences_per_s']
+        ratio = now / then if then else float('inf')
+        flag = ''
+        if ratio < 1 - tolerance:
+            regressions.append(key)
+            flag = '  <-- slower'
+        print("{:24} {:>10,.0f} {:>10,.0f} {:>8.2f}{}".format(key, now, then, ratio, flag), file=file)
+    return regressions
 
-print("comparison load takes", t1.duration)
 
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--lines', type=int, default=20000, help="lines per corpus")
+    parser.add_argument('--repeat', type=int, default=3, help="timed runs per case; best is kept")
+    parser.add_argument('--seed', default='0', help="seed for corpus generation")
+    parser.add_argument('--only', action='append', help="only run cases whose name contains this")
+    parser.add_argument('--no-commands', action='store_true', help="skip the command-line tools")
+    parser.add_argument('--output', help="write results as JSON to this file")
+    parser.add_argument('--baseline', help="compare against results previously written with --output")
+    parser.add_argument('--tolerance', type=float, default=0.10,
+                        help="allowed fractional slowdown before a case counts as a regression")
+    args = parser.parse_args(argv)
 
-def real_thing():
-    global t2
-    with Timer() as t2:
-        for sentence in sentences_from_source(filename):
-            counter.count(sentence['mmsi'])
+    corpora = build_corpora(args.lines, args.seed)
+    results = run(corpora, args.repeat, args.only, not args.no_commands)
+    report = {
+        'meta': {
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'machine': platform.machine(),
+            'lines': args.lines,
+            'repeat': args.repeat,
+            'seed': args.seed,
+            'created': time.time(),
+        },
+        'results': results,
+    }
 
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        print()
 
-real_thing()
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+        # the JSON goes to stdout without --output, so it can still be saved as a baseline
+        if compare(results, baseline, args.tolerance, None if args.output else sys.stderr):
+            return 1
+    return 0
 
-print("actual load takes    ", t2.duration)
 
-print()
-print("expected ratio is ~2")
-print("actual ratio is   ", t2.duration / t1.duration)
+if __name__ == '__main__':
+    sys.exit(main())
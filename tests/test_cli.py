@@ -0,0 +1,78 @@
+import os
+import subprocess
+import sys
+from unittest import TestCase
+
+from click.testing import CliRunner
+
+from simpleais.cli import ais, split_chain
+from simpleais.tools import as_text, grep, to_csv
+
+
+class TestCommands(TestCase):
+    def test_lists_commands(self):
+        result = CliRunner().invoke(ais, ['--help'])
+        self.assertEqual(0, result.exit_code, result.output)
+        for name in ('cat', 'grep', 'text', 'burst', 'info', 'dump', 'stat', 'refine', 'json', 'csv', 'chain'):
+            self.assertIn(name, result.output)
+
+    def test_same_as_tools(self):
+        runner = CliRunner()
+        self.assertEqual(runner.invoke(grep, ['-t', '5', 'tests/sample.ais']).output,
+                         runner.invoke(ais, ['grep', '-t', '5', 'tests/sample.ais']).output)
+
+    def test_imports_tools_only_when_needed(self):
+        code = "import sys, simpleais.cli; print('simpleais.tools' in sys.modules)"
+        output = subprocess.run([sys.executable, '-c', code], stdout=subprocess.PIPE, check=True,
+                                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                universal_newlines=True).stdout
+        self.assertEqual('False', output.strip())
+
+
+class TestChain(TestCase):
+    def test_split(self):
+        self.assertEqual([['read', 'x'], ['grep', '-t', '1'], ['json']],
+                         split_chain(['read', 'x', '+', 'grep', '-t', '1', '|', 'json']))
+
+    def test_matches_pipe(self):
+        runner = CliRunner()
+        grepped = runner.invoke(grep, ['-t', '5', 'tests/sample.ais']).output
+        expected = runner.invoke(as_text, input=grepped).output
+        result = runner.invoke(ais, ['read', 'tests/sample.ais', '+', 'grep', '-t', '5', '+', 'text'])
+        self.assertEqual(0, result.exit_code, result.output)
+        self.assertEqual(expected, result.output)
+
+    def test_sources_on_first_filter(self):
+        runner = CliRunner()
+        grepped = runner.invoke(grep, ['-e', 'type = 5', 'tests/sample.ais']).output
+        expected = runner.invoke(to_csv, ['-f', 'mmsi,shipname'], input=grepped).output
+        result = runner.invoke(ais, ['grep', '-e', 'type = 5', 'tests/sample.ais', '|', 'csv', '-f', 'mmsi,shipname'])
+        self.assertEqual(0, result.exit_code, result.output)
+        self.assertEqual(expected, result.output)
+
+    def test_ends_by_printing(self):
+        runner = CliRunner()
+        expected = runner.invoke(grep, ['-t', '5', '--max-count', '2', 'tests/sample.ais']).output
+        result = runner.invoke(ais, ['chain', 'read', 'tests/sample.ais', '+', 'grep', '-t', '5', '--max-count', '2'])
+        self.assertEqual(0, result.exit_code, result.output)
+        self.assertEqual(expected, result.output)
+
+    def test_flush_interval(self):
+        runner = CliRunner()
+        expected = runner.invoke(grep, ['-t', '5', 'tests/sample.ais']).output
+        for args in (['read', 'tests/sample.ais', '--flush-interval', '0.01', '+', 'grep', '-t', '5'],
+                     ['read', 'tests/sample.ais', '+', 'grep', '-t', '5', '+', 'cat', '--flush-interval', '0']):
+            result = runner.invoke(ais, args)
+            self.assertEqual(0, result.exit_code, result.output)
+            self.assertEqual(expected, result.output)
+
+    def test_bad_chains(self):
+        runner = CliRunner()
+        for args in (['json', '+', 'grep'], ['read', '+', 'info'], ['read', '+', 'grep', 'tests/sample.ais'],
+                     ['read', '+', '+', 'cat'], ['read', '-j', '2', 'tests/sample.ais', '+', 'grep'],
+                     ['read', 'tests/sample.ais', '+', 'grep', '-e', 'bogus > 1'],
+                     ['read', '--capture', '/tmp', 'tests/sample.ais', '+', 'grep'],
+                     ['read', '--gzip', 'tests/sample.ais', '+', 'cat'],
+                     ['read', '--rotate', 'hour', 'tests/sample.ais', '+', 'refine']):
+            result = runner.invoke(ais, args)
+            self.assertEqual(2, result.exit_code, "for {}: {}".format(args, result.output))
@@ -0,0 +1,123 @@
+from itertools import islice
+from unittest import TestCase
+
+from simpleais import Bits, parse, sentences_from_source
+from simpleais.encoder import armor, encode, encode_lines, nmea_lines, rewrite, unarmor
+
+type_1 = '!ABVDM,1,1,,A,15NaEPPP01oR`R6CC?<j@gvr0<1C,0*1F'
+type_5 = ['!AIVDM,2,1,8,A,55Mw0BP00001L=WKC?98uT4j1=@580000000000t1@D5540Ht6?UDp4iSp=<,0*74',
+          '!AIVDM,2,2,8,A,@0000000000,2*5C']
+
+
+def decoded(sentence):
+    return {f.name(): f.value() for f in sentence.fields() if f.name() != 'time' and f.valid()}
+
+
+class TestArmor(TestCase):
+    def test_round_trip(self):
+        payload = '15NaEPPP01oR`R6CC?<j@gvr0<1C'
+        value, length = unarmor(payload)
+        self.assertEqual(168, length)
+        self.assertEqual((payload, 0), armor(value, length))
+
+    def test_fill_bits(self):
+        self.assertEqual(('0', 2), armor(0, 4))
+        self.assertEqual((1, 4), unarmor('4', 2))
+
+    def test_matches_bits(self):
+        payload = '55Mw0BP00001L=WKC?98uT4j1=@58'
+        value, length = unarmor(payload)
+        self.assertEqual(str(parse('!AIVDM,1,1,,A,{},0*00'.format(payload)).message_bits()),
+                         "{:0{}b}".format(value, length))
+
+
+class TestEncode(TestCase):
+    def test_type_1(self):
+        sentence = parse(type_1)
+        payload, fill = encode(1, decoded(sentence))
+        self.assertEqual(28, len(payload))
+        self.assertEqual(0, fill)
+        self.assertEqual(decoded(sentence), decoded(parse(nmea_lines(payload, fill))[0]))
+
+    def test_type_5(self):
+        sentence = parse(type_5)[0]
+        lines = encode_lines(5, decoded(sentence), message_id=8)
+        self.assertEqual(2, len(lines))
+        again = parse(lines)[0]
+        self.assertEqual(decoded(sentence), decoded(again))
+        self.assertTrue(again.check())
+
+    def test_defaults(self):
+        sentence = parse(encode_lines(1, {'mmsi': '367678850'}))[0]
+        self.assertEqual(1, sentence.type_id())
+        self.assertEqual('367678850', sentence['mmsi'])
+        self.assertIsNone(sentence.location())
+        self.assertEqual(511, sentence['heading'])
+        self.assertEqual(102.3, sentence['speed'])
+
+    def test_values(self):
+        sentence = parse(encode_lines(18, {'mmsi': 338000001, 'lon': -122.4775, 'lat': 37.8108, 'speed': 6.5,
+                                           'course': 271.3, 'cs': True}))[0]
+        self.assertEqual('338000001', sentence['mmsi'])
+        self.assertEqual((-122.4775, 37.8108), sentence.location())
+        self.assertEqual(6.5, sentence['speed'])
+        self.assertEqual(271.3, sentence['course'])
+        self.assertTrue(sentence['cs'])
+
+    def test_variable_length(self):
+        sentence = parse(encode_lines(14, {'mmsi': 1, 'text': 'HELLO SAILOR'}))[0]
+        self.assertEqual(40 + 6 * 12, len(sentence.message_bits()))
+
+        sentence = parse(encode_lines(8, {'mmsi': 1, 'data': Bits('101')}))[0]
+        self.assertEqual(59, len(sentence.message_bits()))
+
+    def test_type_24_parts(self):
+        a = parse(encode_lines(24, {'mmsi': 1, 'partno': 0, 'shipname': 'THERAPY', 'shiptype': 36}))[0]
+        self.assertEqual('THERAPY', a['shipname'])
+        b = parse(encode_lines(24, {'mmsi': 1, 'partno': 1, 'shipname': 'THERAPY', 'shiptype': 36}))[0]
+        self.assertEqual(36, int(b['shiptype']))
+
+    def test_sample_round_trip(self):
+        for sentence in islice(sentences_from_source('tests/sample.ais'), 2000):
+            if sentence.type_id() in [1, 2, 3, 5, 18]:
+                again = parse(encode_lines(sentence.type_id(), decoded(sentence)))[0]
+                self.assertEqual(decoded(sentence), decoded(again))
+
+
+class TestNmeaLines(TestCase):
+    def test_single(self):
+        self.assertEqual([type_1], nmea_lines('15NaEPPP01oR`R6CC?<j@gvr0<1C', 0, talker='AB'))
+
+    def test_fragments(self):
+        lines = nmea_lines('5' * 71, 2, 'B', message_id=3)
+        self.assertEqual(2, len(lines))
+        self.assertTrue(lines[0].startswith('!AIVDM,2,1,3,B,'))
+        self.assertTrue(lines[1].startswith('!AIVDM,2,2,3,B,55555555555,2*'))
+        self.assertEqual(1, len(parse(lines)))
+
+
+class TestRewrite(TestCase):
+    def test_mmsi(self):
+        original = parse('1452468552.938 ' + type_1)
+        rewritten = rewrite(original, {'mmsi': '123456789'})
+        self.assertEqual('123456789', rewritten['mmsi'])
+        self.assertEqual(1452468552.938, rewritten.time)
+        self.assertTrue(rewritten.check())
+        expected = decoded(original)
+        expected['mmsi'] = '123456789'
+        self.assertEqual(expected, decoded(rewritten))
+
+    def test_keeps_fragments(self):
+        original = parse(type_5)[0]
+        rewritten = rewrite(original, {'mmsi': 1, 'shipname': 'ANONYMOUS'})
+        self.assertEqual(2, len(rewritten.text))
+        self.assertEqual(type_5[1], rewritten.text[1])
+        self.assertTrue(rewritten.text[0].startswith('!AIVDM,2,1,8,A,'))
+        self.assertEqual('000000001', rewritten['mmsi'])
+        self.assertEqual('ANONYMOUS', rewritten['shipname'])
+        self.assertEqual(original['destination'], rewritten['destination'])
+        self.assertTrue(rewritten.check())
+
+    def test_parses_back(self):
+        rewritten = rewrite(parse(type_5)[0], {'mmsi': 42})
+        self.assertEqual('000000042', parse(rewritten.text)[0]['mmsi'])
@@ -0,0 +1,93 @@
+import csv
+import io
+import json
+from unittest import TestCase
+
+from simpleais import ENUM_LOOKUPS, parse, sentences_from_source
+from simpleais.export import DelimitedWriter, NdjsonWriter, csv_value, json_value
+
+
+class EnumRestoringTestCase(TestCase):
+    def setUp(self):
+        # decoding records unknown enum values in ENUM_LOOKUPS; keep that from leaking into other tests
+        self.saved_lookups = {name: dict(lookups) for name, lookups in ENUM_LOOKUPS.items()}
+
+    def tearDown(self):
+        for name, lookups in self.saved_lookups.items():
+            ENUM_LOOKUPS[name].clear()
+            ENUM_LOOKUPS[name].update(lookups)
+
+
+class TestNdjsonWriter(EnumRestoringTestCase):
+    def lines_for(self, sentences, **kwargs):
+        out = io.StringIO()
+        NdjsonWriter(out, buffer_lines=7, **kwargs).write_all(sentences)
+        return out.getvalue().splitlines()
+
+    def test_matches_as_json(self):
+        sentences = list(sentences_from_source('tests/sample.ais'))
+        self.assertEqual([s.as_json() for s in sentences], self.lines_for(sentences))
+
+    def test_matches_as_json_for_odd_payloads(self):
+        sentences = parse(["!AIVDM,2,1,3,A,A@2bBWjeoU`uP0@0eL9@DOpl061C00l025wwT@1@:Orl07i1vQL03ngn801d,0*09",
+                           "!AIVDM,2,2,3,A,=h0505`SwpH0FTH21h0u=gl702h0,0*23",
+                           "!AIVDM,1,1,,A,13bjvT?0000BSS8MN2`V3Whr0>`<,0*60",
+                           "!AIVDM,1,1,,A,13bjvT?0000BSS8MN2,0*60",
+                           "!AIVDM,1,1,,B,H52N>V@T2rNVPJ2000000000000,2*35"])
+        self.assertEqual(4, len(sentences))
+        self.assertEqual([s.as_json() for s in sentences], self.lines_for(sentences))
+
+    def test_types_with_a_text_field(self):
+        sentences = [parse('!AIVDM,1,1,,A,<1mg=5CcNJ;485<<?PG?B<4,0*52'),  # addressed safety, type 12
+                     parse('!AIVDM,1,1,,A,>1mg=5@l5T@5T,2*45')]  # broadcast safety, type 14
+        self.assertEqual([12, 14], [s.type_num for s in sentences])
+        lines = self.lines_for(sentences)
+        self.assertEqual([json.loads(s.as_json()) for s in sentences], [json.loads(line) for line in lines])
+        self.assertEqual([s.as_json() for s in sentences], lines)
+        for line in lines:
+            self.assertEqual(1, line.count('"text"'))
+
+    def test_fields(self):
+        sentences = parse(["1452468552.938 !AIVDM,1,1,,B,14Wtnn002SGLde:BbrBmdTLF0Vql,0*6E",
+                           "!AIVDM,1,1,,B,H52N>V@T2rNVPJ2000000000000,2*35"])
+        lines = self.lines_for(sentences, fields=['received_at', 'mmsi', 'lon', 'status'], compact_enums=True)
+        self.assertEqual('{"received_at": 1452468552.938, "mmsi": "310327000", "lon": -119.5598, "status": 0}',
+                         lines[0])
+        self.assertEqual({'mmsi': '338136729'}, json.loads(lines[1]))
+
+    def test_json_value(self):
+        m = parse('!AIVDM,1,1,,A,13bjvT?0000BSS8MN2`V3Whr0>`<,0*60')
+        self.assertEqual('{"enum_id": 15, "enum_value": "Not defined (default)"}', json_value(m['status']))
+        self.assertEqual('15', json_value(m['status'], compact_enums=True))
+        self.assertEqual('NaN', json_value(float('nan')))
+        self.assertEqual('"caf\\u00e9"', json_value('café'))
+
+
+class TestDelimitedWriter(EnumRestoringTestCase):
+    def lines_for(self, sentences, fields, **kwargs):
+        out = io.StringIO()
+        DelimitedWriter(out, fields, buffer_lines=7, **kwargs).write_all(sentences)
+        return out.getvalue().splitlines()
+
+    def test_matches_slow_path(self):
+        fields = ['received_at', 'type', 'mmsi', 'lon', 'lat', 'speed', 'status', 'shiptype', 'shipname', 'text']
+        sentences = list(sentences_from_source('tests/sample.ais'))
+        rows = list(csv.reader(self.lines_for(sentences, fields)))
+        self.assertEqual(fields, rows[0])
+        expected = [[csv_value(s[f] if f in s._decoder else None) for f in fields[1:-1]] for s in sentences]
+        self.assertEqual(expected, [row[1:-1] for row in rows[1:]])
+        self.assertEqual([" ".join(s.text) for s in sentences], [row[-1] for row in rows[1:]])
+
+    def test_defaults_and_quoting(self):
+        sentences = parse(["1452468552.938 !AIVDM,1,1,,B,14Wtnn002SGLde:BbrBmdTLF0Vql,0*6E",
+                           "!AIVDM,1,1,,B,H52N>V@T2rNVPJ2000000000000,2*35"])
+        lines = self.lines_for(sentences, ['mmsi', 'speed', 'shiptype', 'text'], defaults={'speed': -1})
+        self.assertEqual(['mmsi,speed,shiptype,text',
+                          '310327000,16.3,,"!AIVDM,1,1,,B,14Wtnn002SGLde:BbrBmdTLF0Vql,0*6E"',
+                          '338136729,-1,36,"!AIVDM,1,1,,B,H52N>V@T2rNVPJ2000000000000,2*35"'], lines)
+        lines = self.lines_for(sentences, ['shipname', 'shiptype'], delimiter='\t', enum_names=True, header=False)
+        self.assertEqual(['\t', 'I@.\')(F\tSailing'], lines)
+
+    def test_needs_fields(self):
+        with self.assertRaises(ValueError):
+            DelimitedWriter(io.StringIO(), [])
@@ -0,0 +1,86 @@
+import os
+import subprocess
+import sys
+from unittest import TestCase
+
+from simpleais import BACKUP_DECODER, MESSAGE_DECODERS, parse
+from simpleais.expressions import SPECIAL_NAMES, compile_expression, cost, known_fields, parse_expression
+
+
+class TestParsing(TestCase):
+    def test_tree(self):
+        self.assertEqual(('and', [('in', 'type', (1, 2, 3)), ('compare', '>', 'speed', 10),
+                                  ('between', 'lat', 50, 60.5)]),
+                         parse_expression("type in (1, 2, 3) and speed > 10 and lat between 50 and 60.5"))
+        self.assertEqual(('or', [('compare', '=', 'mmsi', '366985310'), ('not', ('present', 'shipname'))]),
+                         parse_expression("mmsi == '366985310' OR shipname is null"))
+        self.assertEqual(('not', ('in', 'status', ('Moored', 5))), parse_expression('status not in ("Moored", 5)'))
+        self.assertEqual(('and', [('present', 'shiptype'), ('or', [('const', True), ('present', 'to_bow')])]),
+                         parse_expression("shiptype and (true or to_bow is not null)"))
+
+    def test_errors(self):
+        for text in ["speed >", "sped > 10", "speed > 10 and", "(speed > 10", "speed > 10)", "lat between 1",
+                     "speed $ 3", "speed in 3"]:
+            with self.assertRaises(ValueError, msg=text):
+                parse_expression(text)
+        with self.assertRaises(ValueError):
+            compile_expression("speed > 'fast'")
+
+    def test_cheap_checks_first(self):
+        self.assertLess(cost(parse_expression("type = 1")), cost(parse_expression("speed > 1")))
+        self.assertLess(cost(parse_expression("mmsi = 1")), cost(parse_expression("valid_checksum")))
+
+
+class TestEvaluation(TestCase):
+    type_1 = parse("1452468552.938 !AIVDM,1,1,,B,14Wtnn002SGLde:BbrBmdTLF0Vql,0*6E")
+    type_5 = parse(["!WSVDM,2,1,0,A,5=JklSl00003UHDs:20l4E9<f04i@4U:22222217,0*4C",
+                    "!WSVDM,2,2,0,A,05B0dl0HtS000000000000000000008,2*00"])[0]
+
+    def assertLikes(self, expression, *sentences):
+        test = compile_expression(expression)
+        for sentence in sentences:
+            self.assertTrue(test(sentence), "{} for {}".format(expression, sentence))
+
+    def assertDislikes(self, expression, *sentences):
+        test = compile_expression(expression)
+        for sentence in sentences:
+            self.assertFalse(test(sentence), "{} for {}".format(expression, sentence))
+
+    def test_numbers(self):
+        self.assertLikes("speed > 10 and speed <= 16.3 and lat between 32 and 33", self.type_1)
+        self.assertDislikes("speed > 16.3 or lon > 0", self.type_1)
+        self.assertDislikes("speed > 0", self.type_5)
+        self.assertLikes("speed != 3", self.type_5)
+
+    def test_types_and_classes(self):
+        self.assertLikes("type in (1, 2, 3) and class = 'a'", self.type_1)
+        self.assertLikes("type = 5 and class = 'a'", self.type_5)
+        self.assertDislikes("type != 5 or class = 'b'", self.type_5)
+
+    def test_mmsi_and_enums(self):
+        self.assertLikes("mmsi = 310327000 and mmsi = '310327000' and mmsi in ('1', '310327000')", self.type_1)
+        self.assertLikes("status = 0 and status = 'Under way using engine' and status in (0, 1)", self.type_1)
+        self.assertDislikes("status not in (0)", self.type_1)
+
+    def test_presence_and_time(self):
+        self.assertLikes("shiptype and destination is not null and received_at is null", self.type_5)
+        self.assertLikes("received_at >= 1452468552.938 and not shiptype", self.type_1)
+        self.assertLikes("valid_checksum", self.type_1, self.type_5)
+        self.assertLikes("not false and true", self.type_1)
+
+
+class TestKnownFields(TestCase):
+    def test_every_decoders_fields(self):
+        names = set(SPECIAL_NAMES)
+        for decoder in list(MESSAGE_DECODERS.values()) + [BACKUP_DECODER]:
+            names.update(d.name for d in decoder.fields())
+        self.assertEqual(names, known_fields())
+
+    def test_builds_no_decoders(self):
+        # compiling aisgrep's expression is on its startup path
+        code = ("import simpleais; from simpleais.expressions import compile_expression; "
+                "compile_expression('speed > 10'); print(dict.__len__(simpleais.MESSAGE_DECODERS))")
+        output = subprocess.run([sys.executable, '-c', code], stdout=subprocess.PIPE, check=True,
+                                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                universal_newlines=True).stdout
+        self.assertEqual('0\n', output)
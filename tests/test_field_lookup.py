@@ -1,4 +1,10 @@
+import calendar
+import json
+import os
+import sys
+import tempfile
 from unittest import TestCase
+from unittest.mock import patch
 
 import simpleais
 from simpleais import *
@@ -141,6 +147,89 @@ class TestFieldLookup(TestCase):
         self.assertEqual(m['lon'], -154.2017)
         self.assertEqual(m['lat'], 87.065)
 
+
+class TestDecodedValues(TestCase):
+    def test_decoded_once(self):
+        m = parse('!AIVDM,1,1,,A,15NG6V0P01G?cFhE`R2IU?wn28R>,0*05')
+        with patch.object(BitFieldDecoder, 'decode', autospec=True, side_effect=BitFieldDecoder.decode) as decode:
+            self.assertEqual(0.1, m['speed'])
+            self.assertEqual(0.1, m['speed'])
+            self.assertIn('speed', m)
+            self.assertIsNone(m['shipname'])
+            self.assertNotIn('shipname', m)
+            self.assertEqual(1, decode.call_count)
+
+    def test_decode_all(self):
+        m = parse('!AIVDM,1,1,,A,15NG6V0P01G?cFhE`R2IU?wn28R>,0*05')
+        self.assertEqual(0.1, m['speed'])
+        values = m.decode_all()
+        self.assertEqual([d.name for d in MESSAGE_DECODERS[1].fields()], list(values))
+        self.assertEqual(0.1, values['speed'])
+        self.assertEqual(m['lon'], values['lon'])
+        self.assertEqual([f.value() for f in m.fields()], list(values.values()))
+
+
+class TestFieldPresence(TestCase):
+    def test_present_fields(self):
+        position = parse('!AIVDM,1,1,,A,15NG6V0P01G?cFhE`R2IU?wn28R>,0*05')
+        mask = field_mask(['speed', 'shipname'])
+        self.assertEqual(field_mask(['speed']), position.present_fields(mask))
+        self.assertEqual(mask, MESSAGE_DECODERS[19].present_fields(mask))
+        self.assertEqual(0, position.present_fields(field_mask(['destination', 'no-such-field'])))
+        self.assertEqual(field_mask(['speed', 'shipname']), mask)
+
+    def test_accessor(self):
+        position = parse('!AIVDM,1,1,,A,15NG6V0P01G?cFhE`R2IU?wn28R>,0*05')
+        other = parse('!AIVDM,1,1,,A,15NG6V0P01G?cFhE`R2IU?wn28R>,0*05')
+        base_station = parse('!AIVDM,1,1,,B,402M45iv0c?NN0dST0TPK@7008Aq,0*7F')
+        for name in ('speed', 'lon', 'shipname', 'time', 'no-such-field'):
+            accessor = FieldAccessor(name)
+            for sentence in (position, base_station, other):
+                self.assertEqual(sentence[name], accessor(sentence), "for {}".format(name))
+                self.assertEqual(sentence[name], accessor(sentence), "for {}".format(name))
+
+
+class TestLazyDecoders(TestCase):
+    def test_decoders_for_known_types_only(self):
+        self.assertIn(1, MESSAGE_DECODERS)
+        self.assertIn(27, MESSAGE_DECODERS)
+        self.assertNotIn(28, MESSAGE_DECODERS)
+        self.assertIsNone(MESSAGE_DECODERS.get(28))
+        with self.assertRaises(KeyError):
+            MESSAGE_DECODERS[28]
+        self.assertEqual(list(range(1, 28)), list(MESSAGE_DECODERS))
+        self.assertEqual(27, len(MESSAGE_DECODERS.values()))
+        self.assertIn('time', MESSAGE_DECODERS[4])
+
+    def test_built_once(self):
+        built = []
+        table = simpleais._LazyTable((1, 2), lambda key: built.append(key) or key * 10)
+        self.assertEqual(10, table[1])
+        self.assertEqual(10, table[1])
+        self.assertEqual([1], built)
+        self.assertEqual([(1, 10), (2, 20)], sorted(table.items()))
+        self.assertEqual([1, 2], built)
+
+    def test_table_cache(self):
+        with tempfile.TemporaryDirectory() as directory, \
+                patch.object(sys, 'dont_write_bytecode', False):
+            path = os.path.join(directory, 'tables.json')
+            with open(path, 'w') as f:
+                json.dump({'messages': {'1': 'first'}}, f)
+            self.assertEqual({'messages': {'1': 'first'}}, simpleais._load_tables(path))
+            cache = os.listdir(os.path.join(directory, '__pycache__'))
+            self.assertEqual(1, len(cache))
+            self.assertEqual({'messages': {'1': 'first'}}, simpleais._load_tables(path))
+
+            with open(path, 'w') as f:
+                json.dump({'messages': {'1': 'changed'}}, f)
+            self.assertEqual({'messages': {'1': 'changed'}}, simpleais._load_tables(path))
+
+            with open(os.path.join(directory, '__pycache__', cache[0]), 'wb') as f:
+                f.write(b'garbage')
+            self.assertEqual({'messages': {'1': 'changed'}}, simpleais._load_tables(path))
+
+
 # this test is a sign of a terrible design problem. TODO: maybe make enum collections responsible for defaulting?
 class TestEnumLookup(TestCase):
     def test_shiptype(self):
@@ -0,0 +1,83 @@
+import math
+from unittest import TestCase
+
+from simpleais import parse, sentences_from_source
+from simpleais.encoder import encode_lines
+from simpleais.fleet import FleetState
+from simpleais.generator import TrafficGenerator
+
+
+def sentence(type_id, values, t=None):
+    lines = encode_lines(type_id, values)
+    if t is not None:
+        lines = ["{} {}".format(t, l) for l in lines]
+    return parse(lines)[0]
+
+
+class TestFleetState(TestCase):
+    def test_position_and_motion(self):
+        fleet = FleetState()
+        fleet.add(sentence(1, {'mmsi': 367678850, 'lon': -122.4, 'lat': 37.8, 'speed': 12.5, 'course': 90.0,
+                               'heading': 91, 'status': 5}, 100.0))
+        vessel = fleet.get('367678850')
+        self.assertEqual('367678850', vessel['mmsi'])
+        self.assertEqual((-122.4, 37.8), (vessel['lon'], vessel['lat']))
+        self.assertEqual(12.5, vessel['speed'])
+        self.assertEqual(90.0, vessel['course'])
+        self.assertEqual(91, vessel['heading'])
+        self.assertEqual(5, vessel['status'])
+        self.assertEqual(100.0, vessel['position_time'])
+        self.assertIsNone(fleet.get(1))
+
+    def test_latest_position_wins(self):
+        fleet = FleetState()
+        fleet.add(sentence(1, {'mmsi': 1, 'lon': 1.0, 'lat': 1.0}, 100.0))
+        fleet.add(sentence(1, {'mmsi': 1, 'lon': 2.0, 'lat': 2.0}, 110.0))
+        fleet.add(sentence(1, {'mmsi': 1, 'lon': 3.0, 'lat': 3.0}, 105.0))
+        self.assertEqual(1, len(fleet))
+        self.assertEqual(2.0, fleet.get(1)['lon'])
+        self.assertEqual(110.0, fleet.get(1)['last_seen'])
+
+    def test_static_data(self):
+        fleet = FleetState()
+        fleet.add(sentence(5, {'mmsi': 2, 'shipname': 'NORTHERN LIGHT', 'callsign': 'WDC1234', 'imo': 9123456,
+                               'shiptype': 70, 'to_bow': 100, 'to_stern': 20, 'to_port': 8, 'to_starboard': 9,
+                               'draught': 7.5, 'destination': 'OAKLAND'}))
+        fleet.add(sentence(24, {'mmsi': 3, 'partno': 0, 'shipname': 'LITTLE BOAT'}))
+        fleet.add(sentence(24, {'mmsi': 3, 'partno': 1, 'shiptype': 37, 'callsign': 'KB123', 'to_bow': 5,
+                                'to_stern': 2, 'to_port': 1, 'to_starboard': 1}))
+        class_a = fleet.get(2)
+        self.assertEqual('NORTHERN LIGHT', class_a['shipname'])
+        self.assertEqual('WDC1234', class_a['callsign'])
+        self.assertEqual('OAKLAND', class_a['destination'])
+        self.assertEqual(9123456, class_a['imo'])
+        self.assertEqual(70, class_a['shiptype'])
+        self.assertEqual(7.5, class_a['draught'])
+        self.assertEqual(100, class_a['to_bow'])
+        self.assertTrue(math.isnan(class_a['lon']))
+        class_b = fleet.get(3)
+        self.assertEqual('LITTLE BOAT', class_b['shipname'])
+        self.assertEqual('KB123', class_b['callsign'])
+        self.assertEqual(37, class_b['shiptype'])
+        self.assertEqual(5, class_b['to_bow'])
+
+    def test_growth_and_snapshot(self):
+        fleet = FleetState(capacity=4)
+        generator = TrafficGenerator(vessels=300, seed=3, start_time=1500000000)
+        for s in parse([line for t, line in generator.lines(count=4000)]):
+            fleet.add(s)
+        self.assertGreater(len(fleet), 250)
+        snapshot = fleet.snapshot()
+        self.assertEqual(len(fleet), len(snapshot['mmsi']))
+        self.assertEqual(len(fleet), len(set(snapshot['mmsi'])))
+        names = [n for n in fleet.strings_for(snapshot['shipname']) if n]
+        self.assertTrue(names)
+        snapshot['lon'][:] = 0
+        self.assertFalse((fleet.snapshot()['lon'] == 0).all())
+
+    def test_sample_file(self):
+        fleet = FleetState()
+        for s in sentences_from_source('tests/sample.ais'):
+            fleet.add(s)
+        seen = {s['mmsi'] for s in sentences_from_source('tests/sample.ais') if s['mmsi']}
+        self.assertEqual(len(seen), len(fleet))
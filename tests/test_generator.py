@@ -0,0 +1,64 @@
+from collections import Counter
+from unittest import TestCase
+from unittest.mock import patch
+
+from click.testing import CliRunner
+
+from simpleais import parse
+from simpleais.generator import TrafficGenerator
+from simpleais.tools import generate
+
+
+class TestTrafficGenerator(TestCase):
+    def lines(self, **kwargs):
+        generator = TrafficGenerator(seed=7, start_time=1500000000, **kwargs)
+        return [line for t, line in generator.lines(count=5000)]
+
+    def test_deterministic(self):
+        self.assertEqual(self.lines(vessels=50), self.lines(vessels=50))
+
+    def test_message_mix(self):
+        sentences = parse(self.lines(vessels=200))
+        types = Counter(s.type_id() for s in sentences)
+        for type_id in [1, 2, 3, 4, 5, 18, 21, 24]:
+            self.assertIn(type_id, types)
+        self.assertTrue(all(s.check() for s in sentences))
+
+    def test_type_5_is_fragmented(self):
+        lines = self.lines(vessels=200)
+        self.assertTrue(any(',2,1,' in l for l in lines))
+        type_5 = [s for s in parse(lines) if s.type_id() == 5][0]
+        self.assertEqual(2, len(type_5.text))
+        self.assertTrue(type_5['shipname'])
+        self.assertTrue(type_5['destination'])
+
+    def test_positions_stay_in_bounds(self):
+        bounds = (-1.0, 50.0, 1.0, 51.0)
+        generator = TrafficGenerator(vessels=20, seed=1, start_time=1500000000, bounds=bounds)
+        for s in parse([line for t, line in generator.lines(duration=3600)]):
+            location = s.location()
+            if location:
+                self.assertTrue(bounds[0] <= location[0] <= bounds[2])
+                self.assertTrue(bounds[1] <= location[1] <= bounds[3])
+
+    def test_times_are_ordered(self):
+        generator = TrafficGenerator(vessels=20, seed=1, start_time=1500000000)
+        times = [t for t, line in generator.lines(count=1000)]
+        self.assertEqual(sorted(times), times)
+
+    def test_noise(self):
+        lines = self.lines(vessels=100, duplicate_rate=0.2, bad_checksum_rate=0.2, junk_rate=0.1)
+        sentences = parse(lines)
+        self.assertTrue(any(not s.check() for s in sentences))
+        self.assertTrue(any(s.talker == 'AB' for s in sentences))
+        self.assertTrue(any('!' not in l for l in lines))
+
+
+
+class TestGenerateCommand(TestCase):
+    def test_fast_tcp_waits_for_clients(self):
+        for args, blocking in (([], False), (['--fast'], True)):
+            with patch('simpleais.sinks.TcpServerSink') as server:
+                result = CliRunner().invoke(generate, args + ['--count', '3', '--tcp', '0'])
+                self.assertEqual(0, result.exit_code, result.output)
+                server.assert_called_once_with(':0', blocking=blocking)
@@ -0,0 +1,52 @@
+import pickle
+from unittest import TestCase
+
+from simpleais import parse, pack_sentences, sentences_from_source, unpack_sentence, unpack_sentences
+
+
+class TestPacking(TestCase):
+    type_1 = parse("1452468552.938 !AIVDM,1,1,,B,14Wtnn002SGLde:BbrBmdTLF0Vql,0*6E")
+    type_5 = parse(["!WSVDM,2,1,0,A,5=JklSl00003UHDs:20l4E9<f04i@4U:22222217,0*4C",
+                    "!WSVDM,2,2,0,A,05B0dl0HtS000000000000000000008,2*00"])[0]
+
+    def assertSameSentence(self, expected, actual):
+        self.assertEqual(expected.as_json(), actual.as_json())
+        self.assertEqual(expected.time, actual.time)
+        self.assertEqual(expected.talker, actual.talker)
+        self.assertEqual(expected.sentence_type, actual.sentence_type)
+        self.assertEqual(expected.radio_channel, actual.radio_channel)
+        self.assertEqual(expected.checksums, actual.checksums)
+        self.assertEqual(expected.time_text, actual.time_text)
+
+    def test_round_trip_with_text(self):
+        for sentence in self.type_1, self.type_5:
+            self.assertSameSentence(sentence, unpack_sentence(sentence.pack(keep_text=True)))
+
+    def test_without_text(self):
+        packed = self.type_5.pack()
+        self.assertLess(len(packed), len(self.type_5.pack(keep_text=True)))
+        sentence = unpack_sentence(packed)
+        self.assertIsNone(sentence.text)
+        self.assertIsNone(sentence.time)
+        self.assertIsNone(sentence.time_text)
+        with self.assertRaises(ValueError):
+            sentence.check()
+        self.assertEqual(self.type_5['shipname'], sentence['shipname'])
+        self.assertEqual(self.type_5.message_bits(), sentence.message_bits())
+
+    def test_time_as_written(self):
+        sentence = unpack_sentence(self.type_1.pack())
+        self.assertEqual("1452468552.938", sentence.time_text)
+        self.assertEqual(1452468552.938, sentence.time)
+
+    def test_pickle(self):
+        sentence = pickle.loads(pickle.dumps(self.type_1))
+        self.assertSameSentence(self.type_1, sentence)
+        self.assertTrue(sentence.check())
+
+    def test_many(self):
+        sentences = list(sentences_from_source('tests/sample.ais'))
+        unpacked = list(unpack_sentences(pack_sentences(sentences, keep_text=True)))
+        self.assertEqual([s.as_json() for s in sentences], [s.as_json() for s in unpacked])
+        self.assertEqual([s.time_text for s in sentences], [s.time_text for s in unpacked])
+        self.assertEqual([], list(unpack_sentences(pack_sentences([]))))
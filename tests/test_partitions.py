@@ -0,0 +1,106 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from unittest import TestCase
+
+from simpleais import parse, sentences_from_source
+from simpleais.partitions import Manifest, Partitioner, burst_partitioned, peek_mmsi
+
+LINE = "1452468552.938 !AIVDM,1,1,,B,14Wtnn002SGLde:BbrBmdTLF0Vql,0*6E"
+
+
+class TestPeek(TestCase):
+    def test_matches_parsed_mmsi(self):
+        self.assertEqual(int(parse(LINE)['mmsi']), peek_mmsi(LINE))
+
+    def test_gives_up_on_fragments(self):
+        self.assertIsNone(peek_mmsi("!AIVDM,2,1,3,B,55P5TL01VIaAL@7WKO@mBplU@<PDhh000000001S;AJ::4A80?4i@E53,0*3E"))
+        self.assertIsNone(peek_mmsi("garbage"))
+
+
+class TestPartitioner(TestCase):
+    def test_partition(self):
+        partitioner = Partitioner(['type', 'day', 'hour', 'mmsi'], buckets=16)
+        sentence = parse(LINE)
+        partition = partitioner.partition_for(sentence, sentence['mmsi'])
+        self.assertEqual(('type', '1'), partition[0])
+        self.assertEqual(('day', '2016-01-10'), partition[1])
+        self.assertEqual(('hour', '2016-01-10T23'), partition[2])
+        self.assertEqual('mmsi', partition[3][0])
+        self.assertEqual(2, len(partition[3][1]))
+        self.assertEqual(os.path.join('type=1', 'day=2016-01-10', 'hour=2016-01-10T23', 'mmsi=' + partition[3][1]),
+                         partitioner.directory_for(partition))
+
+    def test_no_time(self):
+        sentence = parse(LINE.split(' ')[1])
+        self.assertEqual((('day', 'unknown'),), Partitioner(['day']).partition_for(sentence, sentence['mmsi']))
+
+    def test_bad_keys(self):
+        with self.assertRaises(ValueError):
+            Partitioner(['week'])
+        with self.assertRaises(ValueError):
+            Partitioner(['day', 'day'])
+
+
+class TestBurstPartitioned(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def path(self, *names):
+        return os.path.join(self.directory.name, *names)
+
+    def tree(self, top):
+        result = {}
+        for directory, _, files in os.walk(top):
+            for name in files:
+                path = os.path.join(directory, name)
+                with open(path) as f:
+                    result[os.path.relpath(path, top)] = f.read()
+        return result
+
+    def test_workers_match_single_process(self):
+        one = burst_partitioned(['tests/sample.ais'], self.path('one'), ('mmsi', 'hour'), buckets=8)
+        three = burst_partitioned(['tests/sample.ais'], self.path('three'), ('mmsi', 'hour'), buckets=8, jobs=3)
+        self.assertEqual(one.to_dict(), three.to_dict())
+        self.assertEqual(self.tree(self.path('one')), self.tree(self.path('three')))
+        self.assertEqual(len(list(sentences_from_source('tests/sample.ais'))), one.sentence_count())
+
+    def test_manifest_accumulates(self):
+        burst_partitioned(['tests/sample.ais'], self.path('out'), ('type',))
+        manifest = burst_partitioned(['tests/sample.ais'], self.path('out'), ('type',))
+        with open(self.path('out', 'manifest.json')) as f:
+            saved = json.load(f)
+        self.assertEqual(manifest.to_dict(), saved)
+        self.assertEqual(2 * len(list(sentences_from_source('tests/sample.ais'))), manifest.sentence_count())
+        entry = saved['files'][0]
+        with open(self.path('out', entry['path'])) as f:
+            self.assertEqual(entry['sentences'], len(f.readlines()))
+        self.assertLessEqual(entry['first'], entry['last'])
+
+    def test_layout_must_match(self):
+        burst_partitioned(['tests/sample.ais'], self.path('out'), ('type',))
+        with self.assertRaises(ValueError):
+            burst_partitioned(['tests/sample.ais'], self.path('out'), ('day',))
+
+    def test_manifest_merge(self):
+        a = Manifest(['day'])
+        a.add('x.ais', 'x', (('day', 'unknown'),), 5.0)
+        b = Manifest(['day'])
+        b.add('x.ais', 'x', (('day', 'unknown'),), 3.0)
+        b.add('y.ais', 'y', (('day', 'unknown'),), None)
+        a.merge(b)
+        self.assertEqual({'mmsi': 'x', 'partition': {'day': 'unknown'}, 'sentences': 2, 'first': 3.0, 'last': 5.0},
+                         a.files['x.ais'])
+        self.assertEqual(a.to_dict(), Manifest.from_dict(a.to_dict()).to_dict())
+
+
+class TestImports(TestCase):
+    def test_no_cli(self):
+        code = "import sys, simpleais.partitions; print('click' in sys.modules, 'simpleais.tools' in sys.modules)"
+        output = subprocess.run([sys.executable, '-c', code], stdout=subprocess.PIPE, check=True,
+                                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                universal_newlines=True).stdout
+        self.assertEqual("False False\n", output)
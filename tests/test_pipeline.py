@@ -0,0 +1,118 @@
+import io
+import os
+import random
+import select
+import subprocess
+import sys
+from unittest import TestCase
+
+from click.testing import CliRunner
+
+from simpleais import sentences_from_source
+from simpleais.pipeline import ReorderBuffer, read_chunks, run_ordered, sentences_from_lines
+from simpleais.tools import cat, chunk_texts, grep, sentence_source_text, to_json
+
+PART_ONE = '1452468554.872 !AIVDM,2,1,7,A,852M9kAKf86fv<Uvvhq5STpAKi:SaJjS:RpqLeaR4q>,0*62\n'
+PART_TWO = '1452468554.873 !AIVDM,2,2,7,A,88888888880,2*6D\n'
+OTHER_CHANNEL = '1452468554.874 !AIVDM,1,1,,B,14Wtnn002SGLde:BbrBmdTLF0Vql,0*6E\n'
+
+
+def texts(sentences):
+    return [sentence_source_text(s) for s in sentences]
+
+
+class TestReadChunks(TestCase):
+    def chunked(self, lines, chunk_lines):
+        result = []
+        for sequence, chunk in read_chunks([io.StringIO("".join(lines))], chunk_lines):
+            self.assertEqual(len(result), sequence)
+            result.append(texts(sentences_from_lines(chunk)))
+        return [text for chunk in result for text in chunk]
+
+    def test_same_sentences_however_cut(self):
+        with open('tests/sample.ais') as f:
+            lines = f.readlines()[:500]
+        expected = texts(sentences_from_source(io.StringIO("".join(lines))))
+        for chunk_lines in (1, 2, 3, 7, 100, 1000):
+            self.assertEqual(expected, self.chunked(lines, chunk_lines), "for {} lines".format(chunk_lines))
+
+    def test_interleaved_channels(self):
+        lines = [PART_ONE, OTHER_CHANNEL, OTHER_CHANNEL, PART_TWO, OTHER_CHANNEL, 'junk\n', PART_ONE, PART_TWO]
+        expected = texts(sentences_from_source(io.StringIO("".join(lines))))
+        self.assertEqual(5, len(expected))
+        for chunk_lines in (1, 2, 3):
+            self.assertEqual(expected, self.chunked(lines, chunk_lines))
+
+    def test_no_sentences_across_sources(self):
+        chunks = list(read_chunks([io.StringIO(PART_ONE + OTHER_CHANNEL), io.StringIO(PART_TWO + OTHER_CHANNEL)]))
+        self.assertEqual([(0, [PART_ONE, OTHER_CHANNEL]), (1, [PART_TWO, OTHER_CHANNEL])], chunks)
+        self.assertEqual([[OTHER_CHANNEL], [OTHER_CHANNEL]], [texts(sentences_from_lines(c)) for _, c in chunks])
+
+    def test_cut_by_time_on_live_feed(self):
+        read_end, write_end = os.pipe()
+        with open(read_end) as feed, open(write_end, 'w') as writer:
+            writer.write(PART_ONE + OTHER_CHANNEL)
+            writer.flush()
+            chunks = read_chunks([feed], max_wait=0.05)
+            self.assertEqual((0, [PART_ONE, OTHER_CHANNEL]), next(chunks))
+            writer.write(PART_TWO)
+        self.assertEqual([(1, [PART_ONE, PART_TWO])], list(chunks))
+
+
+class TestReorderBuffer(TestCase):
+    def test_releases_in_order(self):
+        buffer = ReorderBuffer()
+        self.assertEqual([], buffer.add(2, 'c'))
+        self.assertEqual([], buffer.add(1, 'b'))
+        self.assertEqual(2, len(buffer))
+        self.assertEqual(['a', 'b', 'c'], buffer.add(0, 'a'))
+        self.assertEqual(['d'], buffer.add(3, 'd'))
+        self.assertEqual(0, len(buffer))
+
+    def test_any_arrival_order(self):
+        order = list(range(50))
+        random.Random(4).shuffle(order)
+        buffer = ReorderBuffer()
+        released = [item for sequence in order for item in buffer.add(sequence, sequence)]
+        self.assertEqual(list(range(50)), released)
+
+
+class TestRunOrdered(TestCase):
+    def test_in_order(self):
+        with open('tests/sample.ais') as f:
+            lines = f.readlines()[:2000]
+        chunks = read_chunks([io.StringIO("".join(lines))], 100)
+        results = list(run_ordered(chunks, chunk_texts, (None,), jobs=2, max_pending=3))
+        self.assertEqual(texts(sentences_from_source(io.StringIO("".join(lines)))),
+                         [text for chunk in results for text in chunk])
+
+
+class TestJobsOption(TestCase):
+    def test_same_as_one_job(self):
+        runner = CliRunner()
+        for command, args in ((cat, []), (grep, ['-t', '5']), (grep, ['-e', 'speed > 10', '--max-count', '7']),
+                              (to_json, ['-f', 'mmsi,lon,lat'])):
+            expected = runner.invoke(command, args + ['tests/sample.ais']).output
+            result = runner.invoke(command, args + ['--jobs', '2', 'tests/sample.ais'])
+            self.assertEqual(0, result.exit_code, result.output)
+            self.assertEqual(expected, result.output)
+
+    def test_live_feed_not_held_back(self):
+        code = "from simpleais.tools import cat; cat(['--jobs', '2'])"
+        process = subprocess.Popen([sys.executable, '-c', code], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                   cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                   universal_newlines=True)
+        try:
+            process.stdin.write(OTHER_CHANNEL)
+            process.stdin.flush()
+            ready, _, _ = select.select([process.stdout], [], [], 30)
+            self.assertEqual([process.stdout], ready)
+            self.assertEqual(OTHER_CHANNEL, process.stdout.readline())
+        finally:
+            process.stdin.close()
+            process.stdout.close()
+            process.wait()
+
+    def test_bad_expression_before_starting(self):
+        result = CliRunner().invoke(grep, ['-e', 'bogus > 1', '--jobs', '2', 'tests/sample.ais'])
+        self.assertEqual(2, result.exit_code)
@@ -0,0 +1,102 @@
+import math
+import threading
+from collections import defaultdict
+from unittest import TestCase
+
+from simpleais import nmea_checksum, parse, sentences_from_source
+from simpleais.generator import TrafficGenerator
+from simpleais.refine import RefineEngine
+from simpleais.tools import RefineFilter
+
+
+def reference(sentences):
+    filters = defaultdict(RefineFilter)
+    result = []
+    for sentence in sentences:
+        filter = filters[sentence['mmsi']]
+        if filter.wants(sentence):
+            result.append(sentence)
+            filter.mark(sentence)
+    return result
+
+
+def with_type(sentence, type_char):
+    """Returns a copy of a one-part sentence with the payload's first character, which gives the type, replaced."""
+    text = sentence.text[0]
+    fields = text[1:text.index('*')].split(',')
+    fields[5] = type_char + fields[5][1:]
+    body = ','.join(fields)
+    return parse('{} !{}*{:02X}'.format(sentence.time_text, body, nmea_checksum('!' + body)))
+
+
+def generated(count=20000, **kwargs):
+    generator = TrafficGenerator(vessels=100, seed=11, start_time=1500000000, **kwargs)
+    return parse([line for t, line in generator.lines(count=count)])
+
+
+class TestRefineEngine(TestCase):
+    def assertSameAsReference(self, sentences, **kwargs):
+        expected = [s.text for s in reference(sentences)]
+        actual = [s.text for s in RefineEngine(**kwargs).refine(sentences, batch_size=kwargs and 7 or 500)]
+        self.assertEqual(expected, actual)
+
+    def test_sample_matches_reference(self):
+        sentences = list(sentences_from_source('tests/sample.ais'))
+        self.assertSameAsReference(sentences)
+        self.assertSameAsReference(sentences, capacity=1)
+
+    def test_generated_matches_reference(self):
+        sentences = generated()
+        self.assertSameAsReference(sentences)
+        self.assertSameAsReference(sentences, evict_interval=60)
+
+    def test_long_feed_evicts_idle_vessels(self):
+        generator = TrafficGenerator(vessels=20, seed=5, start_time=1500000000)
+        early = parse([line for t, line in generator.lines(count=500)])
+        later = [s for s in generated(count=3000) if s.time > 1500000000]
+        for s in later:
+            s.time += 5 * 3600
+        engine = RefineEngine(evict_interval=60)
+        list(engine.refine(early))
+        self.assertGreaterEqual(len(engine), 20)
+        list(engine.refine(later))
+        self.assertLessEqual(len(engine), 110)
+        self.assertTrue(all(k not in engine.rows for k in {s['mmsi'] for s in early} - {s['mmsi'] for s in later}))
+
+    def test_types_beyond_27_kept_apart(self):
+        sentences = []
+        for s in generated(count=3000):
+            if s.type_id() in (1, 2, 3):
+                sentences.extend([s, with_type(s, 'L'), with_type(s, 'W'), with_type(s, '`'), with_type(s, 'w')])
+        self.assertEqual({1, 2, 3, 28, 39, 40, 63}, {s.type_id() for s in sentences})
+        self.assertSameAsReference(sentences)
+        self.assertSameAsReference(sentences, capacity=1)
+
+    def test_live_feed_not_held_back(self):
+        first, second = generated(count=2)
+        release = threading.Event()
+        fed = []
+
+        def feed():
+            yield first
+            release.wait(5)
+            fed.append(second)
+            yield second
+
+        refined = RefineEngine().refine(feed(), max_wait=0.05)
+        self.assertIs(first, next(refined))
+        self.assertEqual([], fed)
+        release.set()
+        self.assertEqual([second], list(refined))
+
+    def test_rounds_within_batch(self):
+        engine = RefineEngine()
+        nan = math.nan
+        wanted = engine.wants(['a', 'a', 'a', 'b'], [1, 1, 1, 1], [0, 10, 20, 30], [10.0, 10.5, 13.0, 1.0],
+                              [90.0, 91.0, 92.0, nan], [0, 0, 0, 0])
+        self.assertEqual([True, False, True, True], wanted.tolist())
+
+    def test_needs_time(self):
+        sentences = parse(["!AIVDM,1,1,,B,14Wtnn002SGLde:BbrBmdTLF0Vql,0*6E"])
+        with self.assertRaises(ValueError):
+            list(RefineEngine().refine(sentences))
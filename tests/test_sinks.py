@@ -0,0 +1,257 @@
+import gzip
+import os
+import socket
+import tempfile
+import time
+from unittest import TestCase
+
+from simpleais.sinks import OutputSink, Pacer, RotatingSink, TcpServerSink, UdpSink, WriterPool
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+        self.sleeps = []
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TestPacer(TestCase):
+    def items(self, times):
+        return [(t, str(t)) for t in times]
+
+    def test_batches_by_due_time(self):
+        clock = FakeClock()
+        pacer = Pacer(1.0, clock=clock.clock, sleep=clock.sleep)
+        batches = list(pacer.batches(self.items([0, 0, 1, 1, 1, 3])))
+        self.assertEqual([['0', '0'], ['1', '1', '1'], ['3']], batches)
+        self.assertEqual([1.0, 2.0], clock.sleeps)
+
+    def test_speed(self):
+        clock = FakeClock()
+        pacer = Pacer(10.0, clock=clock.clock, sleep=clock.sleep)
+        list(pacer.batches(self.items([0, 10, 20])))
+        self.assertEqual([1.0, 1.0], clock.sleeps)
+
+    def test_as_fast_as_possible(self):
+        clock = FakeClock()
+        pacer = Pacer(None, clock=clock.clock, sleep=clock.sleep)
+        self.assertEqual([['0', '10', '20']], list(pacer.batches(self.items([0, 10, 20]))))
+        self.assertEqual([], clock.sleeps)
+
+    def test_max_gap(self):
+        clock = FakeClock()
+        pacer = Pacer(1.0, max_gap=5, clock=clock.clock, sleep=clock.sleep)
+        list(pacer.batches(self.items([0, 1000, 1001])))
+        self.assertEqual([5.0, 1.0], clock.sleeps)
+
+    def test_max_batch(self):
+        pacer = Pacer(None, max_batch=2)
+        self.assertEqual([['0', '0'], ['0']], list(pacer.batches(self.items([0, 0, 0]))))
+
+
+class TestWriterPool(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def path(self, name):
+        return os.path.join(self.directory.name, name)
+
+    def test_evicts_least_recently_used(self):
+        pool = WriterPool(max_open=2, buffer_size=10)
+        names = ['a', 'b', 'c', 'a', 'd', 'b', 'a']
+        for i, name in enumerate(names):
+            pool.write(self.path(name), "{}{}\n".format(name, i))
+            self.assertLessEqual(pool.open_count(), 2)
+        self.assertEqual(2, pool.open_count())
+        self.assertEqual({self.path('b'), self.path('a')}, set(pool.writers))
+        pool.close()
+        self.assertEqual(0, pool.open_count())
+        for name in 'abcd':
+            with open(self.path(name)) as f:
+                expected = ["{}{}\n".format(n, i) for i, n in enumerate(names) if n == name]
+                self.assertEqual(expected, f.readlines())
+
+    def test_buffers_until_full(self):
+        pool = WriterPool(buffer_size=10)
+        pool.write(self.path('a'), "12345")
+        self.assertEqual(0, os.path.getsize(self.path('a')))
+        pool.write(self.path('a'), "67890")
+        pool.writers[self.path('a')].file.flush()
+        self.assertEqual(10, os.path.getsize(self.path('a')))
+        pool.close()
+
+    def test_gzip_survives_reopening(self):
+        pool = WriterPool(max_open=1, compress=True)
+        for i in range(3):
+            pool.write(self.path('a.gz'), "a{}\n".format(i))
+            pool.write(self.path('b.gz'), "b{}\n".format(i))
+        pool.close()
+        self.assertEqual(6, pool.opened_count)
+        with gzip.open(self.path('a.gz'), 'rt') as f:
+            self.assertEqual("a0\na1\na2\n", f.read())
+
+    def test_needs_a_handle(self):
+        with self.assertRaises(ValueError):
+            WriterPool(max_open=0)
+
+
+class RecordingFile:
+    def __init__(self, broken=False):
+        self.writes = []
+        self.broken = broken
+
+    def write(self, text):
+        if self.broken:
+            raise BrokenPipeError()
+        self.writes.append(text)
+
+    def flush(self):
+        pass
+
+
+class TestOutputSink(TestCase):
+    def test_buffers_until_full(self):
+        file = RecordingFile()
+        sink = OutputSink(file, buffer_size=10)
+        sink.write("12345")
+        self.assertEqual([], file.writes)
+        sink.write("67890")
+        sink.write("abc")
+        self.assertEqual(["1234567890"], file.writes)
+        sink.close()
+        self.assertEqual(["1234567890", "abc"], file.writes)
+
+    def test_flushes_on_interval(self):
+        file = RecordingFile()
+        sink = OutputSink(file, flush_interval=0.01)
+        sink.write("waiting\n")
+        deadline = time.monotonic() + 5
+        while not file.writes and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(["waiting\n"], file.writes)
+        sink.close()
+        self.assertIsNone(sink.flusher)
+
+    def test_broken_pipe_raised_once(self):
+        sink = OutputSink(RecordingFile(broken=True), buffer_size=1)
+        with self.assertRaises(BrokenPipeError):
+            sink.write("lost\n")
+        with self.assertRaises(BrokenPipeError):
+            sink.write("also lost\n")
+        sink.close()
+
+
+class TestRotatingSink(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.clock = FakeClock()
+        self.clock.now = 1452468552.0  # 2016-01-10 23:29:12 UTC
+
+    def contents(self):
+        result = {}
+        for name in sorted(os.listdir(self.directory.name)):
+            opener = gzip.open if name.endswith('.gz') else open
+            with opener(os.path.join(self.directory.name, name), 'rt') as f:
+                result[name] = f.read()
+        return result
+
+    def test_rotates_hourly(self):
+        sink = RotatingSink(self.directory.name, clock=self.clock.clock)
+        sink.write("a\n")
+        self.assertEqual(['ais-2016-01-10T23.ais.part'], os.listdir(self.directory.name))
+        self.clock.now += 3600
+        sink.write("b\n")
+        sink.close()
+        self.assertEqual({'ais-2016-01-10T23.ais': "a\n", 'ais-2016-01-11T00.ais': "b\n"}, self.contents())
+        self.assertEqual(sorted(self.contents()), [os.path.basename(p) for p in sink.finished])
+
+    def test_rotates_by_size(self):
+        sink = RotatingSink(self.directory.name, rotate='day', max_size=4, clock=self.clock.clock)
+        for line in ("aa\n", "bb\n", "c\n"):
+            sink.write(line)
+        sink.close()
+        self.assertEqual({'ais-2016-01-10.ais': "aa\nbb\n", 'ais-2016-01-10-1.ais': "c\n"}, self.contents())
+
+    def test_keeps_existing_files(self):
+        for text in ("first\n", "second\n"):
+            sink = RotatingSink(self.directory.name, clock=self.clock.clock)
+            sink.write(text)
+            sink.close()
+        self.assertEqual({'ais-2016-01-10T23.ais': "first\n", 'ais-2016-01-10T23-1.ais': "second\n"}, self.contents())
+
+    def test_compresses_finished_files(self):
+        sink = RotatingSink(self.directory.name, compress=True, clock=self.clock.clock)
+        sink.write("a\n")
+        self.clock.now += 3600
+        sink.write("b\n")
+        sink.close()
+        self.assertEqual({'ais-2016-01-10T23.ais.gz': "a\n", 'ais-2016-01-11T00.ais.gz': "b\n"}, self.contents())
+
+    def test_rejects_unknown_period(self):
+        with self.assertRaises(ValueError):
+            RotatingSink(self.directory.name, rotate='week')
+
+
+class TestNetworkSinks(TestCase):
+    def test_udp(self):
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as receiver:
+            receiver.bind(('127.0.0.1', 0))
+            receiver.settimeout(5)
+            sink = UdpSink("127.0.0.1:{}".format(receiver.getsockname()[1]))
+            sink.write("line 1\nline 2\n")
+            sink.flush()
+            self.assertEqual(b"line 1\nline 2\n", receiver.recv(4096))
+            sink.close()
+
+    def test_tcp(self):
+        sink = TcpServerSink('127.0.0.1:0')
+        try:
+            clients = [socket.create_connection(sink.address, timeout=5) for _ in range(3)]
+            for _ in range(100):
+                if sink.client_count() == 3:
+                    break
+                time.sleep(0.01)
+            sink.write("hello\n")
+            sink.flush()
+            for client in clients:
+                self.assertEqual(b"hello\n", client.recv(4096))
+                client.close()
+        finally:
+            sink.close()
+
+    def test_tcp_local_unless_host_given(self):
+        sink = TcpServerSink(':0')
+        try:
+            self.assertEqual('127.0.0.1', sink.address[0])
+        finally:
+            sink.close()
+        sink = TcpServerSink('0.0.0.0:0')
+        try:
+            self.assertEqual('0.0.0.0', sink.address[0])
+        finally:
+            sink.close()
+
+    def test_tcp_close_sends_queued_data(self):
+        sink = TcpServerSink('127.0.0.1:0', blocking=True)
+        client = socket.create_connection(sink.address, timeout=5)
+        self.assertTrue(sink.wait_for_clients(1, timeout=5))
+        for i in range(1000):
+            sink.write("line {}\n".format(i))
+            sink.flush()
+        sink.close()
+        received = b''
+        while True:
+            data = client.recv(65536)
+            if not data:
+                break
+            received += data
+        client.close()
+        self.assertEqual(1000, received.count(b'\n'))
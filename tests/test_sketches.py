@@ -0,0 +1,138 @@
+import json
+from bisect import bisect_left
+from collections import Counter
+from random import Random
+from unittest import TestCase
+
+from simpleais.sketches import CountMinSketch, HyperLogLog, KllSketch, TopK, hash64
+
+
+def zipf_values(count, seed=1):
+    rng = Random(seed)
+    return ["value-{}".format(int(rng.paretovariate(1.2))) for _ in range(count)]
+
+
+class TestHyperLogLog(TestCase):
+    def test_hash_is_stable(self):
+        self.assertEqual(hash64('367678850'), hash64('367678850'))
+        self.assertNotEqual(hash64('367678850'), hash64('367678851'))
+
+    def test_small_counts(self):
+        h = HyperLogLog()
+        self.assertEqual(0, len(h))
+        for i in range(100):
+            h.add(str(i))
+            h.add(str(i))
+        self.assertAlmostEqual(100, len(h), delta=2)
+
+    def test_large_counts(self):
+        h = HyperLogLog(precision=10)
+        for i in range(100000):
+            h.add(i)
+        self.assertAlmostEqual(100000, h.estimate(), delta=100000 * 4 * h.standard_error())
+
+    def test_merge_and_serialize(self):
+        a = HyperLogLog()
+        b = HyperLogLog()
+        for i in range(30000):
+            (a if i % 2 else b).add(i)
+        a.merge(b)
+        self.assertAlmostEqual(30000, a.estimate(), delta=30000 * 4 * a.standard_error())
+        restored = HyperLogLog.from_dict(json.loads(json.dumps(a.to_dict())))
+        self.assertEqual(a.estimate(), restored.estimate())
+        with self.assertRaises(ValueError):
+            a.merge(HyperLogLog(precision=10))
+
+
+class TestCountMinSketch(TestCase):
+    def test_never_low_and_within_bound(self):
+        values = zipf_values(20000)
+        sketch = CountMinSketch(width=1024, depth=4)
+        for v in values:
+            sketch.add(v)
+        for value, count in Counter(values).items():
+            self.assertGreaterEqual(sketch[value], count)
+            self.assertLessEqual(sketch[value], count + sketch.error_bound())
+
+    def test_merge_and_serialize(self):
+        a = CountMinSketch(width=256, depth=3)
+        b = CountMinSketch(width=256, depth=3)
+        a.add('x', 5)
+        b.add('x', 2)
+        a.merge(b)
+        self.assertEqual(7, a['x'])
+        self.assertEqual(7, CountMinSketch.from_dict(json.loads(json.dumps(a.to_dict())))['x'])
+
+
+class TestTopK(TestCase):
+    def test_finds_heavy_hitters(self):
+        values = zipf_values(20000)
+        top = TopK(20)
+        for v in values:
+            top.add(v)
+        self.assertEqual(20, len(top))
+        exact = Counter(values)
+        for value, count in exact.most_common(5):
+            self.assertIn(value, top)
+            self.assertGreaterEqual(top[value], count)
+
+    def test_merge_and_serialize(self):
+        values = zipf_values(20000)
+        a = TopK(20)
+        b = TopK(20)
+        for i, v in enumerate(values):
+            (a if i % 2 else b).add(v)
+        a.merge(b)
+        for value, count in Counter(values).most_common(5):
+            self.assertGreaterEqual(a[value], count)
+        restored = TopK.from_dict(json.loads(json.dumps(a.to_dict())))
+        self.assertEqual(dict(a), dict(restored))
+
+    def test_tuple_values(self):
+        top = TopK(2)
+        for key in [(1, 'a'), (2, None), (1, 'a'), (3, 'c')]:
+            top.add(key)
+        self.assertEqual(2, top[(1, 'a')])
+        self.assertEqual(2, len(top))
+        restored = TopK.from_dict(json.loads(json.dumps(top.to_dict())), key=tuple)
+        self.assertEqual(dict(top), dict(restored))
+
+
+class TestKllSketch(TestCase):
+    def test_exact_while_small(self):
+        sketch = KllSketch()
+        for v in range(1, 101):
+            sketch.add(v)
+        self.assertEqual([1, 50, 90, 99, 100], sketch.quantiles([0, 0.5, 0.9, 0.99, 1]))
+        self.assertEqual(([50, 50], [1.0, 50.5, 100.0]), sketch.histogram(2))
+
+    def test_accuracy(self):
+        rng = Random(3)
+        values = [rng.gauss(10, 3) for _ in range(50000)]
+        sketch = KllSketch()
+        for v in values:
+            sketch.add(v)
+        self.assertLess(sum(len(l) for l in sketch.levels), 1000)
+        ordered = sorted(values)
+        for fraction in [0.1, 0.5, 0.9, 0.99]:
+            rank = bisect_left(ordered, sketch.quantile(fraction)) / len(values)
+            self.assertAlmostEqual(fraction, rank, delta=0.02)
+        self.assertEqual((min(values), max(values)), (sketch.min, sketch.max))
+        self.assertEqual(len(values), sum(sketch.histogram(7)[0]))
+
+    def test_merge_and_serialize(self):
+        rng = Random(4)
+        values = [rng.expovariate(0.1) for _ in range(20000)]
+        parts = [KllSketch(), KllSketch(), KllSketch()]
+        for i, v in enumerate(values):
+            parts[i % 3].add(v)
+        merged = parts[0].merge(parts[1]).merge(parts[2])
+        self.assertEqual(len(values), merged.count)
+        ordered = sorted(values)
+        rank = bisect_left(ordered, merged.quantile(0.9)) / len(values)
+        self.assertAlmostEqual(0.9, rank, delta=0.02)
+        restored = KllSketch.from_dict(json.loads(json.dumps(merged.to_dict())))
+        self.assertEqual(merged.quantiles([0.5, 0.9]), restored.quantiles([0.5, 0.9]))
+
+    def test_empty(self):
+        self.assertEqual([None], KllSketch().quantiles([0.5]))
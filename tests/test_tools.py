@@ -1,6 +1,14 @@
+import gzip
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from unittest.mock import patch
 from unittest import TestCase
 
-from simpleais import parse
+from simpleais import parse, sentences_from_source
+from simpleais.maps import Bucketer, DensityMap
 from simpleais.tools import *
 
 
@@ -218,6 +226,42 @@ class TestDensityMap(TestCase):
         ], m.to_text())
 
 
+    def test_bounds_match_fitted(self):
+        points = [(-118.4680 + i * 0.0001, 33.7419 - (i % 5) * 0.0001) for i in range(9)]
+        fitted = DensityMap(4, height_scale=1)
+        bounded = DensityMap(4, height_scale=1, bounds=(-118.4680, 33.7415, -118.4672, 33.7419))
+        for p in points:
+            fitted.add(p)
+            bounded.add(p)
+        self.assertListEqual(fitted.to_text(), bounded.to_text())
+
+    def test_bounds_ignore_outside(self):
+        m = DensityMap(3, height_scale=1, bounds=(-1, -1, 1, 1))
+        m.add((0, 0))
+        m.add((5, 5))
+        m.mark((-1, 1))
+        m.mark((5, 5))
+        self.assertListEqual([
+            '+---+',
+            '|*  |',
+            '| 9 |',
+            '|   |',
+            '+---+',
+        ], m.to_text())
+
+    def test_add_all(self):
+        m = DensityMap(3, height_scale=1)
+        m.add((0, 0))
+        m.add_all([1, 1, 0], [1, 1, 1])
+        self.assertListEqual([
+            '+---+',
+            '|4 9|',
+            '|   |',
+            '|4  |',
+            '+---+',
+        ], m.to_text())
+
+
 class TestBucketer(TestCase):
     def test_basics(self):
         b = Bucketer(0, 1, 10)
@@ -319,6 +363,11 @@ class TestTaster(TestCase):
         self.assertFalse(taster.likes(self.type_5))
         self.assertFalse(taster.likes(self.type_17))
 
+    def test_value_none_matches_missing_fields(self):
+        taster = Taster(value=[('shipname', 'None')])
+        self.assertTrue(taster.likes(self.type_1_sf))
+        self.assertFalse(taster.likes(self.type_5))
+
     def test_packets_without_locations_are_rejected_when_filtering_for_location(self):
         taster = Taster(lat=(0, 90))
         self.assertFalse(taster.likes(self.type_5))
@@ -356,13 +405,35 @@ class TestTaster(TestCase):
         self.assertFalse(taster.likes(self.type_1_la))
         self.assertTrue(taster.likes(self.type_1_sf))
 
+    def test_expression(self):
+        taster = Taster(expression="type = 1 and lat between 32 and 35")
+        self.assertTrue(taster.likes(self.type_1_la))
+        self.assertFalse(taster.likes(self.type_1_sf))
+
+        taster = Taster(sentence_type=[5], mode='or', expression="lat between 32 and 35")
+        self.assertTrue(taster.likes(self.type_1_la))
+        self.assertTrue(taster.likes(self.type_5))
+        self.assertFalse(taster.likes(self.type_1_sf))
+
+    def test_grep_expression(self):
+        runner = CliRunner()
+        result = runner.invoke(grep, ['-e', 'type = 5 and shiptype = 70', 'tests/sample.ais'])
+        self.assertEqual(0, result.exit_code, result.output)
+        sentences = parse(result.output.splitlines())
+        self.assertTrue(sentences)
+        self.assertTrue(all(s.type_id() == 5 and int(s['shiptype']) == 70 for s in sentences))
+
+        result = runner.invoke(grep, ['-e', 'speeed > 3', 'tests/sample.ais'])
+        self.assertNotEqual(0, result.exit_code)
+        self.assertIn("unknown field 'speeed'", result.output)
+
 
 from click.testing import CliRunner
 
 
 class CommandLineSmokeTest(TestCase):
-    commands = {cat, grep, as_text, burst, info, dump, stat}
-    required_args = {stat: ['-f', 'type']}
+    commands = {cat, grep, as_text, burst, info, dump, stat, to_json, to_csv}
+    required_args = {stat: ['-f', 'type'], to_csv: ['-f', 'mmsi']}
 
     def test_handles_empty(self):
         for c in self.commands:
@@ -387,6 +458,323 @@ class CommandLineSmokeTest(TestCase):
             return [file]
 
 
+class TestBurst(TestCase):
+    lines = ["1452468552.938 !AIVDM,1,1,,B,14Wtnn002SGLde:BbrBmdTLF0Vql,0*6E\n",
+             "1452468553.938 !AIVDM,1,1,,A,15Mw0GP01SG?W>PE`laU<TJj0L20,0*67\n",
+             "1452468554.938 !AIVDM,1,1,,B,14Wtnn002SGLde:BbrBmdTLF0Vql,0*6E\n"]
+
+    def test_splits_by_sender(self):
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            with open('example.ais', 'w') as f:
+                f.writelines(self.lines)
+            result = runner.invoke(burst, ['--max-open', '1', 'example.ais'])
+            self.assertEqual(0, result.exit_code, result.output)
+            with open('example-310327000.ais') as f:
+                self.assertEqual([self.lines[0], self.lines[2]], f.readlines())
+            with open('example-366985310.ais') as f:
+                self.assertEqual([self.lines[1]], f.readlines())
+
+    def test_gzip(self):
+        import gzip
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            with open('example.ais', 'w') as f:
+                f.writelines(self.lines)
+            result = runner.invoke(burst, ['--gzip', 'example.ais'])
+            self.assertEqual(0, result.exit_code, result.output)
+            with gzip.open('example-310327000.ais.gz', 'rt') as f:
+                self.assertEqual([self.lines[0], self.lines[2]], f.readlines())
+
+
+    def test_partitioned(self):
+        runner = CliRunner()
+        with runner.isolated_filesystem():
+            with open('example.ais', 'w') as f:
+                f.writelines(self.lines)
+            result = runner.invoke(burst, ['-p', 'day', '-p', 'type', 'example.ais', 'example.ais', 'out'])
+            self.assertEqual(0, result.exit_code, result.output)
+            with open('out/day=2016-01-10/type=1/310327000.ais') as f:
+                self.assertEqual(2 * [self.lines[0], self.lines[2]], f.readlines())
+            with open('out/manifest.json') as f:
+                self.assertEqual(['day', 'type'], json.load(f)['partitions'])
+
+    def test_partitioned_needs_destination(self):
+        result = CliRunner().invoke(burst, ['-p', 'day', 'example.ais'])
+        self.assertNotEqual(0, result.exit_code)
+
+
+class TestDelimited(TestCase):
+    def test_csv(self):
+        result = CliRunner().invoke(to_csv, ['-f', 'mmsi,speed', '-f', 'status', 'tests/sample.ais'])
+        self.assertEqual(0, result.exit_code, result.output)
+        lines = result.output.splitlines()
+        self.assertEqual(['mmsi,speed,status', '310327000,16.3,0'], lines[:2])
+        self.assertEqual(len(list(sentences_from_source('tests/sample.ais'))) + 1, len(lines))
+
+    def test_tsv_with_default(self):
+        result = CliRunner().invoke(to_csv, ['-t', '--no-header', '-f', 'type,speed', '--default', 'speed', 'x',
+                                             'tests/sample.ais'])
+        self.assertEqual(0, result.exit_code, result.output)
+        self.assertIn('5\tx', result.output.splitlines())
+
+    def test_unknown_fields(self):
+        runner = CliRunner()
+        for command, args in ((to_csv, ['-f', 'mmsi,sped']), (to_json, ['-f', 'mmsi,sped']),
+                              (to_csv, ['-f', 'mmsi', '--default', 'sped', '0'])):
+            result = runner.invoke(command, args + ['tests/sample.ais'])
+            self.assertEqual(2, result.exit_code, result.output)
+            self.assertIn('unknown field sped', result.output)
+
+    def test_safety_text(self):
+        result = CliRunner().invoke(to_csv, ['-f', 'type,safety_text,text'],
+                                    input='!AIVDM,1,1,,A,<1mg=5CcNJ;485<<?PG?B<4,0*52\n')
+        self.assertEqual(0, result.exit_code, result.output)
+        self.assertEqual(['type,safety_text,text', '12,HELLO WORLD,"!AIVDM,1,1,,A,<1mg=5CcNJ;485<<?PG?B<4,0*52"'],
+                         result.output.splitlines())
+        result = CliRunner().invoke(to_json, ['-f', 'safety_text'], input='!AIVDM,1,1,,A,>5?Per18=HB1U:1@E=B0m<L,2*51\n')
+        self.assertEqual({'safety_text': 'RCVD YR TEST MSG'}, json.loads(result.output))
+
+    def test_stat_tsv(self):
+        result = CliRunner().invoke(stat, ['-f', 'type', '--tsv', 'tests/sample.ais'])
+        self.assertEqual(['type\tcount', '1\t6836'], result.output.splitlines()[:2])
+        result = CliRunner().invoke(stat, ['-n', 'speed', '-f', 'type', '--tsv', 'tests/sample.ais'])
+        self.assertEqual('type\tcount\tmin\tp50\tp90\tp99\tmax', result.output.splitlines()[0])
+        self.assertEqual(['1', '6836', '0.0'], result.output.splitlines()[1].split('\t')[:3])
+
+
+class TestInfoMap(TestCase):
+    def test_second_pass_matches(self):
+        runner = CliRunner()
+        one_pass = runner.invoke(info, ['-m', 'tests/sample.ais'])
+        with patch('simpleais.tools.MAP_POINT_LIMIT', 10):
+            two_pass = runner.invoke(info, ['-m', 'tests/sample.ais'])
+        self.assertEqual(0, two_pass.exit_code)
+        self.assertIn('+-----', one_pass.output)
+        self.assertEqual(one_pass.output, two_pass.output)
+
+
+class TestMerging(TestCase):
+    def setUp(self):
+        self.sentences = list(sentences_from_source('tests/sample.ais'))
+        self.half = len(self.sentences) // 2
+
+    def filled(self, cls, sentences, *args):
+        result = cls(*args)
+        for sentence in sentences:
+            result.add(sentence)
+        return result
+
+    def test_sentences_info(self):
+        whole = self.filled(SentencesInfo, self.sentences, True)
+        merged = self.filled(SentencesInfo, self.sentences[:self.half], True)
+        merged.merge(self.filled(SentencesInfo, self.sentences[self.half:], True))
+        restored = SentencesInfo.from_dict(json.loads(json.dumps(merged.to_dict())))
+        for result in merged, restored:
+            self.assertEqual(whole.sentence_count, result.sentence_count)
+            self.assertEqual(whole.type_counts, result.type_counts)
+            self.assertEqual(whole.sender_counts, result.sender_counts)
+            self.assertEqual((whole.time_range.min, whole.time_range.max),
+                             (result.time_range.min, result.time_range.max))
+
+    def test_sender_info(self):
+        type_5 = [s for s in self.sentences if s.type_id() == 5]
+        whole = self.filled(SenderInfo, type_5)
+        merged = self.filled(SenderInfo, type_5[:3]).merge(self.filled(SenderInfo, type_5[3:]))
+        restored = SenderInfo.from_dict(json.loads(json.dumps(merged.to_dict())))
+        for result in merged, restored:
+            self.assertEqual(whole.sentence_count, result.sentence_count)
+            self.assertEqual(dict(whole.type_counts), dict(result.type_counts))
+            self.assertEqual(dict(whole.fields.values), dict(result.fields.values))
+
+    def test_geo_info(self):
+        first = GeoInfo()
+        first.add((-122.4775, 37.8108))
+        second = GeoInfo()
+        second.add((-122.4321, 37.8065))
+        empty = GeoInfo()
+        first.merge(second).merge(empty)
+        self.assertEqual((-122.4775, -122.4321, 37.8065, 37.8108),
+                         (first.lon.min, first.lon.max, first.lat.min, first.lat.max))
+        self.assertFalse(GeoInfo.from_dict(empty.to_dict()).valid())
+        self.assertEqual(first.to_dict(), GeoInfo.from_dict(first.to_dict()).to_dict())
+
+    def test_value_counts(self):
+        counts = ValueCounts()
+        counts.add((1, 'a'))
+        other = ValueCounts()
+        other.add((2, 'b'))
+        other.add((1, 'a'))
+        counts.merge(other)
+        self.assertEqual([((1, 'a'), 2), ((2, 'b'), 1)], list(counts.items()))
+        self.assertEqual(counts, ValueCounts.from_dict(json.loads(json.dumps(counts.to_dict()))))
+
+
+class TestJobs(TestCase):
+    def run_split(self, command, args):
+        runner = CliRunner()
+        with open('tests/sample.ais') as f:
+            lines = f.readlines()
+        with runner.isolated_filesystem():
+            names = []
+            for i in range(3):
+                names.append('part{}.ais'.format(i))
+                with open(names[-1], 'w') as f:
+                    f.writelines(lines[i::3])
+            serial = runner.invoke(command, args + names)
+            parallel = runner.invoke(command, args + ['--jobs', '2'] + names)
+        self.assertEqual(0, parallel.exit_code, parallel.output)
+        self.assertEqual(serial.output, parallel.output)
+
+    def test_info(self):
+        self.run_split(info, ['-i', '-t', '-m', '-p', '-122.4', '37.8'])
+
+    def test_stat(self):
+        self.run_split(stat, ['-f', 'type', '--hour'])
+
+
+class TestApproximate(TestCase):
+    def test_info(self):
+        result = CliRunner().invoke(info, ['--approximate', 'tests/sample.ais'])
+        self.assertEqual(0, result.exit_code)
+        exact = CliRunner().invoke(info, ['tests/sample.ais'])
+        exact_senders = int(exact.output.split()[1])
+        self.assertAlmostEqual(exact_senders, int(result.output.split()[2]), delta=exact_senders * 0.03)
+        self.assertEqual(exact.output.splitlines()[1:], result.output.splitlines()[1:])
+
+    def test_stat(self):
+        exact = CliRunner().invoke(stat, ['-f', 'type', 'tests/sample.ais'])
+        result = CliRunner().invoke(stat, ['-f', 'type', '--approximate', '--top', '3', 'tests/sample.ais'])
+        self.assertEqual(0, result.exit_code)
+        self.assertEqual([l.split() for l in exact.output.splitlines()[:3]],
+                         [l.split() for l in result.stdout.splitlines()])
+
+
+class TestNumericStat(TestCase):
+    def test_speed(self):
+        result = CliRunner().invoke(stat, ['--numeric', 'speed', '-f', 'type', 'tests/sample.ais'])
+        self.assertEqual(0, result.exit_code)
+        lines = result.output.splitlines()
+        self.assertEqual(['count', 'min', 'p50', 'p90', 'p99', 'max'], lines[0].split())
+        speeds = [s['speed'] for s in sentences_from_source('tests/sample.ais') if s.type_id() == 18]
+        speeds = [s for s in speeds if s is not None]
+        row = [l.split() for l in lines if l.startswith('18 ')][0]
+        self.assertEqual([str(len(speeds)), "{:.2f}".format(min(speeds)), "{:.2f}".format(max(speeds))],
+                         [row[1], row[2], row[6]])
+
+    def test_interval_histogram(self):
+        result = CliRunner().invoke(stat, ['-n', 'time-interval', '--hist', '--bins', '4', 'tests/sample.ais'])
+        self.assertEqual(0, result.exit_code)
+        self.assertEqual(4, len(result.output.splitlines()))
+
+    def test_intervals_across_sources_with_jobs(self):
+        with open('tests/sample.ais') as f:
+            lines = f.readlines()
+        runner = CliRunner()
+        with tempfile.TemporaryDirectory() as directory:
+            names = []
+            for i in range(3):
+                names.append(os.path.join(directory, 'part{}.ais'.format(i)))
+                with open(names[-1], 'w') as f:
+                    f.writelines(lines[i * len(lines) // 3:(i + 1) * len(lines) // 3])
+            outputs = [runner.invoke(stat, ['-n', 'time-interval', '--tsv', '-f', 'mmsi', '-j', jobs] + names).output
+                       for jobs in ('1', '2')]
+        rows = [[line.split('\t') for line in output.splitlines()] for output in outputs]
+        self.assertGreater(len(rows[0]), 100)
+        for one, two in zip(*rows):
+            # quantiles are approximate once a group has more values than the sketch keeps
+            if one[0] == 'mmsi' or int(one[1]) < 200:
+                self.assertEqual(one, two)
+            else:
+                self.assertEqual(one[:3] + one[-1:], two[:3] + two[-1:])
+        self.assertEqual(len(rows[0]), len(rows[1]))
+
+    def test_merge(self):
+        stats = summarize_numbers(['tests/sample.ais'], 'speed', ('type',))
+        other = NumericStats.from_dict(json.loads(json.dumps(stats.to_dict())))
+        stats.merge(other)
+        self.assertEqual(2 * other.sketches[(1,)].count, stats.sketches[(1,)].count)
+
+
+class TestTextFormatter(TestCase):
+    def test_same_as_text_for(self):
+        for raw in (False, True):
+            formatter = TextFormatter(raw)
+            expected = [text_for(s, raw) for s in sentences_from_source('tests/sample.ais')]
+            self.assertEqual(expected, [formatter.format(s) for s in sentences_from_source('tests/sample.ais')])
+
+    def test_types_without_usual_fields(self):
+        formatter = TextFormatter()
+        for line in ('!AIVDM,1,1,,B,402M45iv0c?NN0dST0TPK@7008Aq,0*7F',  # base station
+                     '!AIVDM,1,1,,A,KCQ9r=hrFUnH7P00,0*41',  # long range
+                     '!AIVDM,1,1,,A,75gR`rBPLlNtuiugkkAiQ<3bw0,4*52'):  # binary acknowledge
+            self.assertEqual(text_for(parse(line)), formatter.format(parse(line)))
+
+    def test_as_text(self):
+        result = CliRunner().invoke(as_text, ['tests/sample.ais'])
+        expected = [text_for(s) for s in sentences_from_source('tests/sample.ais')]
+        self.assertEqual(expected, result.output.splitlines())
+
+
+class TestBufferedOutput(TestCase):
+    def test_time_kept_as_written(self):
+        sentence = parse('1452468552.938 !AIVDM,1,1,,B,14Wtnn002SGLde:BbrBmdTLF0Vql,0*6E')
+        self.assertEqual('1452468552.938', sentence.time_text)
+        self.assertEqual('1452468552.938 !AIVDM,1,1,,B,14Wtnn002SGLde:BbrBmdTLF0Vql,0*6E\n',
+                         sentence_source_text(sentence))
+
+    def test_time_reformatted_when_needed(self):
+        for written, printed in (('1452468552.9', '1452468552.900'), ('01452468552.938', '1452468552.938'),
+                                 ('1452468552.93812', '1452468552.938'), ('1452468552', '1452468552.000')):
+            sentence = parse(written + ' !AIVDM,1,1,,B,14Wtnn002SGLde:BbrBmdTLF0Vql,0*6E')
+            self.assertEqual(printed, sentence_source_text(sentence).split()[0])
+
+    def test_flush_interval_choice(self):
+        self.assertIsNone(choose_flush_interval(None, ['tests/sample.ais']))
+        self.assertEqual(FLUSH_INTERVAL, choose_flush_interval(None, ['localhost:5000']))
+        self.assertEqual(2.0, choose_flush_interval(2.0, ['tests/sample.ais']))
+        self.assertIsNone(choose_flush_interval(0, ['localhost:5000']))
+
+    def test_stdin_pipe_is_live(self):
+        read_end, write_end = os.pipe()
+        os.close(write_end)
+        with open(read_end) as pipe, patch('sys.stdin', pipe):
+            self.assertTrue(reads_live(()))
+        with open('tests/sample.ais') as f, patch('sys.stdin', f):
+            self.assertFalse(reads_live(()))
+
+    def test_cat_output_unchanged(self):
+        expected = "".join("{:.3f} {}\n".format(s.time, line)
+                           for s in sentences_from_source('tests/sample.ais') for line in s.text)
+        for args in ([], ['--flush-interval', '0.01']):
+            result = CliRunner().invoke(cat, args + ['tests/sample.ais'])
+            self.assertEqual(0, result.exit_code, result.output)
+            self.assertEqual(expected, result.output)
+
+    def test_capture(self):
+        runner = CliRunner()
+        expected = runner.invoke(cat, ['tests/sample.ais']).output
+        with tempfile.TemporaryDirectory() as directory:
+            result = runner.invoke(cat, ['--capture', directory, '--max-size', '1', '--gzip', 'tests/sample.ais'])
+            self.assertEqual(0, result.exit_code, result.output)
+            self.assertEqual('', result.output)
+            names = os.listdir(directory)
+            self.assertEqual(1, len(names))
+            self.assertTrue(names[0].endswith('.ais.gz'))
+            with gzip.open(os.path.join(directory, names[0]), 'rt') as f:
+                self.assertEqual(expected, f.read())
+
+    def test_stops_quietly_when_reader_goes_away(self):
+        code = "from simpleais.tools import cat; cat(['tests/sample.ais'])"
+        process = subprocess.Popen([sys.executable, '-c', code], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                   cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        process.stdout.readline()
+        process.stdout.close()
+        self.assertEqual(b'', process.stderr.read())
+        self.assertEqual(0, process.wait())
+        process.stderr.close()
+
+
 class TestRefineFilter(TestCase):
 
     def test_angle_difference(self):
@@ -400,3 +788,60 @@ class TestRefineFilter(TestCase):
         self.assertEqual(45, filter._angle_difference(45, 0))
         self.assertEqual(45, filter._angle_difference(359, 44))
         self.assertEqual(45, filter._angle_difference(44, 359))
+
+    def test_thresholds_can_be_overridden(self):
+        class Patient(RefineFilter):
+            BORING_SECONDS = 60
+
+        self.assertEqual(4 * 3600, RefineFilter.BORING_SECONDS)
+        self.assertEqual(60, Patient().BORING_SECONDS)
+        first = parse("1452468552 !AIVDM,1,1,,B,14Wtnn002SGLde:BbrBmdTLF0Vql,0*6E")
+        later = parse("1452468652 !AIVDM,1,1,,B,14Wtnn002SGLde:BbrBmdTLF0Vql,0*6E")
+        for filter_class, wanted in ((RefineFilter, False), (Patient, True)):
+            filter = filter_class()
+            self.assertTrue(filter.wants(first))
+            filter.mark(first)
+            self.assertEqual(wanted, filter.wants(later))
+
+
+class TestReplay(TestCase):
+    def test_timed_lines(self):
+        lines = ["1452468552.938 !AIVDM,1,1,,B,14Wtnn002SGLde:BbrBmdTLF0Vql,0*6E\n",
+                 "!AIVDM,1,1,,B,14Wtnn002SGLde:BbrBmdTLF0Vql,0*6E\n",
+                 "1452468553.5\t!AIVDM,1,1,,B,14Wtnn002SGLde:BbrBmdTLF0Vql,0*6E\r\n"]
+        self.assertEqual([1452468552.938, 1452468552.938, 1452468553.5], [t for t, l in timed_lines(lines)])
+        self.assertEqual(lines[0].strip(), list(timed_lines(lines))[0][1])
+
+    def test_udp_replay(self):
+        import socket
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as receiver:
+            receiver.bind(('127.0.0.1', 0))
+            receiver.settimeout(5)
+            runner = CliRunner()
+            with runner.isolated_filesystem():
+                with open('example.ais', 'w') as f:
+                    f.write("1452468552.938 !AIVDM,1,1,,B,14Wtnn002SGLde:BbrBmdTLF0Vql,0*6E\n")
+                    f.write("1452468553.938 !AIVDM,1,1,,A,15Mw0GP01SG?W>PE`laU<TJj0L20,0*67\n")
+                address = "127.0.0.1:{}".format(receiver.getsockname()[1])
+                result = runner.invoke(replay, ['--udp', address, '--speed', '100', 'example.ais'])
+                self.assertEqual(0, result.exit_code, result.output)
+            received = b''
+            while received.count(b'\n') < 2:
+                received += receiver.recv(4096)
+            self.assertEqual(2, len(parse(received.decode('ascii').splitlines())))
+
+    def test_needs_destination(self):
+        result = CliRunner().invoke(replay, ['/dev/null'])
+        self.assertNotEqual(0, result.exit_code)
+
+
+class TestStartup(TestCase):
+    def test_tools_import_little(self):
+        # the tools are run many times a day from scripts, so startup matters
+        code = ("import sys, simpleais.tools; "
+                "print(' '.join(m for m in ('numpy', 'logging', 'dateutil', 'concurrent.futures') if m in sys.modules)); "
+                "print(dict.__len__(simpleais.MESSAGE_DECODERS))")
+        output = subprocess.run([sys.executable, '-c', code], stdout=subprocess.PIPE, check=True,
+                                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                universal_newlines=True).stdout
+        self.assertEqual(['', '0'], output.split('\n')[:2])
@@ -0,0 +1,111 @@
+from unittest import TestCase
+
+import numpy
+
+from simpleais import parse, sentences_from_source
+from simpleais.encoder import encode_lines
+from simpleais.tracks import Track, TrackBuilder, _PointBuffer, build_tracks, douglas_peucker, decimate, stream_tracks
+
+
+def positions(mmsi, points, start=1000.0, interval=10.0):
+    lines = []
+    for i, (lon, lat) in enumerate(points):
+        for line in encode_lines(1, {'mmsi': mmsi, 'lon': lon, 'lat': lat, 'speed': 10.0, 'course': 45.0}):
+            lines.append("{} {}".format(start + i * interval, line))
+    return parse(lines)
+
+
+def straight_line(count):
+    return [(-122.0 + i * 0.001, 37.0 + i * 0.001) for i in range(count)]
+
+
+class TestSimplification(TestCase):
+    def test_douglas_peucker_straight_line(self):
+        lon = numpy.linspace(0, 1, 50)
+        lat = numpy.linspace(0, 1, 50)
+        self.assertEqual([0, 49], list(numpy.flatnonzero(douglas_peucker(lon, lat, 1.0))))
+
+    def test_douglas_peucker_keeps_corner(self):
+        lon = numpy.array([0, 0.5, 1.0, 1.0, 1.0])
+        lat = numpy.array([0, 0, 0, 0.5, 1.0])
+        self.assertEqual([0, 2, 4], list(numpy.flatnonzero(douglas_peucker(lon, lat, 10.0))))
+
+    def test_douglas_peucker_small(self):
+        self.assertEqual([], list(douglas_peucker(numpy.array([]), numpy.array([]), 1.0)))
+        self.assertEqual([True], list(douglas_peucker(numpy.array([1.0]), numpy.array([1.0]), 1.0)))
+
+    def test_decimate_by_time(self):
+        time = numpy.arange(0, 100, 10.0)
+        lon = lat = numpy.zeros(10)
+        self.assertEqual([0, 3, 6, 9], list(numpy.flatnonzero(decimate(time, lon, lat, min_interval=30))))
+
+    def test_decimate_by_distance(self):
+        time = numpy.arange(0, 10, 1.0)
+        lon = numpy.zeros(10)
+        lat = numpy.arange(10) * 0.0001  # about 11 m apart
+        self.assertEqual([0, 5, 9], list(numpy.flatnonzero(decimate(time, lon, lat, min_distance=50))))
+
+
+class TestTrackBuilding(TestCase):
+    def test_track_growth(self):
+        track = Track('000000001', capacity=1)
+        for i in range(100):
+            track.append((float(i), 1.0, 2.0, 3.0, 4.0))
+        self.assertEqual(100, len(track))
+        self.assertEqual(list(range(100)), track.time.tolist())
+        self.assertEqual((99.0, 1.0, 2.0, 3.0, 4.0), track.last())
+
+    def test_build_tracks(self):
+        sentences = positions(1, straight_line(5)) + positions(2, straight_line(3))
+        tracks = build_tracks(reversed(sentences))
+        self.assertEqual(['000000001', '000000002'], sorted(tracks))
+        track = tracks['000000001']
+        self.assertEqual(5, len(track))
+        self.assertEqual([1000.0, 1010.0, 1020.0, 1030.0, 1040.0], track.time.tolist())
+        self.assertEqual(-122.0, track.lon[0])
+        self.assertEqual(10.0, track.speed[0])
+
+    def test_point_buffer_across_chunks(self):
+        points = [(float(i), i + 0.5, -i, 1.0, 2.0) for i in range(11)]
+        buffer = _PointBuffer(chunk_points=2)
+        for i, point in enumerate(points):
+            buffer.add(i % 3, point)
+        mmsis, columns = buffer.finish()
+        self.assertEqual([i % 3 for i in range(11)], mmsis.tolist())
+        self.assertEqual(points, [tuple(row) for row in columns.T.tolist()])
+
+    def test_build_tracks_simplified(self):
+        tracks = build_tracks(positions(1, straight_line(20)), tolerance=5.0)
+        self.assertEqual(2, len(tracks['000000001']))
+
+    def test_builder_matches_bulk(self):
+        sentences = list(sentences_from_source('tests/sample.ais'))
+        bulk = build_tracks(sentences, sort=False)
+        builder = TrackBuilder()
+        for sentence in sentences:
+            builder.add(sentence)
+        streamed = {t.mmsi: t for t in builder.flush()}
+        self.assertEqual(sorted(bulk), sorted(streamed))
+        for mmsi, track in bulk.items():
+            self.assertEqual(track.lon.tolist(), streamed[mmsi].lon.tolist())
+
+    def test_streaming_decimation_keeps_last_point(self):
+        builder = TrackBuilder(min_interval=25)
+        for sentence in positions(1, straight_line(10)):
+            builder.add(sentence)
+        track = builder.flush()[0]
+        self.assertEqual([1000.0, 1030.0, 1060.0, 1090.0], track.time.tolist())
+
+    def test_streaming_bounded(self):
+        zigzag = [(-122.0 + i * 0.01, 37.0 + (i % 2) * 0.01) for i in range(100)]
+        segments = list(stream_tracks(positions(1, zigzag), max_points=10))
+        self.assertTrue(all(len(s) <= 10 for s in segments))
+        self.assertEqual(100 + len(segments) - 1, sum(len(s) for s in segments))
+        for before, after in zip(segments, segments[1:]):
+            self.assertEqual(before.last(), (after.time[0], after.lon[0], after.lat[0], after.speed[0],
+                                             after.course[0]))
+
+    def test_streaming_simplifies_before_splitting(self):
+        segments = list(stream_tracks(positions(1, straight_line(100)), max_points=10, tolerance=5.0))
+        self.assertEqual(1, len(segments))
+        self.assertEqual(2, len(segments[0]))